@@ -1,74 +1,127 @@
-from modules.database import Database
+from modules.app.database_pool import DatabasePool
+from modules.app.orchestrator import run_plugins
+from modules.app.identify import process_identify_jobs
+import sys
 from rich.pretty import pprint
-from modules.plugins import plugins, service_ids
-from modules.settings import settings
+from modules.app.plugins import plugins, plugins_settings, service_ids
+from modules.app.settings import settings
+from modules.utils.cache import close as close_cache, dump_stats, store as api_cache
 
 class Plugin_wrapper:
     def __init__(self):
-        self.db = Database(service_ids, "library.db")
+        self.db = DatabasePool(
+            service_ids,
+            settings["database"]["path"],
+            profile=settings["database"]["profile"],
+            pragmas=settings["database"]["pragmas"],
+        )
+        # 0 means no timeout
+        self.plugin_timeout = settings["main"].get("plugin_timeout", 0) or None
+        self.delta_sync = settings["main"].get("delta_sync", True)
 
     def ping(self):
         for plugin in plugins:
             plugin.ping()
 
-    def pull_songs(self):
-        
+    def pull(self, plugin, kind):
+        """
+        Stream a plugin's songs or playlists into the db,
+        plugins without the streaming api are written in one go.
+        The api cache (debug.api_cache) keeps whole pulls, while it is on
+        the cached pull_{kind} is used instead of streaming.
+        In delta sync the plugin gets the checkpoints of its last sync,
+        they are only saved once everything is written so a failed sync is retried in full.
 
-        print("pull_songs")
-        for plugin in plugins:
-            all_songs.extend(plugin.pull_songs())
+        Args:
+            plugin: the plugin
+            kind (str): "songs" or "playlists"
+
+        Returns:
+            int: number of rows written
+        """
+        if api_cache.enabled or not hasattr(plugin, f"iter_{kind}"):
+            return self.db.consume(f"insert_{kind}", [getattr(plugin, f"pull_{kind}")()])
 
-        print("saving to db..")
-        self.db.insert_songs(all_songs)
+        checkpoints = None
+        if self.delta_sync:
+            checkpoints = self.db.reader().fetch_checkpoints(plugin.SERVICE_ID)
+        pages = getattr(plugin, f"iter_{kind}")(checkpoints=checkpoints)
+        count = self.db.consume(f"insert_{kind}", pages)
+        if checkpoints is not None:
+            self.db.write("save_checkpoints", plugin.SERVICE_ID, checkpoints)
+        return count
+
+    def pull_songs(self):
+        print("pull_songs")
+        # Every plugin pulls at the same time, each page is saved by the db writer as soon as it arrives
+        run_plugins(
+            plugins,
+            lambda plugin: self.pull(plugin, "songs"),
+            on_result=lambda plugin, count: print(f"{plugin.SERVICE_ID}: {count} songs saved"),
+            timeout=self.plugin_timeout,
+        )
 
     def pull_playlists(self):
         print("pull_playlists")
-        all_playlists = []
-        for plugin in plugins:
-            all_playlists.extend(plugin.pull_playlists())
-
-        print("saving to db..")
-        self.db.insert_playlists(all_playlists)
+        run_plugins(
+            plugins,
+            lambda plugin: self.pull(plugin, "playlists"),
+            on_result=lambda plugin, count: print(f"{plugin.SERVICE_ID}: {count} playlists saved"),
+            timeout=self.plugin_timeout,
+        )
 
     def identify_songs(self):
         print("identify_songs")
-        result = []
-        for plugin in plugins :
-            unidentified_songs = self.db.fetch_unidentified_songs(plugin.SERVICE_ID)
-            
-            # For every unidentified song, identifie using the plugin's method 
-            newly_identified_songs = []
-            
-            
-            counter = 0
-            print(len(unidentified_songs))
-            
-            
-            
-            for song in unidentified_songs:
-                identified_song = plugin.identify_song(song)
-                if identified_song:
-                    newly_identified_songs.append(identified_song)
-                    
-                    
-                counter += 1
-                print(f"{counter}/{len(unidentified_songs)}")
-
-
-            if newly_identified_songs:
-                result.extend(newly_identified_songs)
-        print("saving to db..")
-
-        self.db.insert_songs(result)
+        for plugin in plugins:
+            # Every song to identify is a job in the db, the outcome of each one is saved as it goes
+            # so a restart resumes where it stopped and failed lookups wait before being retried.
+            # Jobs left running by a run that crashed are claimed again once their lease expired,
+            # jobs claimed by other live workers are left to them
+            constants = plugins_settings[plugin]
+            totals = process_identify_jobs(
+                self.db,
+                plugin.SERVICE_ID,
+                plugin.identify_song,
+                workers=getattr(constants, "IDENTIFY_WORKERS", 1),
+                rate=getattr(constants, "RATE_LIMIT", None),
+                burst=getattr(constants, "RATE_BURST", 1),
+            )
+            print(f"{plugin.SERVICE_ID}: {totals}")
+            print(f"{plugin.SERVICE_ID}: {self.db.reader().count_identify_jobs(plugin.SERVICE_ID)}")
 
     def identify_playlists(self):
         pass
 
+    def find_duplicates(self):
+        """
+        Print the songs of the library that look like the same song under several rows
+        """
+        self.db.write("refresh_match_keys")
+        db = self.db.reader()
+        for cluster in db.iter_duplicates():
+            songs = db.fetch_songs(cluster["song_ids"])
+            print(f'{cluster["score"]:.2f}  ' + " | ".join(f"{song_id}: {artist_name} - {title}" for song_id, title, artist_name in songs))
+
+    def search(self, query, limit=20):
+        """
+        Print the songs of the library matching query, best matches first
+        """
+        db = self.db.reader()
+        for song_id, title, artist_name in db.fetch_songs(db.search(query, limit)):
+            print(f"{song_id:>8}  {artist_name} - {title}")
+
 
 app = Plugin_wrapper()
-app.pull_songs()
-#app.pull_playlists()
-app.identify_songs()
-print(app.db.find_duplicates("artists","name", "id"))
+# python app.py search <words>
+if len(sys.argv) > 2 and sys.argv[1] == "search":
+    app.search(" ".join(sys.argv[2:]))
+else:
+    app.pull_songs()
+    #app.pull_playlists()
+    app.identify_songs()
+    app.find_duplicates()
+app.db.close()
+dump_stats()
+close_cache()
 #app.ping()
 
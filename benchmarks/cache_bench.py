@@ -0,0 +1,103 @@
+"""
+Size and load time of a cached api response for every cache serializer.
+
+Run from the root of the project:
+    python -m benchmarks.cache_bench --tracks 100000
+
+The response looks like the pages of a YouTube Music library pull, the baseline is
+the pretty printed json file the cache used to write per call.
+Load time is the time to read the entry back from the cache database and decode it.
+
+Measured with 100000 tracks on CPython 3.11 (the generated tracks repeat a lot,
+so compression ratios are better than on real responses):
+    json file (indent=4)   68.4 MB                load 1.31s
+    json+none              41.6 MB  dump 0.86s  load 1.27s
+    json+zlib               1.2 MB  dump 0.96s  load 0.98s
+    json+lzma               0.6 MB  dump 7.09s  load 1.19s
+    pickle+none            25.7 MB  dump 0.66s  load 1.06s
+    pickle+zlib             1.2 MB  dump 0.79s  load 0.83s
+    pickle+lzma             0.3 MB  dump 6.07s  load 0.71s
+pickle+zlib is the default, lzma is only worth it when disk space matters more than pulls.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from modules.utils.cache_store import CacheStore
+from modules.utils.serializers import COMPRESSIONS, FORMATS, Serializer, msgpack
+
+
+def make_response(count):
+    return [
+        {
+            "videoId": f"video{i:011d}",
+            "title": f"Song title number {i} (Official Video)",
+            "artists": [{"name": f"Artist {i // 10}", "id": f"UC{i // 10:022d}"}],
+            "album": {"name": f"Album {i // 12}", "id": f"MPREb_{i // 12:011d}"},
+            "duration": "3:25",
+            "duration_seconds": 205,
+            "isAvailable": True,
+            "isExplicit": i % 7 == 0,
+            "thumbnails": [
+                {"url": f"https://i.ytimg.com/vi/video{i:011d}/sddefault.jpg", "width": 400, "height": 225}
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_json_file(response, folder):
+    path = os.path.join(folder, "response.json")
+    with open(path, "w") as f:
+        json.dump(response, f, indent=4)
+
+    def load():
+        with open(path) as f:
+            return json.load(f)
+
+    _, load_time = timed(load)
+    return os.path.getsize(path), load_time
+
+
+def bench_store(response, serializer, folder):
+    store = CacheStore(os.path.join(folder, f"{serializer.name}.db"), serializer=serializer)
+    _, dump_time = timed(store.set, "bench", "key", response)
+    store.close()
+    store = CacheStore(os.path.join(folder, f"{serializer.name}.db"), serializer=serializer)
+    (found, _), load_time = timed(store.get, "bench", "key")
+    assert found
+    store.close()
+    return store._bytes, dump_time, load_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=100000)
+    args = parser.parse_args()
+
+    response = make_response(args.tracks)
+    with tempfile.TemporaryDirectory() as folder:
+        size, load_time = bench_json_file(response, folder)
+        print(f"{'json file (indent=4)':<22} {size / 1e6:7.1f} MB          load {load_time:.3f}s")
+        for format in FORMATS:
+            if format == "msgpack" and msgpack is None:
+                print("msgpack isn't installed, skipped")
+                continue
+            for compression in COMPRESSIONS:
+                serializer = Serializer(format, compression)
+                size, dump_time, load_time = bench_store(response, serializer, folder)
+                print(
+                    f"{serializer.name:<22} {size / 1e6:7.1f} MB  dump {dump_time:.3f}s  load {load_time:.3f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Insert and fetch throughput of library.db under every connection profile.
+
+Run from the root of the project:
+    python -m benchmarks.database_bench --songs 20000
+
+Songs are inserted in batches with a commit after each batch like a pull does,
+then every song is looked up by its service id.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from modules.app.database import Database, PROFILES
+
+
+def make_songs(count):
+    return [
+        {
+            "service_id": "spotify",
+            "artist_id": f"aidspotify{i // 10}",
+            "artist_name": f"na{i // 10}",
+            "song_id": f"sidspotify{i}",
+            "song_title": f"ti{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def run(profile, songs, batch_size, folder):
+    path = os.path.join(folder, f"{profile}.db")
+    db = Database(["spotify"], path, profile=profile)
+
+    start = time.perf_counter()
+    for i in range(0, len(songs), batch_size):
+        db.insert_songs(songs[i : i + batch_size], bulk=False)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for song in songs:
+        db.cur.execute(
+            "SELECT song_id FROM songs_source_info WHERE service_id = ? AND service_song_id = ?",
+            (song["service_id"], song["song_id"]),
+        )
+        db.cur.fetchone()
+    fetch_time = time.perf_counter() - start
+    db.con.close()
+    return insert_time, fetch_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    songs = make_songs(args.songs)
+    with tempfile.TemporaryDirectory() as folder:
+        for profile in PROFILES:
+            insert_time, fetch_time = run(profile, songs, args.batch_size, folder)
+            print(
+                f"{profile:<12} insert: {len(songs) / insert_time:>8.0f} songs/s"
+                f"   fetch: {len(songs) / fetch_time:>8.0f} songs/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
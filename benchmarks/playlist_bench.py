@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the Playlist intersection against the old nested loop version.
+
+Run from the root of the project:
+    python -m benchmarks.playlist_bench --size 10000
+
+The nested loop is quadratic, it is only timed up to --naive-size songs and
+extrapolated for bigger playlists.
+"""
+import argparse
+import time
+
+from modules.data.Playlist import Playlist
+from modules.data.Song import Song
+from modules.data.SongRef import SongRef
+
+
+def make_playlist(service_id, size, shared_service_id=None):
+    """
+    Build a playlist of size songs, half of them sharing a ref with the other playlist
+    """
+    songs = []
+    for i in range(size):
+        song_refs = {
+            service_id: SongRef(
+                artist_id=f"aid{service_id}{i}",
+                artist_name=f"na{i}",
+                song_id=f"sid{service_id}{i}",
+                song_title=f"ti{i}",
+                date_added="2024-03-18",
+                song_metadata={},
+            )
+        }
+        if shared_service_id and i % 2 == 0:
+            song_refs[shared_service_id] = SongRef(
+                artist_id=f"aid{shared_service_id}{i}",
+                artist_name=f"na{i}",
+                song_id=f"sid{shared_service_id}{i}",
+                song_title=f"ti{i}",
+                date_added="2024-03-18",
+                song_metadata={},
+            )
+        songs.append(Song(service_id=service_id, song_refs=song_refs))
+    return Playlist(service_id=service_id, songs=songs, playlist_refs={})
+
+
+def naive_add(songs, song):
+    """Playlist.add as it was before the ref index, every song of the list is compared with __eq__"""
+    matching_indices = [i for i, existing_song in enumerate(songs) if song == existing_song]
+    if not matching_indices:
+        songs.append(song)
+        return
+    smallest_index = matching_indices.pop(0)
+    songs[smallest_index].merge(song)
+    for index in reversed(matching_indices):
+        songs[smallest_index].merge(songs[index])
+        del songs[index]
+
+
+def naive_intersection(playlist_a, playlist_b):
+    """The intersection as it was done before the hash join, O(n·m) pairs then O(n²) adds"""
+    songs = []
+    for song_a in playlist_a:
+        for song_b in playlist_b:
+            if song_a == song_b:
+                naive_add(songs, song_a.copy())
+                naive_add(songs, song_b.copy())
+    return songs
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--naive-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    playlist_a = make_playlist("spotify", args.size)
+    playlist_b = make_playlist("youtube", args.size, shared_service_id="spotify")
+    result, hash_time = timed(playlist_a.__and__, playlist_b)
+    print(f"hash join   {args.size}x{args.size}: {hash_time:.3f}s ({len(result)} songs)")
+
+    naive_size = min(args.size, args.naive_size)
+    small_a = make_playlist("spotify", naive_size)
+    small_b = make_playlist("youtube", naive_size, shared_service_id="spotify")
+    naive_result, naive_time = timed(naive_intersection, small_a, small_b)
+    naive_estimate = naive_time * (args.size / naive_size) ** 2
+    print(f"nested loop {naive_size}x{naive_size}: {naive_time:.3f}s ({len(naive_result)} songs)")
+    print(f"nested loop {args.size}x{args.size}: ~{naive_estimate:.1f}s (extrapolated)")
+    print(f"speedup: ~{naive_estimate / hash_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Playlist ingestion into library.db, bulk path against one insert_song per track.
+
+Run from the root of the project:
+    python -m benchmarks.playlist_ingest_bench --playlists 500 --tracks 200
+
+Tracks are drawn from a library of 20000 songs so playlists share songs like a real library.
+The per track path is what insert_playlist did before: insert_song then one row per track,
+its time is extrapolated when run on fewer --naive-playlists.
+
+Measured with 500 playlists of 200 tracks on CPython 3.11, performance profile:
+    bulk insert        1.73s
+    bulk same again    0.59s  (nothing written to playlist_songs)
+    bulk 5% edited     0.09s  (3 writes per edited playlist: 1 delete, 2 inserts)
+    per track insert   2.28s
+    per track again    1.57s
+About half of the first insert in both paths is the songs_fts trigger indexing the 18k new songs.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from modules.app.database import Database
+
+
+def make_song(i):
+    return {
+        "service_id": "spotify",
+        "artist_id": f"aidspotify{i // 10}",
+        "artist_name": f"na{i // 10}",
+        "song_id": f"sidspotify{i}",
+        "song_title": f"ti{i}",
+    }
+
+
+def make_playlists(count, tracks, library_size, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "service_id": "spotify",
+            "playlist_id": f"pidspotify{p}",
+            "playlist_name": f"playlist {p}",
+            "songs": [make_song(rng.randrange(library_size)) for _ in range(tracks)],
+        }
+        for p in range(count)
+    ]
+
+
+def edit(playlists, share, seed=1):
+    """Remove a track and add two at the end of a share of the playlists, like a delta sync"""
+    rng = random.Random(seed)
+    edited = []
+    for playlist in playlists[: int(len(playlists) * share)]:
+        songs = list(playlist["songs"])
+        del songs[rng.randrange(len(songs))]
+        songs += [make_song(rng.randrange(20000)), make_song(rng.randrange(20000))]
+        edited.append({**playlist, "songs": songs})
+    return edited
+
+
+def insert_playlists_per_track(db, playlists):
+    for playlist in playlists:
+        playlist_id = db.insert_playlist_ref(playlist)
+        # Without a diff the old contents are replaced as a whole
+        db.cur.execute("DELETE FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+        for position, song in enumerate(playlist["songs"]):
+            song_id = db.insert_song(song)
+            db.cur.execute(
+                "INSERT INTO playlist_songs(playlist_id, position, song_id) VALUES (?, ?, ?)",
+                (playlist_id, position, song_id),
+            )
+    db.con.commit()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--playlists", type=int, default=500)
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--naive-playlists", type=int, default=500)
+    args = parser.parse_args()
+
+    playlists = make_playlists(args.playlists, args.tracks, 20000)
+    rows = args.playlists * args.tracks
+    with tempfile.TemporaryDirectory() as folder:
+        db = Database(["spotify"], os.path.join(folder, "bulk.db"), profile="performance")
+        bulk_time = timed(db.insert_playlists, playlists)
+        print(f"bulk insert        {args.playlists}x{args.tracks}: {bulk_time:.2f}s ({rows / bulk_time:.0f} tracks/s)")
+        same_time = timed(db.insert_playlists, playlists)
+        print(f"bulk same again    {args.playlists}x{args.tracks}: {same_time:.2f}s")
+        edited = edit(playlists, 0.05)
+        edit_time = timed(db.insert_playlists, edited)
+        print(f"bulk 5% edited     {len(edited)}x~{args.tracks}: {edit_time:.2f}s")
+        db.con.close()
+
+        naive_count = min(args.naive_playlists, args.playlists)
+        scale = args.playlists / naive_count
+        db = Database(["spotify"], os.path.join(folder, "naive.db"), profile="performance")
+        naive_time = timed(insert_playlists_per_track, db, playlists[:naive_count]) * scale
+        naive_same_time = timed(insert_playlists_per_track, db, playlists[:naive_count]) * scale
+        print(f"per track insert   {args.playlists}x{args.tracks}: {naive_time:.2f}s")
+        print(f"per track again    {args.playlists}x{args.tracks}: {naive_same_time:.2f}s")
+        if naive_count < args.playlists:
+            print(f"(per track times extrapolated from {naive_count} playlists)")
+        db.con.close()
+
+
+if __name__ == "__main__":
+    main()
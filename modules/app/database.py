@@ -1,16 +1,586 @@
+import re
 import sqlite3
+import time
+from difflib import SequenceMatcher
+from urllib.parse import quote
 from rich.pretty import pprint
+from modules.utils.disjoint_set import DisjointSet
+from modules.utils.matching import artist_key, normalise, song_similarity
+
+# Lookups done for every inserted row, each one must be able to use an index
+SELECT_ARTIST_BY_SERVICE_ID = """
+    SELECT artist_id
+    FROM artists_source_info
+    WHERE service_id = (?)
+    AND service_artist_id = (?)
+"""
+SELECT_ARTIST_HOMONYM = """
+    SELECT artist_id
+    FROM artists_source_info
+    WHERE service_id = (?)
+    AND service_artist_name = (?)
+    AND NOT service_artist_id = (?)
+"""
+SELECT_ARTIST_BY_NAME = "SELECT id FROM artists WHERE name = ?"
+SELECT_SONG_BY_SERVICE_ID = """
+    SELECT song_id
+    FROM songs_source_info
+    WHERE service_id = (?)
+    AND service_song_id = (?)
+"""
+SELECT_SONG_BY_TITLE = "SELECT id FROM songs WHERE title=? and artist_id=?"
+SELECT_PLAYLIST_BY_SERVICE_ID = """
+    SELECT playlist_id
+    FROM playlists_source_info
+    WHERE service_id = (?)
+    AND service_playlist_id = (?)
+"""
+SELECT_PLAYLIST_BY_NAME = "SELECT id FROM playlists WHERE name=?"
+# Every song linked to a service, with the ids of the song and its artist on it
+SELECT_SERVICE_REFS = """
+    SELECT songs.id, songs.title, artists.name,
+    artists_source_info.service_artist_id, artists_source_info.service_artist_name,
+    songs_source_info.service_song_id, songs_source_info.service_song_title
+    FROM songs
+    JOIN artists ON artists.id = songs.artist_id
+    JOIN songs_source_info
+    ON songs_source_info.song_id = songs.id AND songs_source_info.service_id = ?
+    JOIN artists_source_info
+    ON artists_source_info.artist_id = artists.id AND artists_source_info.service_id = ?
+"""
+# Songs to identify on a service with what is known of their artist there, filtered by the caller
+SELECT_SONGS_TO_IDENTIFY = """
+    SELECT songs.id, songs.title, artists.name,
+    artists_source_info.service_artist_id, artists_source_info.service_artist_name
+    FROM songs
+    JOIN artists ON artists.id = songs.artist_id
+    LEFT JOIN artists_source_info
+    ON artists_source_info.artist_id = artists.id
+    AND artists_source_info.service_id = ?
+"""
+# True when songs.id has a ref on the service given as parameter
+SONG_IS_IDENTIFIED = """
+    EXISTS (
+        SELECT 1 FROM songs_source_info
+        WHERE songs_source_info.service_id = ?
+        AND songs_source_info.song_id = songs.id
+        AND songs_source_info.service_song_title IS NOT NULL
+    )
+"""
+# One page of the songs without a ref on a service, after a song id
+SELECT_UNIDENTIFIED_SONGS = f"""
+    {SELECT_SONGS_TO_IDENTIFY}
+    WHERE songs.id > ? AND NOT {SONG_IS_IDENTIFIED}
+    ORDER BY songs.id
+    LIMIT ?
+"""
+
+HOT_QUERIES = {
+    "artist_by_service_id": SELECT_ARTIST_BY_SERVICE_ID,
+    "artist_homonym": SELECT_ARTIST_HOMONYM,
+    "artist_by_name": SELECT_ARTIST_BY_NAME,
+    "song_by_service_id": SELECT_SONG_BY_SERVICE_ID,
+    "song_by_title": SELECT_SONG_BY_TITLE,
+    "playlist_by_service_id": SELECT_PLAYLIST_BY_SERVICE_ID,
+    "playlist_by_name": SELECT_PLAYLIST_BY_NAME,
+}
+
+
+# Distance between the positions of two consecutive playlist_songs written together,
+# leaves room to insert or move tracks between them without renumbering the playlist
+POSITION_GAP = 1024
+
+
+def rebuild_playlist_songs(cur):
+    """
+    Give playlist_songs a position column and make (playlist_id, position) its primary key,
+    the songs of a playlist keep the order they were inserted in with POSITION_GAP between them.
+    Does nothing if already done.
+
+    Args:
+        cur (sqlite3.Cursor): cursor of the migrated database
+    """
+    cur.execute("PRAGMA table_info(playlist_songs)")
+    if "position" in (row[1] for row in cur.fetchall()):
+        return
+    cur.execute(
+        """
+        CREATE TABLE playlist_songs_ordered (
+            playlist_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            song_id INTEGER NOT NULL,
+            PRIMARY KEY (playlist_id, position),
+            FOREIGN KEY (playlist_id) REFERENCES playlists (id),
+            FOREIGN KEY (song_id) REFERENCES songs (id)
+        )
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO playlist_songs_ordered(playlist_id, position, song_id)
+        SELECT playlist_id, (ROW_NUMBER() OVER (PARTITION BY playlist_id ORDER BY rowid) - 1) * ?, song_id
+        FROM playlist_songs
+        """,
+        (POSITION_GAP,),
+    )
+    cur.execute("DROP TABLE playlist_songs")
+    cur.execute("ALTER TABLE playlist_songs_ordered RENAME TO playlist_songs")
+
+
+def add_column(cur, table, column, definition):
+    """
+    ALTER TABLE ADD COLUMN that does nothing if the column already exists, for use in MIGRATIONS
+
+    Args:
+        cur (sqlite3.Cursor): cursor of the migrated database
+        table (str): table name
+        column (str): new column name
+        definition (str): type and constraints of the column
+    """
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in (row[1] for row in cur.fetchall()):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Schema changes applied on top of create_tables, which is the version 0 schema and must not change.
+# MIGRATIONS[i] upgrades user_version i to i + 1, a step is either an sql statement or a function
+# called with the cursor. Steps must be idempotent (IF NOT EXISTS, add_column...)
+# and are only ever appended to the end of the list.
+MIGRATIONS = [
+    # 1: indexes for the lookups of insert_artist, insert_song and insert_playlist
+    [
+        "CREATE INDEX IF NOT EXISTS artists_name ON artists(name)",
+        """
+        CREATE INDEX IF NOT EXISTS artists_source_info_service_name
+        ON artists_source_info(service_id, service_artist_name)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS songs_source_info_service_song_id
+        ON songs_source_info(service_id, service_song_id)
+        """,
+        "CREATE INDEX IF NOT EXISTS playlists_name ON playlists(name)",
+        """
+        CREATE INDEX IF NOT EXISTS playlists_source_info_service_playlist_id
+        ON playlists_source_info(service_id, service_playlist_id)
+        """,
+    ],
+    # 2: high-water marks of the last sync, scope is "liked_songs" or "playlist:<service_playlist_id>"
+    [
+        """
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            service_id TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            added_at TEXT,
+            snapshot_id TEXT,
+            track_count INTEGER,
+            last_item_id TEXT,
+            PRIMARY KEY (service_id, scope),
+            FOREIGN KEY (service_id) REFERENCES services(id)
+        )
+        """,
+    ],
+    # 3: full text search over song titles, artist names and playlist names, rowid is songs.id / playlists.id
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts
+        USING fts5(title, artist_name, tokenize = "unicode61 remove_diacritics 2")
+        """,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS playlists_fts
+        USING fts5(name, tokenize = "unicode61 remove_diacritics 2")
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+            INSERT INTO songs_fts(rowid, title, artist_name)
+            VALUES (new.id, new.title, (SELECT name FROM artists WHERE id = new.artist_id));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title, artist_id ON songs BEGIN
+            DELETE FROM songs_fts WHERE rowid = old.id;
+            INSERT INTO songs_fts(rowid, title, artist_name)
+            VALUES (new.id, new.title, (SELECT name FROM artists WHERE id = new.artist_id));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+            DELETE FROM songs_fts WHERE rowid = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS songs_fts_artist_update AFTER UPDATE OF name ON artists BEGIN
+            UPDATE songs_fts SET artist_name = new.name
+            WHERE rowid IN (SELECT id FROM songs WHERE artist_id = new.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS playlists_fts_insert AFTER INSERT ON playlists BEGIN
+            INSERT INTO playlists_fts(rowid, name) VALUES (new.id, new.name);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS playlists_fts_update AFTER UPDATE OF name ON playlists BEGIN
+            UPDATE playlists_fts SET name = new.name WHERE rowid = new.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS playlists_fts_delete AFTER DELETE ON playlists BEGIN
+            DELETE FROM playlists_fts WHERE rowid = old.id;
+        END
+        """,
+        # Rows inserted before this version
+        """
+        INSERT INTO songs_fts(rowid, title, artist_name)
+        SELECT songs.id, songs.title, artists.name
+        FROM songs LEFT JOIN artists ON artists.id = songs.artist_id
+        WHERE songs.id NOT IN (SELECT rowid FROM songs_fts)
+        """,
+        """
+        INSERT INTO playlists_fts(rowid, name)
+        SELECT id, name FROM playlists
+        WHERE id NOT IN (SELECT rowid FROM playlists_fts)
+        """,
+    ],
+    # 4: normalised artist and title of every song for duplicate detection, see modules.utils.matching.
+    # The keys are computed in python by refresh_match_keys, the triggers only drop the stale ones
+    [
+        """
+        CREATE TABLE IF NOT EXISTS song_match_keys (
+            song_id INTEGER PRIMARY KEY,
+            artist_key TEXT NOT NULL,
+            title_key TEXT NOT NULL,
+            FOREIGN KEY (song_id) REFERENCES songs(id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS song_match_keys_key
+        ON song_match_keys(artist_key, title_key)
+        """,
+        # refs of a song, its primary key starts with service_id
+        "CREATE INDEX IF NOT EXISTS songs_source_info_song_id ON songs_source_info(song_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS song_match_keys_song_update AFTER UPDATE OF title, artist_id ON songs BEGIN
+            DELETE FROM song_match_keys WHERE song_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS song_match_keys_song_delete AFTER DELETE ON songs BEGIN
+            DELETE FROM song_match_keys WHERE song_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS song_match_keys_artist_update AFTER UPDATE OF name ON artists BEGIN
+            DELETE FROM song_match_keys WHERE song_id IN (SELECT id FROM songs WHERE artist_id = new.id);
+        END
+        """,
+    ],
+    # 5: identification work queue, one job per song and service.
+    # status is pending, running, done, not_found or failed, times are unix timestamps
+    [
+        """
+        CREATE TABLE IF NOT EXISTS identify_jobs (
+            service_id TEXT NOT NULL,
+            song_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            claimed_at REAL,
+            PRIMARY KEY (service_id, song_id),
+            FOREIGN KEY (service_id) REFERENCES services(id),
+            FOREIGN KEY (song_id) REFERENCES songs(id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS identify_jobs_ready
+        ON identify_jobs(service_id, status, next_attempt_at)
+        """,
+    ],
+    # 6: ordered playlists that can hold a song twice, see rebuild_playlist_songs
+    [
+        rebuild_playlist_songs,
+        "CREATE INDEX IF NOT EXISTS playlist_songs_song_id ON playlist_songs(song_id)",
+    ],
+]
+
+# Statuses of identify_jobs that can be claimed once next_attempt_at is reached
+RETRYABLE_JOB_STATUSES = ("pending", "not_found", "failed")
+
+
+def fts_query(text):
+    """
+    FTS5 MATCH expression matching any word of a free text query, so quotes,
+    dashes or brackets in a title can't be read as FTS5 syntax
+
+    Args:
+        text (str): free text like "Artist - Title (Live)"
+
+    Returns:
+        str: quoted words joined by OR, empty if text has no words
+    """
+    words = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+
+
+# PRAGMA values applied when opening the connection, see the [database] section of settings.toml
+PROFILES = {
+    # sqlite defaults, rollback journal and a full fsync on every commit
+    "default": {},
+    # readers don't block the writer, fewer fsyncs, bigger page cache and memory mapped reads
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 2**20,
+        "cache_size": -64 * 2**10,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def song_key(data):
+    """
+    Every field of a song dictionary that insert_song reads, two songs with the same key get the same song id
+    """
+    return (
+        data["service_id"],
+        data["artist_id"],
+        data["artist_name"],
+        data["song_id"],
+        data["song_title"],
+        data.get("db_song_id"),
+    )
+
+
+def song_to_identify(service_id, row):
+    """
+    Song dictionary handed to a plugin's identify_song from a SELECT_SONGS_TO_IDENTIFY row
+    """
+    song_id, title, artist_name, service_artist_id, service_artist_name = row
+    return {
+        "service_id": service_id,
+        "artist_id": service_artist_id,
+        "artist_name": service_artist_name,
+        "input_artist_name": artist_name,
+        "song_id": None,
+        "song_title": None,
+        "input_song_title": title,
+        "db_song_id": song_id,
+    }
+
+
+def cluster_duplicates(key, songs):
+    """
+    Split a group of songs with the same match keys in clusters of duplicates,
+    most similar pairs first, without ever joining songs that a service knows as different
+
+    Args:
+        key (tuple): (artist_key, title_key) of the group
+        songs (dict): {song_id: (title, artist_name, {service_id: service_song_id})}
+
+    Returns:
+        list: clusters, see Database.iter_duplicates
+    """
+    song_ids = sorted(songs)
+    pairs = []
+    for a, song_a in enumerate(song_ids):
+        title_a, artist_a, refs_a = songs[song_a]
+        for b in range(a + 1, len(song_ids)):
+            title_b, artist_b, refs_b = songs[song_ids[b]]
+            if any(refs_a[service] == refs_b[service] for service in refs_a.keys() & refs_b.keys()):
+                score = 1.0
+            else:
+                score = song_similarity(title_a, artist_a, title_b, artist_b)
+            pairs.append((score, a, b))
+    pairs.sort(key=lambda pair: pair[0], reverse=True)
+
+    components = DisjointSet(len(song_ids))
+    # {root: ({service_id: service_song_id}, lowest score that joined the cluster)}
+    clusters = {a: (songs[song_id][2], 1.0) for a, song_id in enumerate(song_ids)}
+    for score, a, b in pairs:
+        root_a, root_b = components.find(a), components.find(b)
+        if root_a == root_b:
+            continue
+        refs_a, score_a = clusters[root_a]
+        refs_b, score_b = clusters[root_b]
+        if any(refs_a[service] != refs_b[service] for service in refs_a.keys() & refs_b.keys()):
+            continue
+        root = components.union(root_a, root_b)
+        clusters[root] = ({**refs_a, **refs_b}, min(score_a, score_b, score))
+
+    return [
+        {
+            "artist_key": key[0],
+            "title_key": key[1],
+            "song_ids": [song_ids[a] for a in group],
+            "score": clusters[components.find(group[0])][1],
+        }
+        for group in components.groups()
+        if len(group) > 1
+    ]
+
+
+def _free_positions(count, low, high, occupied):
+    """
+    count increasing positions strictly between low and high, evenly spread and not in occupied
+
+    Returns:
+        list: the positions, None if there isn't room for them
+    """
+    step = (high - low) // (count + 1)
+    positions = []
+    for i in range(1, count + 1):
+        position = max(low + step * i, positions[-1] + 1 if positions else low + 1)
+        while position in occupied:
+            position += 1
+        if position >= high:
+            return None
+        positions.append(position)
+    return positions
+
+
+def plan_playlist_edit(rows, song_ids):
+    """
+    Writes turning the rows of a playlist into song_ids. The edit script comes from
+    difflib.SequenceMatcher, so only the tracks around a change are written:
+    a track removed is deleted, a track found somewhere else is moved, a track replaced
+    by another one is updated and the rest is inserted. Tracks that didn't change keep
+    their position, the ones written take free positions between their neighbours'.
+
+    Args:
+        rows (list): (position, song_id) of the playlist, ordered by position
+        song_ids (list): the new ordered db song ids
+
+    Returns:
+        tuple: (deleted positions, [(position, new position, song_id)] to update, [(position, song_id)] to insert),
+            None if there is no free position left between two neighbours
+    """
+    positions = [row[0] for row in rows]
+    current = [row[1] for row in rows]
+    if current == song_ids:
+        return [], [], []
+    # For every new index, the old index of the row reused for it, None for a new row
+    sources = [None] * len(song_ids)
+    kept = set()
+    blocks = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, current, song_ids, autojunk=False).get_opcodes():
+        if tag == "equal":
+            sources[j1:j2] = range(i1, i2)
+            kept.update(range(j1, j2))
+        else:
+            blocks.append((list(range(i1, i2)), list(range(j1, j2))))
+
+    # A removed row with the song of an added one is a move
+    removed_by_song = {}
+    for removed, _ in blocks:
+        for i in removed:
+            removed_by_song.setdefault(current[i], []).append(i)
+    reused = set()
+    for _, added in blocks:
+        for j in added:
+            candidates = removed_by_song.get(song_ids[j])
+            if candidates:
+                sources[j] = candidates.pop(0)
+                reused.add(sources[j])
+    # What is left of a replaced block is updated in place
+    for removed, added in blocks:
+        left = [i for i in removed if i not in reused]
+        for i, j in zip(left, [j for j in added if sources[j] is None]):
+            sources[j] = i
+            reused.add(i)
+
+    occupied = set(positions)
+    new_positions = [positions[sources[j]] if j in kept else None for j in range(len(song_ids))]
+    j = 0
+    while j < len(song_ids):
+        if j in kept:
+            j += 1
+            continue
+        end = j
+        while end < len(song_ids) and end not in kept:
+            end += 1
+        low = new_positions[j - 1] if j > 0 else None
+        high = new_positions[end] if end < len(song_ids) else None
+        old = [positions[sources[k]] if sources[k] is not None else None for k in range(j, end)]
+        if None not in old and old == sorted(old) and all(
+            (low is None or position > low) and (high is None or position < high) for position in old
+        ):
+            # Tracks replaced one for one keep their positions
+            run = old
+        else:
+            count = end - j
+            if low is None and high is None:
+                low = -POSITION_GAP
+            if low is None:
+                low = high - (count + 1) * POSITION_GAP
+            if high is None:
+                high = low + (count + 1) * POSITION_GAP
+            run = _free_positions(count, low, high, occupied)
+            if run is None:
+                return None
+        new_positions[j:end] = run
+        j = end
+
+    updated = []
+    inserted = []
+    for j, source in enumerate(sources):
+        if source is None:
+            inserted.append((new_positions[j], song_ids[j]))
+        elif j not in kept and (positions[source], current[source]) != (new_positions[j], song_ids[j]):
+            updated.append((positions[source], new_positions[j], song_ids[j]))
+    kept_rows = {sources[j] for j in kept}
+    deleted = [positions[i] for i in range(len(rows)) if i not in reused and i not in kept_rows]
+    return deleted, updated, inserted
 
 
 class Database:
-    def __init__(self, services, db_name=":memory:"):
-        self.con = sqlite3.connect(db_name)
+    def __init__(
+        self,
+        services,
+        db_name=":memory:",
+        profile="default",
+        pragmas=None,
+        read_only=False,
+        check_same_thread=True,
+    ):
+        """
+        Args:
+            services (list): a list of service_id
+            db_name (str, optional): path to the database file. Defaults to ":memory:".
+            profile (str, optional): name of the PROFILES entry to apply. Defaults to "default".
+            pragmas (dict, optional): PRAGMA values applied on top of the profile
+            read_only (bool, optional): open an existing database without creating or migrating anything. Defaults to False.
+            check_same_thread (bool, optional): passed to sqlite3.connect. Defaults to True.
+        """
+        if read_only:
+            self.con = sqlite3.connect(
+                f"file:{quote(db_name)}?mode=ro", uri=True, check_same_thread=check_same_thread
+            )
+        else:
+            self.con = sqlite3.connect(db_name, check_same_thread=check_same_thread)
         self.cur = self.con.cursor()
+        self.apply_pragmas({**PROFILES[profile], **(pragmas or {})})
+        if read_only:
+            return
         self.create_tables()
+        self.migrate()
         self.init_services(services)
         self.cur.execute("PRAGMA foreign_keys = ON;")
     def execute(self, query):
         self.cur.execute(query)
+
+    def apply_pragmas(self, pragmas):
+        """
+        Set connection PRAGMAs like journal_mode or cache_size
+
+        Args:
+            pragmas (dict): {pragma_name: value}
+        """
+        for name, value in pragmas.items():
+            if not name.replace("_", "").isalnum() or not str(value).lstrip("-").isalnum():
+                raise ValueError(f"Invalid pragma {name} = {value}")
+            self.cur.execute(f"PRAGMA {name} = {value}")
+            self.cur.fetchall()
+
     def create_tables(self):
         self.cur.execute(
             """
@@ -112,7 +682,39 @@ class Database:
         self.con.commit()
 
 
-    
+    def migrate(self):
+        """
+        Upgrade the database in place by applying the MIGRATIONS it is missing.
+        PRAGMA user_version keeps track of the last one applied,
+        every pending step runs in a single transaction that is rolled back if one of them fails.
+
+        Raises:
+            ValueError: the database was created by a newer version
+        """
+        self.cur.execute("PRAGMA user_version")
+        version = self.cur.fetchone()[0]
+        if version > len(MIGRATIONS):
+            raise ValueError(
+                f"Database version {version} is newer than the supported version {len(MIGRATIONS)}"
+            )
+        if version == len(MIGRATIONS):
+            return
+
+        self.con.commit()
+        try:
+            self.cur.execute("BEGIN")
+            for next_version, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+                for step in steps:
+                    if callable(step):
+                        step(self.cur)
+                    else:
+                        self.cur.execute(step)
+                self.cur.execute(f"PRAGMA user_version = {next_version}")
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+
     def init_services(self, services):
         """
         services (list): a list of service_id
@@ -129,12 +731,7 @@ class Database:
     def insert_artist(self, data):
         # Tries first to find the artist_id directly using service_artist_id in artists_source_info
         self.cur.execute(
-            """
-            SELECT artist_id 
-            FROM artists_source_info 
-            WHERE service_id = (?) 
-            AND service_artist_id = (?)
-            """,
+            SELECT_ARTIST_BY_SERVICE_ID,
             (data["service_id"], data["artist_id"]),
         )
         artist_id_from_db = self.cur.fetchone()
@@ -144,13 +741,7 @@ class Database:
 
         # Tries to see if its an homonym using the service's id system
         self.cur.execute(
-            """
-            SELECT artist_id 
-            FROM artists_source_info 
-            WHERE service_id = (?) 
-            AND service_artist_name = (?)
-            AND NOT service_artist_id = (?)
-            """,
+            SELECT_ARTIST_HOMONYM,
             (data["service_id"], data["artist_name"], data["artist_id"]),
         )
         homonym_from_db = self.cur.fetchone()
@@ -165,9 +756,7 @@ class Database:
             artist_id = self.cur.lastrowid
         else:
             # Check if the artist is already in the db using its name
-            self.cur.execute(
-                "SELECT id FROM artists WHERE name = ?", (data["artist_name"],)
-            )
+            self.cur.execute(SELECT_ARTIST_BY_NAME, (data["artist_name"],))
 
             artist = self.cur.fetchone()
 
@@ -228,12 +817,7 @@ class Database:
         else:
             # Tries to find the song_id using service_song_id in songs_source_info
             self.cur.execute(
-                """
-                SELECT song_id 
-                FROM songs_source_info 
-                WHERE service_id = (?) 
-                AND service_song_id = (?)
-                """,
+                SELECT_SONG_BY_SERVICE_ID,
                 (data["service_id"], data["song_id"]),
             )
             song_id_from_db = self.cur.fetchone()
@@ -249,9 +833,7 @@ class Database:
                 )
                 # fetch the songid
                 self.cur.execute(
-                    """
-                    SELECT id FROM songs WHERE title=? and artist_id=?
-                    """,
+                    SELECT_SONG_BY_TITLE,
                     ((data["song_title"], artist_id)),
                 )
                 song_id = self.cur.fetchone()[0]
@@ -271,17 +853,276 @@ class Database:
                 )
         return song_id
 
-    def insert_songs(self, songs):
+    def insert_songs(self, songs, bulk=True):
+        """
+        Insert songs and commit
+
+        Args:
+            songs (list): list of song dictionaries
+            bulk (bool, optional): use insert_songs_bulk instead of insert_song for every song. Defaults to True.
+        """
         if songs:
-            for data in songs:
-                if data:
-                    self.insert_song(data)
+            if bulk:
+                self.insert_songs_bulk(songs)
+            else:
+                for data in songs:
+                    if data:
+                        self.insert_song(data)
         self.con.commit()
 
-    def insert_playlist(self, data):
+    def insert_songs_bulk(self, songs):
+        """
+        Same result as calling insert_song on every song, with a handful of queries for the whole list.
+        The songs are staged in a temp table, everything already in the db is fetched by joining on it,
+        the rules of insert_artist and insert_song are then replayed in order on these lookups
+        and the new rows are written with executemany. Does not commit.
+        A song of the list can reuse the artist or the song created for an earlier one, so the rules
+        can't be a single INSERT ... SELECT. New rows get a placeholder id while the rules are replayed,
+        their ids are assigned by sqlite on insert, see _inserted_ids.
+
+        Args:
+            songs (list): list of song dictionaries, empty entries are skipped
+
+        Returns:
+            list: the db song id of every song, None for skipped entries
+        """
+        rows = [
+            (
+                seq,
+                data["service_id"],
+                data["artist_id"],
+                data["artist_name"],
+                data["song_id"],
+                data["song_title"],
+                data.get("db_song_id"),
+            )
+            for seq, data in enumerate(songs)
+            if data
+        ]
+        song_ids = [None] * len(songs)
+        if not rows:
+            return song_ids
+
+        self.cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS staging_songs (
+                seq INTEGER PRIMARY KEY,
+                service_id TEXT,
+                artist_id TEXT,
+                artist_name TEXT,
+                song_id TEXT,
+                song_title TEXT,
+                db_song_id INTEGER
+            )
+            """
+        )
+        self.cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS staging_song_keys (
+                artist_id INTEGER,
+                title TEXT
+            )
+            """
+        )
+        self.cur.execute("DELETE FROM staging_songs")
+        self.cur.execute("DELETE FROM staging_song_keys")
+        self.cur.executemany(
+            "INSERT INTO staging_songs VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
         #
-        # 1 - Get a playlist_id
+        # ÉTAPE 1: Identifier les artistes
         #
+        self.cur.execute(
+            """
+            SELECT DISTINCT info.service_id, info.service_artist_id, info.artist_id
+            FROM artists_source_info AS info
+            JOIN staging_songs AS staging
+            ON info.service_id = staging.service_id
+            AND info.service_artist_id = staging.artist_id
+            """
+        )
+        artist_by_service_id = {
+            (service_id, service_artist_id): artist_id
+            for service_id, service_artist_id, artist_id in self.cur.fetchall()
+        }
+        self.cur.execute(
+            """
+            SELECT DISTINCT info.service_id, info.service_artist_name
+            FROM artists_source_info AS info
+            JOIN staging_songs AS staging
+            ON info.service_id = staging.service_id
+            AND info.service_artist_name = staging.artist_name
+            """
+        )
+        known_service_names = set(self.cur.fetchall())
+        self.cur.execute(
+            """
+            SELECT name, MIN(id) FROM artists
+            WHERE name IN (SELECT artist_name FROM staging_songs)
+            GROUP BY name
+            """
+        )
+        artist_by_name = dict(self.cur.fetchall())
+
+        new_artists = []
+        new_artists_source_info = []
+        row_artist_ids = []
+        for _, service_id, service_artist_id, artist_name, _, _, _ in rows:
+            artist_id = artist_by_service_id.get((service_id, service_artist_id))
+            if artist_id is None:
+                # Same rules as insert_artist: homonym on the service, then same name, then new artist
+                if (service_id, artist_name) in known_service_names:
+                    artist_id = None
+                else:
+                    artist_id = artist_by_name.get(artist_name)
+                if artist_id is None:
+                    # Placeholders are negative, -1 for the first new artist
+                    artist_id = -len(new_artists) - 1
+                    new_artists.append((artist_name, service_id))
+                    if artist_name is not None:
+                        artist_by_name.setdefault(artist_name, artist_id)
+                new_artists_source_info.append(
+                    (service_id, artist_id, service_artist_id, artist_name)
+                )
+                artist_by_service_id[(service_id, service_artist_id)] = artist_id
+                if artist_name is not None:
+                    known_service_names.add((service_id, artist_name))
+            row_artist_ids.append(artist_id)
+
+        #
+        # ÉTAPE 2: Identifier les musiques
+        #
+        self.cur.executemany(
+            "INSERT INTO staging_song_keys VALUES (?, ?)",
+            {(artist_id, row[5]) for artist_id, row in zip(row_artist_ids, rows)},
+        )
+        self.cur.execute(
+            """
+            SELECT songs.artist_id, songs.title, songs.id
+            FROM songs
+            JOIN staging_song_keys AS staging
+            ON songs.artist_id = staging.artist_id
+            AND songs.title = staging.title
+            """
+        )
+        song_by_key = {
+            (artist_id, title): song_id
+            for artist_id, title, song_id in self.cur.fetchall()
+        }
+        self.cur.execute(
+            """
+            SELECT info.service_id, info.service_song_id, info.song_id
+            FROM songs_source_info AS info
+            JOIN (SELECT DISTINCT service_id, song_id FROM staging_songs) AS staging
+            ON info.service_id = staging.service_id
+            AND info.service_song_id = staging.song_id
+            ORDER BY info.rowid
+            """
+        )
+        song_by_service_id = {}
+        for service_id, service_song_id, song_id in self.cur.fetchall():
+            song_by_service_id.setdefault((service_id, service_song_id), song_id)
+        # songs_source_info allows one service_song_id per (service_id, song_id)
+        self.cur.execute(
+            """
+            SELECT info.service_id, info.song_id
+            FROM songs_source_info AS info
+            WHERE info.song_id IN (
+                SELECT songs.id FROM songs
+                JOIN staging_song_keys AS staging
+                ON songs.artist_id = staging.artist_id
+                AND songs.title = staging.title
+                UNION
+                SELECT db_song_id FROM staging_songs
+            )
+            """
+        )
+        linked_songs = set(self.cur.fetchall())
+
+        new_songs = []
+        new_songs_source_info = []
+        for artist_id, row in zip(row_artist_ids, rows):
+            seq, service_id, _, _, service_song_id, song_title, db_song_id = row
+            if db_song_id:
+                song_id = db_song_id
+            else:
+                song_id = song_by_service_id.get((service_id, service_song_id))
+                if song_id is not None:
+                    song_ids[seq] = song_id
+                    continue
+                song_id = song_by_key.get((artist_id, song_title))
+                if song_id is None:
+                    song_id = -len(new_songs) - 1
+                    new_songs.append((song_title, artist_id, service_id))
+                    song_by_key[(artist_id, song_title)] = song_id
+            if (service_id, song_id) not in linked_songs:
+                linked_songs.add((service_id, song_id))
+                song_by_service_id.setdefault((service_id, service_song_id), song_id)
+                new_songs_source_info.append(
+                    (service_id, song_id, service_song_id, song_title)
+                )
+            song_ids[seq] = song_id
+
+        self.cur.executemany("INSERT INTO artists(name, source_id) VALUES (?, ?)", new_artists)
+        artist_ids = self._inserted_ids(len(new_artists))
+        self.cur.executemany(
+            """
+            INSERT OR IGNORE INTO artists_source_info(service_id, artist_id, service_artist_id, service_artist_name)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (service_id, artist_ids(artist_id), service_artist_id, artist_name)
+                for service_id, artist_id, service_artist_id, artist_name in new_artists_source_info
+            ),
+        )
+        self.cur.executemany(
+            "INSERT INTO songs(title, artist_id, source_id) VALUES (?, ?, ?)",
+            (
+                (song_title, artist_ids(artist_id), service_id)
+                for song_title, artist_id, service_id in new_songs
+            ),
+        )
+        new_song_ids = self._inserted_ids(len(new_songs))
+        self.cur.executemany(
+            """
+            INSERT OR IGNORE INTO songs_source_info(service_id, song_id, service_song_id, service_song_title)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (service_id, new_song_ids(song_id), service_song_id, song_title)
+                for service_id, song_id, service_song_id, song_title in new_songs_source_info
+            ),
+        )
+        return [None if song_id is None else new_song_ids(song_id) for song_id in song_ids]
+
+    def _inserted_ids(self, count):
+        """
+        Ids sqlite gave to the count rows the last executemany inserted, from last_insert_rowid.
+        The tables have no AUTOINCREMENT, a new rowid is the largest one plus one, and the
+        connection holds the write lock from its first insert until the commit, so no other
+        writer can take an id in between and the ids of the rows are consecutive.
+
+        Args:
+            count (int): number of rows inserted
+
+        Returns:
+            function: placeholder id of a new row (-1 for the first one) or an existing id -> db id
+        """
+        self.cur.execute("SELECT last_insert_rowid()")
+        first_id = self.cur.fetchone()[0] - count + 1
+        return lambda row_id: first_id - row_id - 1 if row_id < 0 else row_id
+
+    def insert_playlist_ref(self, data):
+        """
+        Find or create the playlist of a playlist dictionary and fill out playlists_source_info
+
+        Args:
+            data (dict): playlist dictionary with service_id, playlist_id, playlist_name and optionally db_playlist_id
+
+        Returns:
+            int: the db playlist id
+        """
         db_playlist_id = data.get("db_playlist_id")
         if db_playlist_id:
             playlist_id = db_playlist_id
@@ -300,12 +1141,7 @@ class Database:
             )
         else:
             self.cur.execute(
-                """
-                SELECT playlist_id 
-                FROM playlists_source_info 
-                WHERE service_id = (?) 
-                AND service_playlist_id = (?)
-                """,
+                SELECT_PLAYLIST_BY_SERVICE_ID,
                 (data["service_id"], data["playlist_id"]),
             )
             playlist_id_from_db = self.cur.fetchone()
@@ -321,9 +1157,7 @@ class Database:
                 )
                 # fetch the playlist_id
                 self.cur.execute(
-                    """
-                    SELECT id FROM playlists WHERE name=?
-                    """,
+                    SELECT_PLAYLIST_BY_NAME,
                     ((data["playlist_name"],)),
                 )
                 playlist_id = self.cur.fetchone()[0]
@@ -341,61 +1175,326 @@ class Database:
                         data["playlist_name"],
                     ),
                 )
+        return playlist_id
 
-        # 2 - Add the songs in playlist_songs by getting their id using insert_song
-        for song in data["songs"]:
-            # Use insert_song to insert the song if not already in the database
-            # This will insert the song and return its ID
-            song_id = self.insert_song(song)
-
-            # Insert the relationship between the playlist and song into playlist_songs
-            self.cur.execute(
-                "INSERT OR IGNORE INTO playlist_songs(playlist_id, song_id) VALUES (?, ?)",
-                (playlist_id, song_id),
-            )
+    def insert_playlist(self, data):
+        """
+        Insert one playlist, see insert_playlists. Does not commit.
 
+        Returns:
+            int: the db playlist id
+        """
+        playlist_id = self.insert_playlist_ref(data)
+        song_ids = self.insert_songs_bulk(data["songs"])
+        self.replace_playlist_songs(playlist_id, [song_id for song_id in song_ids if song_id])
+        return playlist_id
 
     def insert_playlists(self, playlists):
+        """
+        Insert playlists and commit. The tracks of every playlist are resolved to song ids
+        in a single insert_songs_bulk pass, then each playlist's contents are replaced with replace_playlist_songs.
+
+        Args:
+            playlists (list): playlist dictionaries with their ordered list of song dictionaries in "songs"
+        """
         if playlists:
+            playlist_ids = [self.insert_playlist_ref(playlist) for playlist in playlists]
+            # Playlists share a lot of songs, an identical song resolves to the same id
+            # so each one is only staged once
+            unique_songs = {}
             for playlist in playlists:
-                self.insert_playlist(playlist)
+                for song in playlist["songs"]:
+                    if song:
+                        unique_songs.setdefault(song_key(song), song)
+            song_ids = dict(
+                zip(unique_songs, self.insert_songs_bulk(list(unique_songs.values())))
+            )
+            for playlist_id, playlist in zip(playlist_ids, playlists):
+                self.replace_playlist_songs(
+                    playlist_id,
+                    [song_ids[song_key(song)] for song in playlist["songs"] if song],
+                )
         self.con.commit()
 
-    def fetch_unidentified_songs(self, service_id):
-        results = []
+    def replace_playlist_songs(self, playlist_id, song_ids):
+        """
+        Make the contents of a playlist song_ids, in this order, by only writing what changed,
+        see plan_playlist_edit. Removing, adding or moving a track is one write whatever its place.
+        When there is no free position left between two tracks the playlist is written again
+        with POSITION_GAP between its tracks. Does not commit.
+
+        Args:
+            playlist_id (int): the db playlist id
+            song_ids (list): ordered db song ids, a song can be there more than once
+
+        Returns:
+            dict: {"inserted": int, "updated": int, "moved": int, "deleted": int}
+        """
         self.cur.execute(
-            """
-            SELECT services.id, artists_source_info.service_artist_id , artists_source_info.service_artist_name, artists.name, songs_source_info.service_song_id, songs_source_info.service_song_title, songs.title, songs.id
-            FROM songs, services
-            JOIN artists ON songs.artist_id = artists.id
+            "SELECT position, song_id FROM playlist_songs WHERE playlist_id = ? ORDER BY position",
+            (playlist_id,),
+        )
+        rows = self.cur.fetchall()
+        plan = plan_playlist_edit(rows, song_ids)
+        if plan is None:
+            self.cur.execute("DELETE FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+            deleted = [row[0] for row in rows]
+            updated = []
+            inserted = [(index * POSITION_GAP, song_id) for index, song_id in enumerate(song_ids)]
+        else:
+            deleted, updated, inserted = plan
+            # Deleted first, the positions written are never held by another row after that
+            self.cur.executemany(
+                "DELETE FROM playlist_songs WHERE playlist_id = ? AND position = ?",
+                ((playlist_id, position) for position in deleted),
+            )
+            self.cur.executemany(
+                "UPDATE playlist_songs SET position = ?, song_id = ? WHERE playlist_id = ? AND position = ?",
+                (
+                    (new_position, song_id, playlist_id, position)
+                    for position, new_position, song_id in updated
+                ),
+            )
+        self.cur.executemany(
+            "INSERT INTO playlist_songs(playlist_id, position, song_id) VALUES (?, ?, ?)",
+            ((playlist_id, position, song_id) for position, song_id in inserted),
+        )
+        songs_at = dict(rows)
+        moved = sum(1 for position, _, song_id in updated if songs_at[position] == song_id)
+        return {
+            "inserted": len(inserted),
+            "updated": len(updated) - moved,
+            "moved": moved,
+            "deleted": len(deleted),
+        }
 
-            LEFT JOIN artists_source_info
-            ON artists.id = artists_source_info.artist_id 
-            AND artists_source_info.service_id = services.id
+    def fetch_playlist_songs(self, playlist_id):
+        """
+        Returns:
+            list: the db song ids of a playlist in order
+        """
+        self.cur.execute(
+            "SELECT song_id FROM playlist_songs WHERE playlist_id = ? ORDER BY position",
+            (playlist_id,),
+        )
+        return [row[0] for row in self.cur.fetchall()]
 
-            LEFT JOIN songs_source_info
-            ON songs.id = songs_source_info.song_id 
-            AND songs_source_info.service_id = services.id
+    def iter_unidentified_songs(self, service_id, batch_size=500):
+        """
+        Stream the songs without a ref on a service, in batches ordered by song id.
+        Each batch is a new query starting after the last song id of the previous one,
+        so songs identified in the meantime are skipped and nothing is held between batches.
 
-            WHERE services.id = (?) AND songs_source_info.service_song_title IS NULL
-            """,
+        Args:
+            service_id (str): the service
+            batch_size (int, optional): songs per batch. Defaults to 500.
+
+        Yields:
+            list: song dictionaries with the input_song_title, input_artist_name and db_song_id to identify
+        """
+        last_song_id = -1
+        while True:
+            self.cur.execute(
+                SELECT_UNIDENTIFIED_SONGS,
+                (service_id, last_song_id, service_id, batch_size),
+            )
+            rows = self.cur.fetchall()
+            if not rows:
+                return
+            yield [song_to_identify(service_id, row) for row in rows]
+            last_song_id = rows[-1][0]
+
+    def fetch_unidentified_songs(self, service_id):
+        """
+        Every song without a ref on a service, see iter_unidentified_songs
+
+        Returns:
+            list: song dictionaries
+        """
+        return [
+            song for batch in self.iter_unidentified_songs(service_id) for song in batch
+        ]
+
+    def _begin_immediate(self):
+        """
+        Start a write transaction right away, so no other connection can write
+        between what this one reads and writes
+        """
+        self.con.commit()
+        self.cur.execute("BEGIN IMMEDIATE")
+
+    def enqueue_identify_jobs(self, service_id, batch_size=500):
+        """
+        Add a pending identify_jobs row for every song without a ref on a service,
+        songs that already have a job keep it. The songs are read with iter_unidentified_songs
+        so each statement only covers one batch. Commits.
+
+        Args:
+            service_id (str): the service
+            batch_size (int, optional): see iter_unidentified_songs. Defaults to 500.
+
+        Returns:
+            int: number of jobs added
+        """
+        count = 0
+        for songs in self.iter_unidentified_songs(service_id, batch_size):
+            self.cur.executemany(
+                "INSERT OR IGNORE INTO identify_jobs(service_id, song_id) VALUES (?, ?)",
+                [(service_id, song["db_song_id"]) for song in songs],
+            )
+            count += self.cur.rowcount
+        self.con.commit()
+        return count
+
+    def claim_identify_jobs(self, service_id, limit=500, now=None, lease=600):
+        """
+        Take up to limit jobs that are due and mark them running, in one BEGIN IMMEDIATE transaction
+        so concurrent workers never get the same job. Running jobs claimed more than lease seconds ago
+        belong to a worker that died and are claimed again. Jobs of songs identified since they were
+        queued are marked done instead of being returned.
+
+        Args:
+            service_id (str): the service
+            limit (int, optional): maximum number of jobs. Defaults to 500.
+            now (float, optional): current unix time. Defaults to time.time().
+            lease (float, optional): seconds a claimed job stays running before it can be claimed again. Defaults to 600.
+
+        Returns:
+            list: song dictionaries to identify, like iter_unidentified_songs batches
+        """
+        now = time.time() if now is None else now
+        self._begin_immediate()
+        try:
+            songs = []
+            # Loops only when every job selected turned out to be done already
+            while not songs:
+                self.cur.execute(
+                    f"""
+                    SELECT song_id FROM identify_jobs
+                    WHERE service_id = ?
+                    AND (
+                        (status IN ({",".join("?" * len(RETRYABLE_JOB_STATUSES))}) AND next_attempt_at <= ?)
+                        OR (status = 'running' AND claimed_at <= ?)
+                    )
+                    ORDER BY next_attempt_at, song_id
+                    LIMIT ?
+                    """,
+                    (service_id, *RETRYABLE_JOB_STATUSES, now, now - lease, limit),
+                )
+                song_ids = [row[0] for row in self.cur.fetchall()]
+                if not song_ids:
+                    break
+                self.cur.execute(
+                    f"""
+                    {SELECT_SONGS_TO_IDENTIFY}
+                    WHERE songs.id IN ({",".join("?" * len(song_ids))})
+                    AND NOT {SONG_IS_IDENTIFIED}
+                    ORDER BY songs.id
+                    """,
+                    (service_id, *song_ids, service_id),
+                )
+                songs = [song_to_identify(service_id, row) for row in self.cur.fetchall()]
+                claimed = {song["db_song_id"] for song in songs}
+                self.cur.executemany(
+                    """
+                    UPDATE identify_jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?
+                    WHERE service_id = ? AND song_id = ?
+                    """,
+                    ((now, service_id, song_id) for song_id in claimed),
+                )
+                self.cur.executemany(
+                    """
+                    UPDATE identify_jobs SET status = 'done', next_attempt_at = 0, last_error = NULL
+                    WHERE service_id = ? AND song_id = ?
+                    """,
+                    ((service_id, song_id) for song_id in song_ids if song_id not in claimed),
+                )
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        return songs
+
+    def complete_identify_jobs(
+        self,
+        service_id,
+        results,
+        now=None,
+        backoff=60,
+        max_backoff=24 * 3600,
+        not_found_delay=30 * 24 * 3600,
+    ):
+        """
+        Save the outcome of claimed jobs in one BEGIN IMMEDIATE transaction:
+        identified songs are inserted and their job is done, songs that weren't found are retried
+        after not_found_delay and failed ones after an exponential backoff on their attempts.
+
+        Args:
+            service_id (str): the service
+            results (list): (song, identified_song, error) tuples, identified_song is None when the song
+                wasn't found or when error is set
+            now (float, optional): current unix time. Defaults to time.time().
+            backoff (float, optional): seconds before retrying after the first failure, doubled every attempt. Defaults to 60.
+            max_backoff (float, optional): longest wait between two failed attempts. Defaults to a day.
+            not_found_delay (float, optional): seconds before searching again a song that wasn't found. Defaults to 30 days.
+        """
+        now = time.time() if now is None else now
+        identified = []
+        done = []
+        not_found = []
+        failed = []
+        for song, identified_song, error in results:
+            song_id = song["db_song_id"]
+            if error is not None:
+                failed.append((repr(error), now, max_backoff, backoff, service_id, song_id))
+            elif identified_song:
+                identified.append({**identified_song, "db_song_id": song_id})
+                done.append((service_id, song_id))
+            else:
+                not_found.append((now + not_found_delay, service_id, song_id))
+
+        self._begin_immediate()
+        try:
+            if identified:
+                self.insert_songs_bulk(identified)
+            self.cur.executemany(
+                """
+                UPDATE identify_jobs SET status = 'done', next_attempt_at = 0, last_error = NULL
+                WHERE service_id = ? AND song_id = ?
+                """,
+                done,
+            )
+            self.cur.executemany(
+                """
+                UPDATE identify_jobs SET status = 'not_found', next_attempt_at = ?, last_error = NULL
+                WHERE service_id = ? AND song_id = ?
+                """,
+                not_found,
+            )
+            # The exponent is capped, sqlite shifts past 63 bits to negative or 0
+            self.cur.executemany(
+                """
+                UPDATE identify_jobs SET status = 'failed', last_error = ?,
+                next_attempt_at = ? + MIN(?, ? * (1 << MIN(MAX(attempts - 1, 0), 30)))
+                WHERE service_id = ? AND song_id = ?
+                """,
+                failed,
+            )
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+
+    def count_identify_jobs(self, service_id):
+        """
+        Returns:
+            dict: {status: number of jobs}
+        """
+        self.cur.execute(
+            "SELECT status, COUNT(*) FROM identify_jobs WHERE service_id = ? GROUP BY status",
             (service_id,),
         )
-        raw_unidentified_songs = self.cur.fetchall()
-        for song_data in raw_unidentified_songs:
-            results.append(
-                {
-                    "service_id": song_data[0],
-                    "artist_id": song_data[1],
-                    "artist_name": song_data[2],
-                    "input_artist_name": song_data[3],
-                    "song_id": song_data[4],
-                    "song_title": song_data[5],
-                    "input_song_title": song_data[6],
-                    "db_song_id": song_data[7]
-                }
-            )
-        return results
+        return dict(self.cur.fetchall())
 
     def fetch_unidentified_playlists(self, service_id):
         results = []
@@ -415,9 +1514,166 @@ class Database:
             )
         return results
 
+    def fetch_song_refs(self):
+        """
+        Every known ref of every song, used to build a SongTable
+
+        Returns:
+            list: (song_id, service_id, service_artist_id, service_artist_name, service_song_id, service_song_title) tuples ordered by song_id
+        """
+        self.cur.execute(
+            """
+            SELECT songs_source_info.song_id, songs_source_info.service_id,
+            artists_source_info.service_artist_id, artists_source_info.service_artist_name,
+            songs_source_info.service_song_id, songs_source_info.service_song_title
+            FROM songs_source_info
+            JOIN songs ON songs.id = songs_source_info.song_id
+            LEFT JOIN artists_source_info
+            ON artists_source_info.artist_id = songs.artist_id
+            AND artists_source_info.service_id = songs_source_info.service_id
+            ORDER BY songs_source_info.song_id
+            """
+        )
+        return self.cur.fetchall()
+
+    def fetch_checkpoints(self, service_id):
+        """
+        Checkpoints saved by the last sync of a service
+
+        Args:
+            service_id (str): the service
+
+        Returns:
+            dict: {scope: {"added_at", "snapshot_id", "track_count", "last_item_id"}}
+        """
+        self.cur.execute(
+            """
+            SELECT scope, added_at, snapshot_id, track_count, last_item_id
+            FROM sync_checkpoints
+            WHERE service_id = ?
+            """,
+            (service_id,),
+        )
+        return {
+            scope: {
+                "added_at": added_at,
+                "snapshot_id": snapshot_id,
+                "track_count": track_count,
+                "last_item_id": last_item_id,
+            }
+            for scope, added_at, snapshot_id, track_count, last_item_id in self.cur.fetchall()
+        }
+
+    def save_checkpoints(self, service_id, checkpoints):
+        """
+        Save the checkpoints of a sync, missing fields are stored as NULL
+
+        Args:
+            service_id (str): the service
+            checkpoints (dict): {scope: {"added_at", "snapshot_id", "track_count", "last_item_id"}}
+        """
+        self.cur.executemany(
+            """
+            INSERT OR REPLACE INTO sync_checkpoints(service_id, scope, added_at, snapshot_id, track_count, last_item_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    service_id,
+                    scope,
+                    checkpoint.get("added_at"),
+                    checkpoint.get("snapshot_id"),
+                    checkpoint.get("track_count"),
+                    checkpoint.get("last_item_id"),
+                )
+                for scope, checkpoint in checkpoints.items()
+            ),
+        )
+        self.con.commit()
+
     def fetch_playlists(self, service_id):
         pass
 
+    def search(self, query, limit=10):
+        """
+        Songs whose title or artist name contain words of the query, best matches first (bm25)
+
+        Args:
+            query (str): free text, see fts_query
+            limit (int, optional): maximum number of results. Defaults to 10.
+
+        Returns:
+            list: song ids
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        self.cur.execute(
+            "SELECT rowid FROM songs_fts WHERE songs_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        )
+        return [row[0] for row in self.cur.fetchall()]
+
+    def search_playlists(self, query, limit=10):
+        """
+        Same as search for playlist names
+
+        Returns:
+            list: playlist ids
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        self.cur.execute(
+            "SELECT rowid FROM playlists_fts WHERE playlists_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        )
+        return [row[0] for row in self.cur.fetchall()]
+
+    def fetch_songs(self, song_ids):
+        """
+        Args:
+            song_ids (list): song ids, like the results of search
+
+        Returns:
+            list: (song_id, title, artist_name) tuples in the order of song_ids
+        """
+        self.cur.execute(
+            f"""
+            SELECT songs.id, songs.title, artists.name
+            FROM songs LEFT JOIN artists ON artists.id = songs.artist_id
+            WHERE songs.id IN ({",".join("?" * len(song_ids))})
+            """,
+            list(song_ids),
+        )
+        rows = {row[0]: row for row in self.cur.fetchall()}
+        return [rows[song_id] for song_id in song_ids if song_id in rows]
+
+    def fetch_service_refs(self, song_ids, service_id):
+        """
+        Refs on a service of the given songs, used to identify a song from the library before asking the service
+
+        Args:
+            song_ids (list): song ids, like the results of search, None for every song on the service
+            service_id (str): the service
+
+        Returns:
+            list: (song_id, title, artist_name, service_artist_id, service_artist_name, service_song_id, service_song_title)
+                tuples in the order of song_ids, songs without a ref on the service are left out
+        """
+        if song_ids is None:
+            self.cur.execute(SELECT_SERVICE_REFS, (service_id, service_id))
+            return self.cur.fetchall()
+        self.cur.execute(
+            f"""
+            {SELECT_SERVICE_REFS}
+            WHERE songs.id IN ({",".join("?" * len(song_ids))})
+            """,
+            [service_id, service_id, *song_ids],
+        )
+        rows = {row[0]: row for row in self.cur.fetchall()}
+        return [rows[song_id] for song_id in song_ids if song_id in rows]
+
     def print_table(self, table):
 
         print("=" * 80)
@@ -461,24 +1717,97 @@ class Database:
         for table in tables:
             self.print_table(table[0])
 
-    def find_duplicates(self, table, wanted_column, id_column):
-        """
-        Broken from now.. finds songs from spotify and youtube to be duplicated
+    def refresh_match_keys(self, chunk_size=10000):
         """
-        # Construct the query with dynamic table and column names
-        query = f"""
-        SELECT {wanted_column}, COUNT(*) AS cnt, GROUP_CONCAT({id_column}) AS nos
-        FROM {table}
-        GROUP BY {wanted_column}
-        HAVING COUNT(*) > 1
+        Compute the song_match_keys of the songs that don't have them yet,
+        chunk_size songs at a time with a commit after each chunk
+
+        Args:
+            chunk_size (int, optional): songs per chunk. Defaults to 10000.
+
+        Returns:
+            int: number of songs keyed
         """
+        count = 0
+        last_song_id = -1
+        while True:
+            self.cur.execute(
+                """
+                SELECT songs.id, songs.title, artists.name
+                FROM songs
+                LEFT JOIN artists ON artists.id = songs.artist_id
+                WHERE songs.id > ?
+                AND NOT EXISTS (SELECT 1 FROM song_match_keys WHERE song_id = songs.id)
+                ORDER BY songs.id
+                LIMIT ?
+                """,
+                (last_song_id, chunk_size),
+            )
+            rows = self.cur.fetchall()
+            if not rows:
+                return count
+            self.cur.executemany(
+                "INSERT INTO song_match_keys(song_id, artist_key, title_key) VALUES (?, ?, ?)",
+                (
+                    (song_id, artist_key(artist_name), normalise(title))
+                    for song_id, title, artist_name in rows
+                ),
+            )
+            self.con.commit()
+            count += len(rows)
+            last_song_id = rows[-1][0]
 
-        # Execute the query
-        self.cur.execute(query)
+    def iter_duplicates(self, chunk_size=1000):
+        """
+        Stream clusters of songs that are probably the same song under several rows,
+        like "Halo" by Beyoncé and "HALO (Official Video)" by Beyonce.
+        Songs are grouped by their song_match_keys, chunk_size groups are read at a time.
+        Two songs with a ref on the same service but different ids there are different songs,
+        they are never put in the same cluster. Needs refresh_match_keys to be up to date.
 
-        # Fetch and return all results
-        return self.cur.fetchall()
+        Args:
+            chunk_size (int, optional): groups of songs read per query. Defaults to 1000.
 
+        Yields:
+            dict: {"artist_key", "title_key", "song_ids": sorted list, "score": lowest similarity that joined the cluster}
+        """
+        last_key = ("", "")
+        while True:
+            # Only the rows of the chunk's keys are read, not the singletons between them
+            self.cur.execute(
+                """
+                SELECT song_match_keys.artist_key, song_match_keys.title_key,
+                songs.id, songs.title, artists.name,
+                songs_source_info.service_id, songs_source_info.service_song_id
+                FROM song_match_keys
+                JOIN songs ON songs.id = song_match_keys.song_id
+                LEFT JOIN artists ON artists.id = songs.artist_id
+                LEFT JOIN songs_source_info ON songs_source_info.song_id = songs.id
+                WHERE (song_match_keys.artist_key, song_match_keys.title_key) IN (
+                    SELECT artist_key, title_key
+                    FROM song_match_keys
+                    WHERE (artist_key, title_key) > (?, ?) AND title_key != ''
+                    GROUP BY artist_key, title_key
+                    HAVING COUNT(*) > 1
+                    ORDER BY artist_key, title_key
+                    LIMIT ?
+                )
+                ORDER BY songs.id
+                """,
+                (*last_key, chunk_size),
+            )
+            # {(artist_key, title_key): {song_id: (title, artist_name, {service_id: service_song_id})}}
+            groups = {}
+            for key_artist, key_title, song_id, title, artist_name, service_id, service_song_id in self.cur:
+                group = groups.setdefault((key_artist, key_title), {})
+                refs = group.setdefault(song_id, (title, artist_name, {}))[2]
+                if service_id is not None:
+                    refs[service_id] = service_song_id
+            if not groups:
+                return
+            for key in sorted(groups):
+                yield from cluster_duplicates(key, groups[key])
+            last_key = max(groups)
 
 if __name__ == "__main__":
     Spotify_songs = [
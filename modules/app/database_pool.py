@@ -0,0 +1,141 @@
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.app.database import Database
+
+
+class DatabasePool:
+    """
+    Thread safe access to one library.db.
+    Every thread reads through its own read only connection and the writes are queued
+    to a single writer thread that owns the only writing connection,
+    the database is in WAL mode so readers and the writer don't block each other.
+    """
+
+    def __init__(self, services, db_name, profile="performance", pragmas=None):
+        """
+        Args:
+            services (list): a list of service_id
+            db_name (str): path to the database file, an in memory database can't be shared
+            profile (str, optional): name of the PROFILES entry to apply. Defaults to "performance".
+            pragmas (dict, optional): PRAGMA values applied on top of the profile
+
+        Raises:
+            ValueError: db_name is an in memory database
+        """
+        if db_name == ":memory:" or not db_name:
+            raise ValueError("DatabasePool needs a database file")
+        self.services = services
+        self.db_name = db_name
+        self.profile = profile
+        self.pragmas = {**(pragmas or {}), "journal_mode": "WAL"}
+        self._local = threading.local()
+        # weakref.finalize closing each reader's connection
+        self._readers = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        # Creates and migrates the database before any reader opens it
+        self._writer.submit(self._open_writer).result()
+
+    def _open(self, read_only):
+        return Database(
+            self.services,
+            self.db_name,
+            profile=self.profile,
+            pragmas=self.pragmas,
+            read_only=read_only,
+            check_same_thread=False,
+        )
+
+    def _open_writer(self):
+        self._writer_db = self._open(read_only=False)
+        self._writer_db.con.commit()
+
+    def _call_writer(self, method, args, kwargs):
+        try:
+            result = getattr(self._writer_db, method)(*args, **kwargs)
+            self._writer_db.con.commit()
+            return result
+        except Exception:
+            self._writer_db.con.rollback()
+            raise
+
+    def reader(self):
+        """
+        The read only Database of the calling thread, opened on first use.
+        Its connection is closed once the thread ends and nothing holds it anymore, or by close.
+
+        Returns:
+            Database: a connection only this thread uses
+        """
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._open(read_only=True)
+            self._local.db = db
+            with self._lock:
+                self._readers = [finalizer for finalizer in self._readers if finalizer.alive]
+                self._readers.append(weakref.finalize(db, db.con.close))
+        return db
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Queue a call to a Database method on the writer thread, it is committed once done
+
+        Args:
+            method (str): name of the Database method, like "insert_songs"
+
+        Returns:
+            concurrent.futures.Future: result of the method
+        """
+        return self._writer.submit(self._call_writer, method, args, kwargs)
+
+    def write(self, method, *args, **kwargs):
+        """
+        Same as submit but waits for the result
+        """
+        return self.submit(method, *args, **kwargs).result()
+
+    def consume(self, method, pages, max_pending=2):
+        """
+        Write pages of rows as they are produced, like the ones yielded by a plugin's iter_songs.
+        At most max_pending pages wait for the writer so memory stays flat when the writer is slower.
+
+        Args:
+            method (str): name of the Database method called with each page, like "insert_songs"
+            pages (iterable): lists of rows
+            max_pending (int, optional): pages queued before waiting for the writer. Defaults to 2.
+
+        Returns:
+            int: number of rows written
+        """
+        pending = deque()
+        count = 0
+        for page in pages:
+            if not page:
+                continue
+            if len(pending) >= max_pending:
+                pending.popleft().result()
+            pending.append(self.submit(method, page))
+            count += len(page)
+        while pending:
+            pending.popleft().result()
+        return count
+
+    def close(self):
+        """
+        Wait for the queued writes and close every connection
+        """
+        self._writer.shutdown(wait=True)
+        self._writer_db.con.close()
+        with self._lock:
+            for finalizer in self._readers:
+                finalizer()
+            self._readers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
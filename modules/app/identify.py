@@ -0,0 +1,288 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.utils.matching import match_songs, normalise
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket, lets through `rate` calls per second on average
+    with bursts of up to `burst` calls.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): tokens added per second
+            burst (int, optional): maximum number of tokens. Defaults to 1.
+            clock (function, optional): time source. Defaults to time.monotonic.
+            sleep (function, optional): used to wait. Defaults to time.sleep.
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting for one if the bucket is empty
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            self.sleep(wait_time)
+
+
+def http_status(error):
+    """
+    HTTP status of an exception raised by a plugin's api client, spotipy uses http_status
+    """
+    for attribute in ("http_status", "status_code", "status"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error):
+    """
+    True for rate limiting (429) and server errors (5xx)
+    """
+    status = http_status(error)
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+def retry_after_seconds(value, now=time.time):
+    """
+    Seconds to wait from a Retry-After header, given in seconds or as an HTTP date
+
+    Args:
+        value (str): the header, like "120" or "Wed, 21 Oct 2015 07:28:00 GMT"
+        now (function, optional): time source in seconds. Defaults to time.time.
+
+    Returns:
+        float: seconds to wait, None if the header can't be read
+    """
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        return None
+    return max(date.timestamp() - now(), 0)
+
+
+def call_with_retry(func, *args, retries=3, backoff=1.0, sleep=time.sleep):
+    """
+    Call func, retrying with exponential backoff when it raises a retryable error.
+    A Retry-After header on the error is used instead of the backoff when it can be read.
+
+    Args:
+        func (function): function to call with args
+        retries (int, optional): number of retries after the first call. Defaults to 3.
+        backoff (float, optional): seconds waited before the first retry, doubled each time. Defaults to 1.0.
+        sleep (function, optional): used to wait. Defaults to time.sleep.
+
+    Returns:
+        the result of func
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except Exception as error:
+            if attempt >= retries or not is_retryable(error):
+                raise
+            headers = getattr(error, "headers", None) or {}
+            retry_after = retry_after_seconds(headers.get("Retry-After"))
+            sleep(retry_after if retry_after is not None else backoff * 2**attempt)
+            attempt += 1
+
+
+def identify_locally(db, service_id, songs, candidates=5, service_refs=None):
+    """
+    Identify songs from the library before asking the service, in one pass over the songs already on it.
+    A song is only linked when a song of the same artist on the service has the same
+    normalised title, version included, see matching.best_match. Songs whose artist isn't
+    on the service are compared to the results of Database.search.
+    Ambiguous and unmatched songs are left for the service.
+
+    Args:
+        db (Database): a connection to read from, like DatabasePool.reader()
+        service_id (str): the service the songs are identified on
+        songs (list): unidentified songs from Database.fetch_unidentified_songs
+        candidates (int, optional): search results checked per song without artist block. Defaults to 5.
+        service_refs (list, optional): Database.fetch_service_refs(None, service_id), to reuse it across batches. Defaults to fetching it.
+
+    Returns:
+        tuple: (identified songs ready for insert_songs, songs left to identify remotely)
+    """
+
+    def search_candidates(song):
+        query = f'{song.get("input_artist_name") or ""} {normalise(song.get("input_song_title"))}'
+        return db.fetch_service_refs(db.search(query, limit=candidates), service_id)
+
+    results = match_songs(
+        songs,
+        service_refs if service_refs is not None else db.fetch_service_refs(None, service_id),
+        fallback=search_candidates,
+    )
+    identified = [
+        {
+            "service_id": service_id,
+            "artist_id": candidate[3],
+            "artist_name": candidate[4],
+            "song_id": candidate[5],
+            "song_title": candidate[6],
+            "db_song_id": song["db_song_id"],
+        }
+        for song, candidate, _ in results["matched"]
+    ]
+    remaining = [song for status in ("ambiguous", "unmatched") for song, _, _ in results[status]]
+    return identified, remaining
+
+
+def identify_songs(
+    identify_song,
+    songs,
+    on_batch=None,
+    workers=4,
+    rate=None,
+    burst=1,
+    retries=3,
+    backoff=1.0,
+    batch_size=50,
+    on_done=None,
+):
+    """
+    Identify songs with a bounded number of concurrent calls to identify_song,
+    rate limited and retried on 429/5xx. Identified songs are handed to on_batch
+    every batch_size songs so progress is saved as it goes.
+
+    Args:
+        identify_song (function): the plugin's identify_song, returns the identified song or None
+        songs (list): unidentified songs, like a batch of Database.iter_unidentified_songs
+        on_batch (function, optional): called with a list of identified songs, like lambda batch: db.write("insert_songs", batch)
+        workers (int, optional): number of concurrent calls. Defaults to 4.
+        rate (float, optional): calls per second allowed by the service. Defaults to no limit.
+        burst (int, optional): calls allowed at once by the service. Defaults to 1.
+        retries (int, optional): see call_with_retry. Defaults to 3.
+        backoff (float, optional): see call_with_retry. Defaults to 1.0.
+        batch_size (int, optional): number of identified songs per on_batch call. Defaults to 50.
+        on_done (function, optional): called every batch_size processed songs with (song, identified_song, error) tuples
+            for all of them, found or not, like Database.complete_identify_jobs expects
+
+    Returns:
+        dict: {"identified": int, "not_found": int, "failed": int}
+    """
+    bucket = TokenBucket(rate, burst) if rate else None
+
+    def limited_identify_song(song):
+        if bucket:
+            bucket.acquire()
+        return identify_song(song)
+
+    def identify(song):
+        return call_with_retry(
+            limited_identify_song, song, retries=retries, backoff=backoff
+        )
+
+    stats = {"identified": 0, "not_found": 0, "failed": 0}
+    batch = []
+    done = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="identify") as executor:
+        futures = {executor.submit(identify, song): song for song in songs}
+        for count, future in enumerate(as_completed(futures), start=1):
+            try:
+                identified_song = future.result()
+            except Exception as error:
+                print(f"identify_song failed: {error!r}")
+                stats["failed"] += 1
+                done.append((futures[future], None, error))
+            else:
+                done.append((futures[future], identified_song, None))
+                if identified_song:
+                    stats["identified"] += 1
+                    batch.append(identified_song)
+                    if len(batch) >= batch_size:
+                        if on_batch:
+                            on_batch(batch)
+                        batch = []
+                        print(f"{count}/{len(songs)}")
+                else:
+                    stats["not_found"] += 1
+            if len(done) >= batch_size:
+                if on_done:
+                    on_done(done)
+                done = []
+    if batch and on_batch:
+        on_batch(batch)
+    if done and on_done:
+        on_done(done)
+    return stats
+
+
+def process_identify_jobs(
+    pool,
+    service_id,
+    identify_song,
+    claim_size=500,
+    local=True,
+    **options,
+):
+    """
+    Work through the identify_jobs of a service until none is due: claim a batch of jobs,
+    identify what can be from the library, send the rest to identify_songs and save every outcome
+    with Database.complete_identify_jobs. Can run in several threads or processes on the same database.
+
+    Args:
+        pool (DatabasePool): the library, writes go through its writer
+        service_id (str): the service
+        identify_song (function): the plugin's identify_song
+        claim_size (int, optional): jobs claimed at once. Defaults to 500.
+        local (bool, optional): try identify_locally before the service. Defaults to True.
+        **options: passed to identify_songs, like workers or rate
+
+    Returns:
+        dict: {"local": int, "identified": int, "not_found": int, "failed": int}
+    """
+    totals = {"local": 0, "identified": 0, "not_found": 0, "failed": 0}
+    pool.write("enqueue_identify_jobs", service_id)
+    service_refs = pool.reader().fetch_service_refs(None, service_id) if local else None
+    while True:
+        songs = pool.write("claim_identify_jobs", service_id, claim_size)
+        if not songs:
+            return totals
+        if local:
+            identified_songs, songs = identify_locally(
+                pool.reader(), service_id, songs, service_refs=service_refs
+            )
+            pool.write(
+                "complete_identify_jobs",
+                service_id,
+                [(identified_song, identified_song, None) for identified_song in identified_songs],
+            )
+            totals["local"] += len(identified_songs)
+        stats = identify_songs(
+            identify_song,
+            songs,
+            on_done=lambda results: pool.write("complete_identify_jobs", service_id, results),
+            **options,
+        )
+        for key, count in stats.items():
+            totals[key] += count
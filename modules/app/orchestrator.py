@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+
+
+def plugin_name(plugin):
+    """
+    Name used to report a plugin, its SERVICE_ID when it has one
+    """
+    return getattr(plugin, "SERVICE_ID", None) or getattr(plugin, "__name__", repr(plugin))
+
+
+def run_plugins(plugins, task, on_result=None, timeout=None, max_workers=None):
+    """
+    Run task(plugin) for every plugin at the same time, each one in a worker thread.
+    Results are handed to on_result from the calling thread as soon as each plugin finishes,
+    so the total time is the time of the slowest plugin instead of the sum of all of them.
+    A plugin that raises or goes over the timeout is reported and doesn't stop the others.
+
+    Threads can't be killed: a plugin over the timeout is abandoned, not stopped.
+    It keeps running in the background until it returns, and can still write what it pulls.
+    The workers are daemon threads so an abandoned plugin doesn't keep the process
+    from exiting, it is stopped with it.
+
+    Args:
+        plugins (list): plugins to run
+        task (function): called with a plugin in a worker thread, like lambda plugin: plugin.pull_songs()
+        on_result (function, optional): called with (plugin, result) for every successful plugin
+        timeout (float, optional): seconds each plugin is given, counted from the start. Defaults to no timeout.
+        max_workers (int, optional): number of worker threads. Defaults to one per plugin.
+
+    Returns:
+        dict: {plugin: exception} for every plugin that failed or timed out
+    """
+    errors = {}
+    if not plugins:
+        return errors
+
+    todo = queue.SimpleQueue()
+    for index in range(len(plugins)):
+        todo.put(index)
+    # (index, result, error) of every plugin that finished
+    finished = queue.SimpleQueue()
+    stopped = threading.Event()
+
+    def worker():
+        while not stopped.is_set():
+            try:
+                index = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                finished.put((index, task(plugins[index]), None))
+            except BaseException as error:
+                finished.put((index, None, error))
+
+    for _ in range(min(max_workers or len(plugins), len(plugins))):
+        threading.Thread(target=worker, name="plugin", daemon=True).start()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    pending = set(range(len(plugins)))
+    try:
+        while pending:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                index, result, error = finished.get(timeout=remaining)
+            except queue.Empty:
+                for index in sorted(pending):
+                    plugin = plugins[index]
+                    print(f"{plugin_name(plugin)} timed out after {timeout}s")
+                    errors[plugin] = TimeoutError(f"{plugin_name(plugin)} timed out after {timeout}s")
+                break
+            pending.discard(index)
+            plugin = plugins[index]
+            if error is not None:
+                print(f"{plugin_name(plugin)} failed: {error!r}")
+                errors[plugin] = error
+                continue
+            if on_result is not None:
+                try:
+                    on_result(plugin, result)
+                except Exception as error:
+                    print(f"{plugin_name(plugin)} result could not be saved: {error!r}")
+                    errors[plugin] = error
+    finally:
+        # Also reached on KeyboardInterrupt, plugins that didn't start yet are not started
+        stopped.set()
+    return errors
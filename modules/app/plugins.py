@@ -1,5 +1,5 @@
-from modules.plugins_init import plugins_paths, import_paths
-from modules.settings import settings
+from modules.app.plugins_init import plugins_paths, import_paths
+from modules.app.settings import settings
 
 #only activates plugin that are whitelisted and not blacklisted
 if settings["main"]["plugins_whitelist"] == []:
@@ -10,6 +10,8 @@ else:
 #imports the plugins
 plugins = import_paths(active_plugins_path, "main")
 plugins_constants = import_paths(active_plugins_path, "settings")
+# settings module of every plugin, for the constants the app reads like RATE_LIMIT
+plugins_settings = dict(zip(plugins, plugins_constants))
 # get the service id from each plugins that will be used to initialise the database
 
 service_ids = [plugin.SERVICE_ID for plugin in plugins_constants]
\ No newline at end of file
@@ -1,6 +1,7 @@
+import copy
 import toml
 import os
-from modules.plugins_init import plugins_constants, init_service_ids
+from modules.app.plugins_init import plugins_constants, init_service_ids
 
 list_of_all_services = ["db", "input"] + init_service_ids
 list_of_all_pushable_service = list(set(list_of_all_services) - {"input"})
@@ -13,11 +14,46 @@ main_setting_default = {
     "plugins_blacklist": [],
     "pull_from": list_of_all_services,
     "push_to": list_of_all_pushable_service,
+    # seconds a plugin is given to pull, 0 for no limit
+    "plugin_timeout": 0,
+    # only pull what changed since the last sync, see the sync_checkpoints table
+    "delta_sync": True,
 }
 
 instance_count_default = {service: 1 for service in init_service_ids}
 
-debug_setting_default = {"api_cache": False, "cache_folder": "cache"}
+debug_setting_default = {
+    "api_cache": False,
+    "cache_folder": "cache",
+    # 0 means no limit
+    "cache_ttl": 0,
+    "cache_max_entries": 0,
+    "cache_max_bytes": 0,
+    # json, pickle or msgpack, with none, zlib or lzma compression
+    "cache_format": "pickle",
+    "cache_compression": "zlib",
+    # keep the plugins' search results between runs, even with api_cache off
+    "search_cache": True,
+}
+
+# profile is one of modules.app.database.PROFILES, pragmas overrides single values of it
+database_setting_default = {"path": "library.db", "profile": "performance", "pragmas": {}}
+
+
+def merge_defaults(section, defaults):
+    """Fill the keys missing from a settings section with their defaults, nested tables included
+    Args:
+        section (dict): section loaded from the settings file, updated in place
+        defaults (dict): default values of the section
+    Returns:
+        (dict): the section
+    """
+    for key, default in defaults.items():
+        if key not in section:
+            section[key] = copy.deepcopy(default)
+        elif isinstance(default, dict) and isinstance(section[key], dict):
+            merge_defaults(section[key], default)
+    return section
 
 
 def load_settings(plugins_settings, path="settings.toml"):
@@ -35,9 +71,11 @@ def load_settings(plugins_settings, path="settings.toml"):
     else:
         settings = {}
 
-    settings.setdefault("main", main_setting_default)
-    settings.setdefault("debug", debug_setting_default)
-    settings.setdefault("instance_count", instance_count_default)
+    # A section can be partial, like a [database] with only a path
+    merge_defaults(settings.setdefault("main", {}), main_setting_default)
+    merge_defaults(settings.setdefault("debug", {}), debug_setting_default)
+    merge_defaults(settings.setdefault("database", {}), database_setting_default)
+    merge_defaults(settings.setdefault("instance_count", {}), instance_count_default)
     settings.setdefault("instances", {})
 
     # Add plugin's defaults settings in new format
@@ -1,8 +1,11 @@
 from modules.data.PlaylistRef import PlaylistRef
+from modules.data.Song import Song
+from modules.utils.disjoint_set import DisjointSet
 
 class Playlist:
     """
-    A collection of unique songs using __eq__ for uniqueness instead of hashing.
+    A collection of unique songs using the same equality as Song.__eq__.
+    Uniqueness is resolved through an index of ref keys instead of comparing every song.
     Handles merging of songs that become connected through shared references.
     """
 
@@ -18,10 +21,43 @@ class Playlist:
         """
         self.service_id = service_id
         self.playlist_refs = playlist_refs
-        self.songs = []
+        self._songs = []
+        # {(service_id, artist_id, song_id): song} for every ref of every song
+        self._index = {}
         if songs:
             self.add_list(songs)
 
+    @property
+    def songs(self):
+        """Ordered list of songs, use the playlist methods to modify it so the index stays valid"""
+        return self._songs
+
+    def _index_song(self, song):
+        for key in song.ref_keys():
+            self._index[key] = song
+
+    def _unindex_song(self, song):
+        for key in song.ref_keys():
+            if self._index.get(key) is song:
+                del self._index[key]
+
+    def _find_matches(self, song):
+        """
+        Find the songs of the playlist that share at least one ref key with song
+
+        Args:
+            song (Song): song to look for
+
+        Returns:
+            list: matching songs without duplicates, in no particular order
+        """
+        matches = []
+        for key in song.ref_keys():
+            match = self._index.get(key)
+            if match is not None and not any(match is m for m in matches):
+                matches.append(match)
+        return matches
+
     def add(self, song):
         """
         Add a song to the set, handling three cases:
@@ -39,65 +75,160 @@ class Playlist:
             raise TypeError("Can only add Song objects")
 
         # Find all songs that match the new song
-        matching_indices = []
-        for i, existing_song in enumerate(self.songs):
-            if song == existing_song:
-                matching_indices.append(i)
-        if not matching_indices:
+        matches = self._find_matches(song)
+        if not matches:
             # Case 1: Song isn't in the set, add it
-            self.songs.append(song)
-        elif len(matching_indices) == 1:
+            self._songs.append(song)
+            self._index_song(song)
+        elif len(matches) == 1:
             # Case 2: Song matches one existing song, merge them
-            index = matching_indices[0]
-            self.songs[index].merge(song)
+            existing_song = matches[0]
+            self._unindex_song(existing_song)
+            if song is not existing_song:
+                existing_song.merge(song)
+            self._index_song(existing_song)
         else:
             # Case 3: Song matches multiple existing songs, merge all of them
-            # Pop the smallest index and update that song directly
+            # Only this case needs the positions, the smallest one is kept
+            matching_ids = {id(match) for match in matches}
+            matching_indices = [
+                i for i, existing_song in enumerate(self._songs)
+                if id(existing_song) in matching_ids
+            ]
             smallest_index = matching_indices.pop(0)
+            kept_song = self._songs[smallest_index]
+
+            for match in matches:
+                self._unindex_song(match)
 
             # Merge the new song into the existing song at smallest index
-            self.songs[smallest_index].merge(song)
+            if song is not kept_song:
+                kept_song.merge(song)
 
             # Merge all other matching songs into the song at smallest index (in reverse order)
             for index in reversed(matching_indices):
-                self.songs[smallest_index].merge(self.songs[index])
-                del self.songs[index]
+                if self._songs[index] is not kept_song:
+                    kept_song.merge(self._songs[index])
+
+            # Remove the merged songs in one pass instead of shifting the list for each of them
+            removed_indices = set(matching_indices)
+            self._songs = [
+                existing_song for i, existing_song in enumerate(self._songs)
+                if i not in removed_indices
+            ]
+            self._index_song(kept_song)
 
     def add_list(self, songs):
         """Add multiple songs to the set."""
         for song in songs:
             self.add(song)
 
-    def _intersection(self, other):
+    def update(self, songs):
+        """Add multiple songs to the set, same as add_list."""
+        self.add_list(songs)
+
+    @staticmethod
+    def _merge_components(song_lists):
         """
-        Return a new Playlist containing songs that exist in both playlists.
+        Group the songs of several lists that are connected through shared ref keys
+        and merge each group once into a copy of its first song.
+        The given songs are not modified.
 
         Args:
-            other (Playlist): Another playlist to intersect with
+            song_lists (list): list of iterables of Song objects
 
         Returns:
-            Playlist: A new playlist containing common songs
+            list: list of (merged_song, origins) in first-seen order,
+            origins being the set of positions in song_lists the group's songs came from
+        """
+        songs = []
+        song_origins = []
+        for origin, song_list in enumerate(song_lists):
+            for song in song_list:
+                if not isinstance(song, Song):
+                    raise TypeError("Can only add Song objects")
+                songs.append(song)
+                song_origins.append(origin)
+
+        # Link every song to the first song that had the same ref key
+        components = DisjointSet(len(songs))
+        first_owner = {}
+        for i, song in enumerate(songs):
+            for key in song.ref_keys():
+                owner = first_owner.setdefault(key, i)
+                if owner != i:
+                    components.union(owner, i)
+
+        results = []
+        for group in components.groups():
+            merged_song = songs[group[0]].copy()
+            for i in group[1:]:
+                merged_song.merge(songs[i])
+            results.append((merged_song, {song_origins[i] for i in group}))
+        return results
+
+    def _combine(self, other, keep):
+        """
+        Hash join of two playlists on ref keys, used by the set operators
+
+        Args:
+            other (Playlist): Another playlist to combine with
+            keep (function): called with the origins of each merged song ({0}, {1} or {0, 1}),
+                the song is part of the result if it returns True
+
+        Returns:
+            Playlist: A new playlist containing the kept songs
 
         Raises:
             TypeError: If other is not a Playlist object
         """
         if not isinstance(other, Playlist):
-            raise TypeError("Can only intersect with another Playlist object")
+            raise TypeError("Can only combine with another Playlist object")
 
-        # Create a new playlist for the result
         result = Playlist(
             service_id=self.service_id,
             songs=None,
-            playlist_refs={**self.playlist_refs, **other.playlist_refs},
+            playlist_refs={**(self.playlist_refs or {}), **(other.playlist_refs or {})},
         )
+        for song, origins in self._merge_components([self, other]):
+            if keep(origins):
+                result._songs.append(song)
+                result._index_song(song)
+        return result
 
-        # Find songs that exist in both playlists
-        for song_a in self.songs:
-            for song_b in other.songs:
-                if song_a == song_b:
-                    result.add_list([song_a, song_b])
+    def _intersection(self, other):
+        """
+        Return a new Playlist containing songs that exist in both playlists.
+        Each song is merged with its matches from the other playlist.
 
-        return result
+        Args:
+            other (Playlist): Another playlist to intersect with
+
+        Returns:
+            Playlist: A new playlist containing common songs
+
+        Raises:
+            TypeError: If other is not a Playlist object
+        """
+        return self._combine(other, lambda origins: len(origins) == 2)
+
+    def _union(self, other):
+        """
+        Return a new Playlist containing the songs of both playlists, merged when they match.
+        """
+        return self._combine(other, lambda origins: True)
+
+    def _difference(self, other):
+        """
+        Return a new Playlist containing the songs that are not in the other playlist.
+        """
+        return self._combine(other, lambda origins: origins == {0})
+
+    def _symmetric_difference(self, other):
+        """
+        Return a new Playlist containing the songs that are in only one of the playlists.
+        """
+        return self._combine(other, lambda origins: len(origins) == 1)
 
     def __and__(self, other):
         """
@@ -111,24 +242,44 @@ class Playlist:
         """
         return self._intersection(other)
 
+    def __or__(self, other):
+        """Implement the | operator for _union."""
+        return self._union(other)
+
+    def __sub__(self, other):
+        """Implement the - operator for _difference."""
+        return self._difference(other)
+
+    def __xor__(self, other):
+        """Implement the ^ operator for _symmetric_difference."""
+        return self._symmetric_difference(other)
+
     def add_metadata_from(self, other):
+        """
+        Merge the refs of the songs both playlists have in common into this playlist.
+
+        Args:
+            other (Playlist): playlist to take the refs from
+        """
         self.add_list(self & other)
 
     def __contains__(self, song):
         """Check if a song is in the set."""
-        return song in self.songs
+        if not isinstance(song, Song):
+            return False
+        return bool(self._find_matches(song))
 
     def __iter__(self):
         """Iterate over songs in the set."""
-        return iter(self.songs)
+        return iter(self._songs)
 
     def __len__(self):
         """Return the number of songs in the set."""
-        return len(self.songs)
+        return len(self._songs)
 
     def __repr__(self):
         """Detailed representation of the set."""
-        return f"Playlist({self.songs})"
+        return f"Playlist({self._songs})"
 
     def merge(self, other):
         if not isinstance(other, Playlist):
@@ -136,19 +287,59 @@ class Playlist:
         self.add_list(other.songs)
         return self
 
+    @classmethod
+    def merge_many(cls, playlists, service_id=None, playlist_refs=None):
+        """
+        Merge many playlists at once into a new playlist.
+        Songs connected through any shared ref key, directly or through other songs,
+        are merged together once, in the order they were first seen.
+        The songs of the given playlists are not modified.
+
+        Args:
+            playlists (list): list of Playlist objects or lists of Song objects
+            service_id (str, optional): service_id of the result. Defaults to the first playlist's.
+            playlist_refs (dict, optional): playlist_refs of the result. Defaults to the combined refs of every playlist.
+
+        Returns:
+            Playlist: A new playlist containing every merged song
+        """
+        combined_refs = {}
+        for playlist in playlists:
+            if isinstance(playlist, Playlist):
+                if service_id is None:
+                    service_id = playlist.service_id
+                combined_refs.update(playlist.playlist_refs or {})
+
+        result = cls(
+            service_id=service_id,
+            songs=None,
+            playlist_refs=combined_refs if playlist_refs is None else playlist_refs,
+        )
+        for song, _ in cls._merge_components(playlists):
+            result._songs.append(song)
+            result._index_song(song)
+        return result
+
     def __getitem__(self, key):
         """Make playlist subscriptable - supports indexing and slicing."""
-        return self.songs[key]
+        return self._songs[key]
 
     def __setitem__(self, key, value):
         """Allow item assignment via indexing."""
         if not isinstance(value, Song):
             raise TypeError("Can only assign Song objects")
-        self.songs[key] = value
+        self._unindex_song(self._songs[key])
+        self._songs[key] = value
+        self._index_song(value)
 
     def __delitem__(self, key):
         """Allow item deletion via indexing."""
-        del self.songs[key]
+        removed_songs = self._songs[key]
+        if isinstance(removed_songs, Song):
+            removed_songs = [removed_songs]
+        for song in removed_songs:
+            self._unindex_song(song)
+        del self._songs[key]
 
     def __eq__(self, other):
         """
@@ -187,23 +378,29 @@ class Playlist:
 
     def remove(self, song):
         """Remove a song from the set if it exists."""
-        if song in self.songs:
-            self.songs.remove(song)
-        else:
+        if song not in self:
             raise KeyError("Song not found in set")
+        self.discard(song)
 
     def discard(self, song):
         """Remove a song from the set if it exists, no error if not found."""
-        if song in self.songs:
-            self.songs.remove(song)
+        if not isinstance(song, Song):
+            return
+        for match in self._find_matches(song):
+            self._unindex_song(match)
+            self._songs = [
+                existing_song for existing_song in self._songs
+                if existing_song is not match
+            ]
 
     def clear(self):
         """Remove all songs from the set."""
-        self.songs.clear()
+        self._songs.clear()
+        self._index.clear()
 
     def copy(self):
         return Playlist(
-            service_id=self.service_id.copy(),
-            songs=self.songs.copy(),
-            playlist_refs=self.playlist_refs.copy(),
+            service_id=self.service_id,
+            songs=self._songs.copy(),
+            playlist_refs=self.playlist_refs.copy() if self.playlist_refs else None,
         )
@@ -1,38 +1,50 @@
 class PlaylistRef:
-    def __init__(self, playlist_id, playlist_name, playlist_metadata=dict()):
+    __slots__ = ("playlist_id", "playlist_name", "_playlist_metadata")
+
+    def __init__(self, playlist_id, playlist_name, playlist_metadata=None):
         self.playlist_id = playlist_id
         self.playlist_name = playlist_name
-        self.playlist_metadata = playlist_metadata
+        self._playlist_metadata = playlist_metadata or None
+
+    @property
+    def playlist_metadata(self):
+        if self._playlist_metadata is None:
+            self._playlist_metadata = {}
+        return self._playlist_metadata
+
+    @playlist_metadata.setter
+    def playlist_metadata(self, value):
+        self._playlist_metadata = value or None
 
     def add(self, other):
         if not isinstance(other, PlaylistRef):
             raise TypeError("Can only add PlaylistRef objects together")
         metadata = {
-            **self.playlist_metadata,
-            **other.playlist_metadata,
+            **(self._playlist_metadata or {}),
+            **(other._playlist_metadata or {}),
         }
         return PlaylistRef(
             playlist_id=self.playlist_id or other.playlist_id,
-            playlist_title=self.playlist_title or other.playlist_title,
+            playlist_name=self.playlist_name or other.playlist_name,
             playlist_metadata=metadata,
         )
 
     def copy(self):
         return PlaylistRef(
             playlist_id=self.playlist_id,
-            playlist_title=self.playlist_title,
-            playlist_metadata=metadata,
+            playlist_name=self.playlist_name,
+            playlist_metadata=dict(self._playlist_metadata or {}),
         )
 
     def __add__(self, other):
         return self.add(other)
 
-    def __dict__(self):
+    def dictionary(self):
         return {
             "playlist_id": self.playlist_id,
-            "playlist_title": self.playlist_title,
-            "playlist_metadata": self.playlist_metadata,
+            "playlist_name": self.playlist_name,
+            "playlist_metadata": self._playlist_metadata or {},
         }
 
     def __repr__(self):
-        return str(self.__dict__())
+        return str(self.dictionary())
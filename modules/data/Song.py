@@ -1,4 +1,5 @@
-from modules.SongRef import SongRef
+import sys
+from modules.data.SongRef import SongRef
 
 
 class Song:
@@ -6,6 +7,8 @@ class Song:
     Datatype used to store one music and all of its refferences across services
     """
 
+    __slots__ = ("service_id", "song_refs")
+
     def __init__(self, service_id=None, song_refs=None):
         """
         Adds the data to the song object
@@ -14,10 +17,16 @@ class Song:
             service_id (str): id of the original service
             song_refs (dict): dict of dictionaries {service_id:ref_dict, service_id:ref_dict ... }
         """
+        # service ids are repeated in every song, only keep one copy of them
+        if song_refs:
+            song_refs = {
+                sys.intern(key_service_id): ref
+                for key_service_id, ref in song_refs.items()
+            }
+        self.song_refs = song_refs
         if service_id is None:
             service_id = self._get_oldest_service_id()
-        self.song_refs = song_refs
-        self.service_id = service_id
+        self.service_id = sys.intern(service_id) if service_id else service_id
 
     def _get_oldest_service_id(self):
         """
@@ -42,6 +51,20 @@ class Song:
     def _get_oldest_date(self):
         return self.song_refs[self._get_oldest_service_id()].date_added
 
+    def ref_keys(self):
+        """
+        Keys of the essencial fields of every ref, two songs are equal if they share one
+
+        Returns:
+            list: list of (service_id, artist_id, song_id) tuples
+        """
+        if not self.song_refs:
+            return []
+        return [
+            (service_id, ref.artist_id, ref.song_id)
+            for service_id, ref in self.song_refs.items()
+        ]
+
     def __eq__(self, other):
         """
         Define song equality based on if they have the same id or share any matching ref data
@@ -107,7 +130,18 @@ class Song:
         Returns:
             Song: A new Song instance with copied attributes
         """
-        return Song(self.service_id, self.song_refs.copy())
+        return Song(self.service_id, dict(self.song_refs or {}))
+
+    def __add__(self, other):
+        """
+        Merge two songs into a new one, see merge
+
+        Returns:
+            Song: A new Song with the refs of both songs
+        """
+        result = self.copy()
+        result.merge(other)
+        return result
 
     def __repr__(self):
         return f"Song({self.service_id}, {self.song_refs.keys()})"
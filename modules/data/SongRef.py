@@ -1,8 +1,23 @@
+import sys
 from datetime import datetime
 from rich.pretty import pprint
 
 
 class SongRef:
+    """
+    Data of one song on one service.
+    Slotted to keep a big library small in memory, the metadata dict is only created when needed.
+    """
+
+    __slots__ = (
+        "artist_id",
+        "artist_name",
+        "song_id",
+        "song_title",
+        "date_added",
+        "_song_metadata",
+    )
+
     def __init__(
         self,
         artist_id=None,
@@ -10,23 +25,38 @@ class SongRef:
         song_id=None,
         song_title=None,
         date_added=datetime.today().strftime("%Y-%m-%d"),
-        song_metadata=dict(),
+        song_metadata=None,
     ):
-        self.artist_id = artist_id
+        # artist ids are shared by every song of an artist, only keep one copy of them
+        self.artist_id = sys.intern(artist_id) if artist_id else artist_id
         self.artist_name = artist_name
         self.song_id = song_id
         self.song_title = song_title
         self.date_added = date_added
-        self.song_metadata = song_metadata
+        self._song_metadata = song_metadata or None
+
+    @property
+    def song_metadata(self):
+        if self._song_metadata is None:
+            self._song_metadata = {}
+        return self._song_metadata
+
+    @song_metadata.setter
+    def song_metadata(self, value):
+        self._song_metadata = value or None
 
     def merge(self, other):
         if not isinstance(other, SongRef):
             raise TypeError("Can only add SongRef objects together")
 
-        metadata = {
-            **self.song_metadata,
-            **other.song_metadata,
-        }
+        if self._song_metadata and other._song_metadata:
+            metadata = {
+                **self._song_metadata,
+                **other._song_metadata,
+            }
+        else:
+            metadata = self._song_metadata or other._song_metadata
+            metadata = dict(metadata) if metadata else None
 
         if self.date_added < other.date_added:
             date = self.date_added
@@ -48,8 +78,8 @@ class SongRef:
             "song_id": self.song_id,
             "song_title": self.song_title,
             "date_added": self.date_added,
-            "song_metadata": self.song_metadata,
+            "song_metadata": self._song_metadata or {},
         }
-    
+
     def __repr__(self):
         return str(self.dictionary())
@@ -0,0 +1,240 @@
+from array import array
+
+from modules.data.Playlist import Playlist
+from modules.data.Song import Song
+from modules.data.SongRef import SongRef
+
+
+class SongTable:
+    """
+    Columnar store of song refs for whole library operations.
+    Every ref is one row spread over parallel columns, song_index tells which song the ref belongs to.
+    Bulk operations go over the columns instead of building Song objects,
+    songs are only created on demand with to_songs or to_playlist.
+    """
+
+    COLUMNS = (
+        "song_index",
+        "service_id",
+        "artist_id",
+        "artist_name",
+        "song_id",
+        "title",
+        "date_added",
+    )
+
+    def __init__(self):
+        self.song_index = array("q")
+        # service ids are stored as codes into self.services
+        self.service_code = array("H")
+        self.services = []
+        self._service_codes = {}
+        self.artist_id = []
+        self.artist_name = []
+        self.song_id = []
+        self.title = []
+        self.date_added = []
+        self.song_count = 0
+        # db id of every song_index when built from database rows
+        self.db_song_ids = None
+
+    def _code(self, service_id):
+        code = self._service_codes.get(service_id)
+        if code is None:
+            code = len(self.services)
+            self._service_codes[service_id] = code
+            self.services.append(service_id)
+        return code
+
+    def append(self, song_index, service_id, artist_id, artist_name, song_id, title, date_added=None):
+        """
+        Add one ref row
+
+        Args:
+            song_index (int): index of the song the ref belongs to
+            service_id (str): service of the ref
+            artist_id (str): service_artist_id
+            artist_name (str): service_artist_name
+            song_id (str): service_song_id
+            title (str): service_song_title
+            date_added (str, optional): date the song was added on the service
+        """
+        self.song_index.append(song_index)
+        self.service_code.append(self._code(service_id))
+        self.artist_id.append(artist_id)
+        self.artist_name.append(artist_name)
+        self.song_id.append(song_id)
+        self.title.append(title)
+        self.date_added.append(date_added)
+        if song_index >= self.song_count:
+            self.song_count = song_index + 1
+
+    @classmethod
+    def from_songs(cls, songs):
+        """
+        Build a table from Song objects, or a Playlist
+
+        Args:
+            songs (list): list of Song objects
+
+        Returns:
+            SongTable: one row per ref, song_index being the position of the song
+        """
+        table = cls()
+        for song_index, song in enumerate(songs):
+            for service_id, ref in (song.song_refs or {}).items():
+                table.append(
+                    song_index,
+                    service_id,
+                    ref.artist_id,
+                    ref.artist_name,
+                    ref.song_id,
+                    ref.song_title,
+                    ref.date_added,
+                )
+            table.song_count = max(table.song_count, song_index + 1)
+        return table
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build a table from database rows like the ones of Database.fetch_song_refs
+
+        Args:
+            rows (iterable): (db_song_id, service_id, artist_id, artist_name, song_id, title) tuples,
+                rows of the same db_song_id are refs of the same song
+
+        Returns:
+            SongTable: the table, db_song_ids keeps the db id of every song_index
+        """
+        table = cls()
+        table.db_song_ids = []
+        song_indices = {}
+        for db_song_id, service_id, artist_id, artist_name, song_id, title in rows:
+            song_index = song_indices.get(db_song_id)
+            if song_index is None:
+                song_index = len(table.db_song_ids)
+                song_indices[db_song_id] = song_index
+                table.db_song_ids.append(db_song_id)
+            table.append(song_index, service_id, artist_id, artist_name, song_id, title)
+        return table
+
+    @classmethod
+    def from_dicts(cls, songs):
+        """
+        Build a table from the song dictionaries returned by the plugins' pulls,
+        every dictionary is its own song
+
+        Args:
+            songs (iterable): dictionaries with service_id, artist_id, artist_name, song_id and song_title
+
+        Returns:
+            SongTable: one row per dictionary
+        """
+        table = cls()
+        for song_index, data in enumerate(songs):
+            table.append(
+                song_index,
+                data["service_id"],
+                data["artist_id"],
+                data["artist_name"],
+                data["song_id"],
+                data["song_title"],
+                data.get("date_added"),
+            )
+        return table
+
+    def __len__(self):
+        """Number of ref rows"""
+        return len(self.song_index)
+
+    def column(self, name):
+        """
+        Get a column by name, service_id is decoded
+
+        Args:
+            name (str): one of SongTable.COLUMNS
+
+        Returns:
+            list: the values of the column
+        """
+        if name == "service_id":
+            services = self.services
+            return [services[code] for code in self.service_code]
+        if name not in self.COLUMNS:
+            raise KeyError(f"Unknown column {name}")
+        return getattr(self, name)
+
+    def missing_service(self, service_id):
+        """
+        Find the songs that have no ref on a service
+
+        Args:
+            service_id (str): the service to look for
+
+        Returns:
+            list: sorted song indices missing the service
+        """
+        code = self._service_codes.get(service_id)
+        has_service = bytearray(self.song_count)
+        if code is not None:
+            for song_index, service_code in zip(self.song_index, self.service_code):
+                if service_code == code:
+                    has_service[song_index] = 1
+        return [song_index for song_index, found in enumerate(has_service) if not found]
+
+    def oldest_date_added(self):
+        """
+        Oldest date_added of every song
+
+        Returns:
+            list: date per song_index, None when no ref has a date
+        """
+        oldest = [None] * self.song_count
+        for song_index, date_added in zip(self.song_index, self.date_added):
+            if date_added is not None:
+                current = oldest[song_index]
+                if current is None or date_added < current:
+                    oldest[song_index] = date_added
+        return oldest
+
+    def to_songs(self, song_indices=None):
+        """
+        Materialise Song objects
+
+        Args:
+            song_indices (list, optional): only build these songs. Defaults to every song.
+
+        Returns:
+            list: list of Song objects ordered like song_indices
+        """
+        if song_indices is None:
+            song_indices = range(self.song_count)
+        wanted = {song_index: {} for song_index in song_indices}
+        for row, song_index in enumerate(self.song_index):
+            song_refs = wanted.get(song_index)
+            if song_refs is None:
+                continue
+            ref_data = {
+                "artist_id": self.artist_id[row],
+                "artist_name": self.artist_name[row],
+                "song_id": self.song_id[row],
+                "song_title": self.title[row],
+            }
+            if self.date_added[row] is not None:
+                ref_data["date_added"] = self.date_added[row]
+            song_refs[self.services[self.service_code[row]]] = SongRef(**ref_data)
+        return [Song(song_refs=song_refs) for song_refs in wanted.values()]
+
+    def to_playlist(self, service_id=None, playlist_refs=None, song_indices=None):
+        """
+        Materialise a Playlist, songs sharing refs are merged like with Playlist.add
+
+        Returns:
+            Playlist: the playlist of the songs
+        """
+        return Playlist(
+            service_id=service_id,
+            songs=self.to_songs(song_indices),
+            playlist_refs=playlist_refs,
+        )
@@ -1,50 +1,71 @@
-import json
 import os
-import inspect
-from functools import wraps
-from modules.settings import settings
+from modules.app.settings import settings
+from modules.utils.cache_store import CacheStore
+from modules.utils.serializers import Serializer
 
 ENABLED = settings["debug"]["api_cache"]
 CACHE_FOLDER = settings["debug"]["cache_folder"]
+# "json" with no compression keeps the cache readable for debugging
+SERIALIZER = Serializer(
+    settings["debug"].get("cache_format", "pickle"),
+    settings["debug"].get("cache_compression", "zlib"),
+)
 
-# Ensure the cache folder exists
-os.makedirs(CACHE_FOLDER, exist_ok=True)
+# Nothing is created on disk until a cached function is called with the cache enabled
+# 0 means no limit for the ttl and the sizes
+store = CacheStore(
+    os.path.join(CACHE_FOLDER, "api_cache.db"),
+    enabled=ENABLED,
+    default_ttl=settings["debug"].get("cache_ttl", 0) or None,
+    max_entries=settings["debug"].get("cache_max_entries", 0) or None,
+    max_bytes=settings["debug"].get("cache_max_bytes", 0) or None,
+    serializer=SERIALIZER,
+)
 
+# Persistent tier of the plugins' memoized searches, kept between runs unlike the api cache
+search_store = CacheStore(
+    os.path.join(CACHE_FOLDER, "search_cache.db"),
+    enabled=settings["debug"].get("search_cache", True),
+    max_entries=settings["debug"].get("cache_max_entries", 0) or None,
+    max_bytes=settings["debug"].get("cache_max_bytes", 0) or None,
+    serializer=SERIALIZER,
+)
+
+
+def cache(func=None, ttl=None, key=None):
+    """
+    Cache the results of a function in the api cache, usable as @cache or @cache(ttl=seconds)
+
+    Args:
+        func (function): function with json serializable results
+        ttl (float, optional): seconds the results stay valid. Defaults to debug.cache_ttl.
+        key (function, optional): called with the arguments, returns what the key is made of. Defaults to the arguments without self.
+    """
+    if func is None:
+        return lambda func: cache(func, ttl=ttl, key=key)
 
-def cache(func):
     # Get module or filename which should be the same
     module_name = (
         func.__module__
         if func.__module__ != "__main__"
-        else os.path.basename(inspect.stack()[1].filename).replace(".py", "")
+        else os.path.basename(func.__code__.co_filename).replace(".py", "")
     )
 
-    # Cache file path
-    cache_file = os.path.join(CACHE_FOLDER, f"{module_name}_{func.__name__}_cache.json")
-
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        # Check if cache file exists
-        if os.path.exists(cache_file):
-            with open(cache_file, "r") as f:
-                cache_data = json.load(f)
-        else:
-            cache_data = {}
-
-        # Unique key for arguments
-        key = json.dumps((args, kwargs))
+    return store.wrap(func, f"{module_name}_{func.__name__}", ttl=ttl, key=key)
 
-        # Return cached result if available
-        if key in cache_data and ENABLED:
-            print(f"Returning cached result for {func.__name__}")
-            return cache_data[key]
 
-        # Call the function and cache the result
-        result = func(*args, **kwargs)
-        cache_data[key] = result
-        with open(cache_file, "w") as f:
-            json.dump(cache_data, f, indent=4)
+def dump_stats():
+    """
+    Print the cache counters of this run
+    """
+    for cache_store in (store, search_store):
+        if cache_store.enabled and cache_store.stats:
+            print(cache_store.format_stats())
 
-        return result
 
-    return wrapper
+def close():
+    """
+    Save the access times the cache stores keep in memory and close their files
+    """
+    for cache_store in (store, search_store):
+        cache_store.close()
@@ -0,0 +1,369 @@
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from modules.utils.serializers import Serializer
+
+
+def _key_default(value):
+    """
+    json fallback for the arguments that aren't serializable, like a SongRef.
+    Only objects with a dictionary method can be part of a key, a repr can leave out
+    what tells two objects apart and give two different calls the same key.
+
+    Raises:
+        TypeError: the object can't be part of a key
+    """
+    dictionary = getattr(value, "dictionary", None)
+    if callable(dictionary):
+        return dictionary()
+    raise TypeError(
+        f"Can't build a cache key from a {type(value).__qualname__}, pass a key function to the cache"
+    )
+
+
+def make_key(args, kwargs):
+    """
+    Stable fixed size key for the arguments of a call
+
+    Returns:
+        str: hex digest of the json encoded arguments
+
+    Raises:
+        TypeError: an argument can't be part of a key, see _key_default
+    """
+    raw_key = json.dumps((args, kwargs), sort_keys=True, default=_key_default)
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def key_builder(func, key=None):
+    """
+    Build the function computing the cache key of a call to func.
+    The arguments are bound to the signature of func with their defaults,
+    so passing one by position or by name gives the same key, and self or cls is skipped.
+
+    Args:
+        func (function): the cached function, a method is expected to name its first parameter self or cls
+        key (function, optional): called with the arguments of the call, returns what the key is made of instead of them
+
+    Returns:
+        function: (args, kwargs) -> str, raising TypeError when the arguments can't make a key
+    """
+    if key is not None:
+        return lambda args, kwargs: make_key(key(*args, **kwargs), {})
+
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return make_key
+    parameters = list(signature.parameters)
+    skip = parameters[:1] if parameters[:1] in (["self"], ["cls"]) else []
+
+    def build_key(args, kwargs):
+        try:
+            bound = signature.bind(*args, **kwargs)
+        except TypeError:
+            # Let the call itself raise the error
+            return make_key(args, kwargs)
+        bound.apply_defaults()
+        arguments = {
+            name: value for name, value in bound.arguments.items() if name not in skip
+        }
+        return make_key((), arguments)
+
+    return build_key
+
+
+class CacheStore:
+    """
+    Persistent cache of function results in a single SQLite file.
+    Every lookup and write only touches one entry, nothing is read or written while disabled.
+    The file is only opened on first use.
+    Entries can expire after a per-function ttl, and the least recently used ones
+    are evicted once the store goes over max_entries or max_bytes.
+    Lookups don't write, the access times of the hits are kept in memory
+    and saved with the next write, or every ACCESS_FLUSH_SIZE hits.
+    """
+
+    ACCESS_FLUSH_SIZE = 256
+    COLUMNS = ["namespace", "key", "value", "format", "size", "expires_at", "accessed_at"]
+
+    def __init__(
+        self,
+        path,
+        enabled=True,
+        default_ttl=None,
+        max_entries=None,
+        max_bytes=None,
+        serializer=None,
+        clock=time.time,
+    ):
+        """
+        Args:
+            path (str): path to the cache database, its folder is created if needed
+            enabled (bool, optional): when False the wrapped functions are always called. Defaults to True.
+            default_ttl (float, optional): seconds an entry stays valid when wrap is not given a ttl. Defaults to forever.
+            max_entries (int, optional): number of entries kept. Defaults to no limit.
+            max_bytes (int, optional): total size of the saved values. Defaults to no limit.
+            serializer (Serializer, optional): how values are saved. Defaults to plain json.
+            clock (function, optional): time source in seconds. Defaults to time.time.
+        """
+        self.path = path
+        self.enabled = enabled
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.serializer = serializer or Serializer()
+        self.clock = clock
+        # {namespace: {"hits", "misses", "expired", "evictions"}}
+        self.stats = {}
+        self._con = None
+        self._entries = 0
+        self._bytes = 0
+        # {(namespace, key): last access time} of the hits not saved yet
+        self._accessed = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._con is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._con = sqlite3.connect(self.path, check_same_thread=False)
+            columns = [row[1] for row in self._con.execute("PRAGMA table_info(cache)")]
+            if columns and columns != self.COLUMNS:
+                # It's only a cache, an older layout is thrown away
+                self._con.execute("DROP TABLE cache")
+            self._con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB,
+                    format TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+                """
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache(accessed_at)"
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS cache_expires_at ON cache(expires_at)"
+            )
+            self._con.commit()
+            self._entries, self._bytes = self._con.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+        return self._con
+
+    def _count(self, namespace, stat, amount=1):
+        counters = self.stats.setdefault(
+            namespace, {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        )
+        counters[stat] += amount
+
+    def get(self, namespace, key):
+        """
+        Args:
+            namespace (str): usually the name of the cached function
+            key (str): key from make_key
+
+        Returns:
+            tuple: (True, value) if found and not expired, (False, None) otherwise
+        """
+        return self.get_entry(namespace, key)[:2]
+
+    def get_entry(self, namespace, key):
+        """
+        Same as get, with the time the entry expires at
+
+        Returns:
+            tuple: (True, value, expires_at) if found and not expired, (False, None, None) otherwise,
+                expires_at is None for an entry that doesn't expire
+        """
+        now = self.clock()
+        with self._lock:
+            con = self._connect()
+            row = con.execute(
+                "SELECT value, format, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None:
+                self._count(namespace, "misses")
+                return False, None, None
+            value, format, expires_at = row
+            if format != self.serializer.name:
+                # Written before the serializer setting changed
+                self._count(namespace, "misses")
+                return False, None, None
+            if expires_at is not None and expires_at <= now:
+                self._count(namespace, "expired")
+                self._count(namespace, "misses")
+                return False, None, None
+            self._accessed[(namespace, key)] = now
+            if len(self._accessed) >= self.ACCESS_FLUSH_SIZE:
+                self._flush_accessed(con)
+                con.commit()
+            self._count(namespace, "hits")
+        return True, self.serializer.loads(value), expires_at
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        Save one entry, replacing the previous value of the key, then evict entries if over the limits
+
+        Args:
+            ttl (float, optional): seconds the entry stays valid. Defaults to the store's default_ttl.
+        """
+        now = self.clock()
+        ttl = ttl if ttl is not None else self.default_ttl
+        serialized = self.serializer.dumps(value)
+        with self._lock:
+            con = self._connect()
+            previous = con.execute(
+                "SELECT size FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if previous:
+                self._entries -= 1
+                self._bytes -= previous[0]
+            con.execute(
+                """
+                INSERT OR REPLACE INTO cache(namespace, key, value, format, size, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    namespace,
+                    key,
+                    serialized,
+                    self.serializer.name,
+                    len(serialized),
+                    now + ttl if ttl else None,
+                    now,
+                ),
+            )
+            self._entries += 1
+            self._bytes += len(serialized)
+            self._accessed.pop((namespace, key), None)
+            self._flush_accessed(con)
+            self._evict(con)
+            con.commit()
+
+    def _over_limits(self):
+        return (self.max_entries and self._entries > self.max_entries) or (
+            self.max_bytes and self._bytes > self.max_bytes
+        )
+
+    def _flush_accessed(self, con):
+        """Save the access times kept in memory, does not commit"""
+        if self._accessed:
+            con.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                ((accessed_at, namespace, key) for (namespace, key), accessed_at in self._accessed.items()),
+            )
+            self._accessed.clear()
+
+    def _purge_expired(self, con):
+        """Delete the expired entries, does not commit"""
+        now = self.clock()
+        entries, size = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE expires_at <= ?", (now,)
+        ).fetchone()
+        if entries:
+            con.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            self._entries -= entries
+            self._bytes -= size
+
+    def _evict(self, con):
+        """
+        Delete the expired entries then the least recently used ones until the store fits in its limits
+        """
+        if self._over_limits():
+            self._purge_expired(con)
+        while self._over_limits():
+            oldest = con.execute(
+                "SELECT namespace, key, size FROM cache ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                break
+            for namespace, key, size in oldest:
+                if not self._over_limits():
+                    break
+                con.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+                )
+                self._entries -= 1
+                self._bytes -= size
+                self._count(namespace, "evictions")
+
+    def wrap(self, func, namespace, ttl=None, key=None):
+        """
+        Cache the results of func in this store
+
+        Args:
+            func (function): function with results the serializer can save
+            namespace (str): name the entries of func are saved under
+            ttl (float, optional): seconds the results stay valid. Defaults to the store's default_ttl.
+            key (function, optional): see key_builder. Defaults to the bound arguments.
+
+        Returns:
+            function: the wrapped function
+        """
+
+        build_key = key_builder(func, key)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+
+            try:
+                call_key = build_key(args, kwargs)
+            except TypeError:
+                # No reliable key for these arguments, the call isn't cached
+                return func(*args, **kwargs)
+            found, value = self.get(namespace, call_key)
+            if found:
+                print(f"Returning cached result for {func.__name__}")
+                return value
+
+            result = func(*args, **kwargs)
+            self.set(namespace, call_key, result, ttl=ttl)
+            return result
+
+        return wrapper
+
+    def format_stats(self):
+        """
+        Returns:
+            str: one line of hit/miss/expired/eviction counters per namespace
+        """
+        lines = []
+        for namespace, counters in sorted(self.stats.items()):
+            lookups = counters["hits"] + counters["misses"]
+            hit_rate = counters["hits"] / lookups if lookups else 0
+            lines.append(
+                f"{namespace}: {counters['hits']} hits, {counters['misses']} misses "
+                f"({hit_rate:.0%} hit rate), {counters['expired']} expired, {counters['evictions']} evictions"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        """
+        Save the pending access times, delete the expired entries and close the file
+        """
+        with self._lock:
+            if self._con is not None:
+                self._flush_accessed(self._con)
+                self._purge_expired(self._con)
+                self._con.commit()
+                self._con.close()
+                self._con = None
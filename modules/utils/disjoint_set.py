@@ -0,0 +1,74 @@
+class DisjointSet:
+    """
+    Union-find over integer elements 0..n-1 with path halving and union by size.
+    Used to group things that are connected through shared keys in near linear time.
+    """
+
+    def __init__(self, size=0):
+        """
+        Args:
+            size (int, optional): number of elements to start with. Defaults to 0.
+        """
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def add(self):
+        """
+        Add a new element in its own set
+
+        Returns:
+            int: the new element
+        """
+        element = len(self.parent)
+        self.parent.append(element)
+        self.size.append(1)
+        return element
+
+    def find(self, element):
+        """
+        Find the representative of the set containing element
+
+        Args:
+            element (int): element to look for
+
+        Returns:
+            int: the root element of the set
+        """
+        parent = self.parent
+        while parent[element] != element:
+            parent[element] = parent[parent[element]]
+            element = parent[element]
+        return element
+
+    def union(self, a, b):
+        """
+        Merge the sets containing a and b
+
+        Returns:
+            int: the root of the merged set
+        """
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def groups(self):
+        """
+        Every set as a list of elements, sets are ordered by their smallest element
+        and elements are sorted inside each set
+
+        Returns:
+            list: list of lists of elements
+        """
+        groups = {}
+        for element in range(len(self.parent)):
+            groups.setdefault(self.find(element), []).append(element)
+        return list(groups.values())
+
+    def __len__(self):
+        return len(self.parent)
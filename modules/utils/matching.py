@@ -0,0 +1,188 @@
+import re
+import unicodedata
+
+# "feat. x", "ft x", "featuring x" up to the end or the next separator
+FEATURING = re.compile(r"\b(?:feat|ft|featuring)\b\.?.*?(?=$| - |[\(\[])")
+BRACKETS = re.compile(r"[\(\[](.*?)[\)\]]")
+SEPARATORS = re.compile(r"[^\w]+")
+# Words telling a recording apart from the original one, kept by normalise
+VERSION = re.compile(
+    r"\b(?:live|remix|mix|remaster(?:ed)?|acoustic|unplugged|demo|edit|version|instrumental"
+    r"|extended|reprise|session|karaoke|acapella|sped up|slowed)\b"
+)
+
+
+def strip_diacritics(text):
+    return "".join(
+        char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)
+    )
+
+
+def _bracket(match):
+    content = match.group(1)
+    if VERSION.search(content):
+        return f" {FEATURING.sub(' ', content)} "
+    return " "
+
+
+def normalise(text):
+    """
+    Comparable form of a title or an artist name: lower case, no diacritics,
+    no featured artists and no punctuation. Bracketed parts are dropped
+    unless they tell the version, like "(Live)" or "[Remastered]".
+
+    Args:
+        text (str): title or artist name, like "Halo (Live) [feat. Beyoncé]"
+
+    Returns:
+        str: words separated by single spaces, like "halo live"
+    """
+    text = strip_diacritics(text or "").lower()
+    text = BRACKETS.sub(_bracket, text)
+    text = FEATURING.sub(" ", text)
+    return " ".join(SEPARATORS.sub(" ", text).split())
+
+
+def artist_key(artist_name):
+    """
+    Blocking key of an artist, only songs with the same key are compared
+    """
+    key = normalise(artist_name)
+    if key.startswith("the "):
+        key = key[4:]
+    return key.replace(" ", "")
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """
+    Dice coefficient of the character trigrams of two normalised strings,
+    the word order doesn't matter when both have the same words
+
+    Returns:
+        float: from 0 (nothing in common) to 1 (same words)
+    """
+    if a == b or sorted(a.split()) == sorted(b.split()):
+        return 1.0
+    trigrams_a, trigrams_b = trigrams(a), trigrams(b)
+    if not trigrams_a or not trigrams_b:
+        return 0.0
+    return 2 * len(trigrams_a & trigrams_b) / (len(trigrams_a) + len(trigrams_b))
+
+
+def song_similarity(title_a, artist_a, title_b, artist_b):
+    """
+    Weighted similarity of two songs, the title counts for 3/4 of the score
+
+    Returns:
+        float: from 0 to 1
+    """
+    title_score = similarity(normalise(title_a), normalise(title_b))
+    if artist_key(artist_a) == artist_key(artist_b):
+        artist_score = 1.0
+    else:
+        artist_score = similarity(normalise(artist_a), normalise(artist_b))
+    return 0.75 * title_score + 0.25 * artist_score
+
+
+def keyed(candidates):
+    """
+    Normalise candidates once for every song they are compared to
+
+    Args:
+        candidates (list): (song_id, title, artist_name, ...) tuples, like Database.fetch_service_refs rows
+
+    Returns:
+        list: (title_key, artist_key, candidate) tuples
+    """
+    return [(normalise(candidate[1]), artist_key(candidate[2]), candidate) for candidate in candidates]
+
+
+def block_by_artist(candidates):
+    """
+    Args:
+        candidates (list): (song_id, title, artist_name, ...) tuples, like Database.fetch_service_refs rows
+
+    Returns:
+        dict: {artist_key: [(title_key, artist_key, candidate), ...]}
+    """
+    blocks = {}
+    for entry in keyed(candidates):
+        blocks.setdefault(entry[1], []).append(entry)
+    return blocks
+
+
+def _best_match(title_key, song_artist_key, entries, close):
+    exact = [
+        candidate
+        for candidate_title_key, candidate_artist_key, candidate in entries
+        if title_key and candidate_title_key == title_key and candidate_artist_key == song_artist_key
+    ]
+    if exact:
+        # Several songs on the service with the same title and artist, like two releases
+        if any(candidate[5:] != exact[0][5:] for candidate in exact[1:]):
+            return "ambiguous", exact[0], 1.0
+        return "matched", exact[0], 1.0
+
+    best_score, best_candidate = 0, None
+    for candidate_title_key, candidate_artist_key, candidate in entries:
+        if candidate_artist_key == song_artist_key:
+            artist_score = 1.0
+        else:
+            artist_score = similarity(candidate_artist_key, song_artist_key)
+        score = 0.75 * similarity(title_key, candidate_title_key) + 0.25 * artist_score
+        if score > best_score:
+            best_score, best_candidate = score, candidate
+    if best_candidate is None or best_score < close:
+        return "unmatched", None, 0
+    return "ambiguous", best_candidate, best_score
+
+
+def best_match(title, artist_name, candidates, close=0.6):
+    """
+    Find the candidate of a song. Following the "no automatic fixes" rule of the project,
+    only a candidate with the same normalised title and artist, version included, is a match.
+    A close candidate is only proposed as ambiguous, to be confirmed by the service or by hand.
+
+    Args:
+        title (str): title of the song
+        artist_name (str): artist of the song
+        candidates (list): (song_id, title, artist_name, ...) tuples
+        close (float, optional): minimum similarity of an ambiguous candidate. Defaults to 0.6.
+
+    Returns:
+        tuple: ("matched", candidate, 1.0), ("ambiguous", candidate, score) or ("unmatched", None, 0)
+    """
+    return _best_match(normalise(title), artist_key(artist_name), keyed(candidates), close)
+
+
+def match_songs(songs, candidates, close=0.6, fallback=None):
+    """
+    Propose links between unidentified songs and songs already on a service in one pass.
+    Candidates are blocked by artist so every song is only compared to the songs of its artist.
+
+    Args:
+        songs (list): unidentified songs from Database.fetch_unidentified_songs
+        candidates (list): rows of Database.fetch_service_refs
+        close (float, optional): see best_match. Defaults to 0.6.
+        fallback (function, optional): called with a song whose artist has no block, returns candidates for it
+
+    Returns:
+        dict: {"matched": [(song, candidate, score)], "ambiguous": [...], "unmatched": [...]}
+    """
+    blocks = block_by_artist(candidates)
+    results = {"matched": [], "ambiguous": [], "unmatched": []}
+    for song in songs:
+        song_artist_key = artist_key(song.get("input_artist_name"))
+        entries = blocks.get(song_artist_key)
+        if entries is None and fallback is not None:
+            entries = keyed(fallback(song))
+        status, candidate, score = _best_match(
+            normalise(song.get("input_song_title")), song_artist_key, entries or [], close
+        )
+        results[status].append((song, candidate, score))
+    return results
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+
+from modules.utils.cache_store import key_builder
+
+
+class LRUCache:
+    """
+    Thread safe in memory cache keeping the maxsize most recently used entries,
+    each entry can have its own expiry time.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Args:
+            maxsize (int, optional): number of entries kept. Defaults to 1024.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        """
+        Args:
+            key (str): key of the entry
+            now (float): current time, compared to the expiry time of the entry
+
+        Returns:
+            tuple: (True, value) if found and not expired, (False, None) otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def memoize(
+    func,
+    namespace,
+    store=None,
+    maxsize=1024,
+    ttl=None,
+    negative_ttl=None,
+    is_negative=None,
+    key=None,
+    clock=time.time,
+):
+    """
+    Two tier memoization: an in memory LRU in front of a persistent CacheStore.
+    Results for which is_negative is True, like a search that found nothing,
+    are kept for negative_ttl instead of ttl so they get retried sooner.
+    An entry read from the store keeps the expiry time it has there, and concurrent
+    calls with the same arguments wait for the first one instead of calling func again.
+
+    Args:
+        func (function): function with json serializable results, usually a bound method
+        namespace (str): name the entries are saved under in the store
+        store (CacheStore, optional): persistent tier, skipped when None or disabled
+        maxsize (int, optional): entries kept in memory. Defaults to 1024.
+        ttl (float, optional): seconds a result stays valid. Defaults to forever.
+        negative_ttl (float, optional): seconds a negative result stays valid. Defaults to ttl.
+        is_negative (function, optional): tells if a result is negative. Defaults to never.
+        key (function, optional): see key_builder. Defaults to the bound arguments.
+        clock (function, optional): time source in seconds, the same as the store's. Defaults to time.time.
+
+    Returns:
+        function: the wrapped function, with its in memory tier as .memory
+    """
+    memory = LRUCache(maxsize)
+    build_key = key_builder(func, key)
+    # {key: Future} of the calls running
+    running = {}
+    lock = threading.Lock()
+
+    def load(call_key, args, kwargs):
+        found = False
+        if store is not None and store.enabled:
+            found, value, expires_at = store.get_entry(namespace, call_key)
+        if not found:
+            value = func(*args, **kwargs)
+            entry_ttl = ttl
+            if negative_ttl is not None and is_negative and is_negative(value):
+                entry_ttl = negative_ttl
+            expires_at = clock() + entry_ttl if entry_ttl else None
+            if store is not None and store.enabled:
+                store.set(namespace, call_key, value, ttl=entry_ttl)
+        memory.set(call_key, value, expires_at)
+        return value
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            call_key = build_key(args, kwargs)
+        except TypeError:
+            # No reliable key for these arguments, the call isn't memoized
+            return func(*args, **kwargs)
+        found, value = memory.get(call_key, clock())
+        if found:
+            return value
+
+        with lock:
+            # Another call may have finished since the lookup
+            found, value = memory.get(call_key, clock())
+            if found:
+                return value
+            future = running.get(call_key)
+            first = future is None
+            if first:
+                future = running[call_key] = Future()
+        if not first:
+            return future.result()
+        try:
+            value = load(call_key, args, kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with lock:
+                del running[call_key]
+        future.set_result(value)
+        return value
+
+    wrapper.memory = memory
+    return wrapper
@@ -0,0 +1,88 @@
+import json
+import lzma
+import pickle
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _json_dumps(value):
+    return json.dumps(value).encode()
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+# name: (dumps, loads), dumps returns bytes
+FORMATS = {
+    "json": (_json_dumps, json.loads),
+    # Only for a local cache, never load a pickle from somewhere else
+    "pickle": (lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+    "msgpack": (_msgpack_dumps, _msgpack_loads),
+}
+
+# name: (compress, decompress)
+COMPRESSIONS = {
+    "none": (None, None),
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class Serializer:
+    """
+    Turns cached values into bytes and back, with an optional compression
+    """
+
+    def __init__(self, format="json", compression="none"):
+        """
+        Args:
+            format (str, optional): one of FORMATS. Defaults to "json", readable with the sqlite3 shell.
+            compression (str, optional): one of COMPRESSIONS. Defaults to "none".
+
+        Raises:
+            ValueError: unknown format or compression, or msgpack isn't installed
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown cache format {format!r}, use one of {list(FORMATS)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown cache compression {compression!r}, use one of {list(COMPRESSIONS)}"
+            )
+        if format == "msgpack" and msgpack is None:
+            raise ValueError("The msgpack cache format needs the msgpack package")
+        self.format = format
+        self.compression = compression
+        self._dumps, self._loads = FORMATS[format]
+        self._compress, self._decompress = COMPRESSIONS[compression]
+
+    @property
+    def name(self):
+        """
+        Saved with every entry so entries written in another format are never misread
+        """
+        return f"{self.format}+{self.compression}"
+
+    def dumps(self, value):
+        data = self._dumps(value)
+        if self._compress:
+            data = self._compress(data)
+        # Plain json stays text so the cache can be read as is
+        if self.format == "json" and not self._compress:
+            return data.decode()
+        return data
+
+    def loads(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._decompress:
+            data = self._decompress(data)
+        return self._loads(data)
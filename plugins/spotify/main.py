@@ -1,10 +1,18 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-from modules.cache import cache
+from modules.utils.cache import cache, search_store
+from modules.utils.memo import memoize
 from rich.pretty import pprint
 import re
-from plugins.spotify.settings import SERVICE_ID
+from plugins.spotify.settings import SERVICE_ID, SEARCH_TTL, SEARCH_NEGATIVE_TTL
+
+def normalise_query(query):
+    """
+    Lower case query with single spaces, so equivalent searches share their memo entry
+    """
+    return " ".join(query.lower().split())
+
 
 class Plugin:
     def __init__(self):
@@ -14,6 +22,15 @@ class Plugin:
         scope = "user-library-read, playlist-read-private, playlist-read-collaborative, playlist-modify-public, playlist-modify-private"
         self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scope))
         print("logged into spotify!")
+        # Same queries come back across runs and from duplicate rows of the database
+        self._search = memoize(
+            self._search,
+            f"{SERVICE_ID}_search",
+            store=search_store,
+            ttl=SEARCH_TTL,
+            negative_ttl=SEARCH_NEGATIVE_TTL,
+            is_negative=lambda raw_data: not raw_data["tracks"]["items"],
+        )
 
     def ping(self):
         print(SERVICE_ID)
@@ -22,47 +39,97 @@ class Plugin:
         if not track:
             return None
 
-        artists = track.get("artists", [{}])
-
-        return Song(
-    service_id=SERVICE_ID,
-    song_refs={
-        SERVICE_ID: SongRef (
-            artist_id= artists[0].get("id"),
-            artist_name= artists[0].get("name"),
-            song_id= track.get("id"),
-            song_title= rack.get("name"),
-            date_added= "2024-03-18",
-            song_metadata ={},
-        ),
-    },
-)
-    
+        artists = track.get("artists") or [{}]
+
+        return {
+            "service_id": SERVICE_ID,
+            "artist_id": artists[0].get("id"),
+            "artist_name": artists[0].get("name"),
+            "song_id": track.get("id"),
+            "song_title": track.get("name"),
+        }
+
+    def iter_songs(self, checkpoints=None):
+        """
+        Stream the liked songs one page of the api at a time, newest first
+
+        Args:
+            checkpoints (dict, optional): checkpoints of the last sync from Database.fetch_checkpoints, updated in place.
+                Paging stops at the newest song of the last sync, unless the track count
+                shows that liked songs were removed since then. Defaults to a full sync.
+
+        Yields:
+            list: parsed songs of a page
+        """
+        checkpoint = None
+        known_song_id = None
+        known_count = None
+        if checkpoints is not None:
+            checkpoint = checkpoints.setdefault("liked_songs", {})
+            known_song_id = checkpoint.get("last_item_id")
+            known_count = checkpoint.get("track_count")
 
-    @cache
-    def pull_songs(self):
-        results = []
         raw_data = self.sp.current_user_saved_tracks(limit=50)
+        total = raw_data.get("total") if raw_data else None
+        if checkpoint is not None and raw_data:
+            checkpoint["track_count"] = total
+            if raw_data["items"]:
+                checkpoint["added_at"] = raw_data["items"][0].get("added_at")
+                checkpoint["last_item_id"] = (raw_data["items"][0].get("track") or {}).get("id")
+        new_songs = 0
         while raw_data:
+            page = []
+            reached_known_songs = False
             for raw_song in raw_data["items"]:
+                # liked songs are newest first, everything from the last known one on is already saved
+                if known_song_id and (raw_song.get("track") or {}).get("id") == known_song_id:
+                    # The count only adds up if no liked song was removed since the last sync
+                    if known_count is None or total == known_count + new_songs:
+                        reached_known_songs = True
+                        break
+                    print("liked songs were removed since the last sync, pulling all of them")
+                    known_song_id = None
+                new_songs += 1
                 song = self.parse_song_data(raw_song["track"])
                 if song:
-                    results.append(song)
-            if raw_data["next"]:
+                    page.append(song)
+            yield page
+            if raw_data["next"] and not reached_known_songs:
                 raw_data = self.sp.next(raw_data)
             else:
                 raw_data = None
-        return results
 
     @cache
-    def pull_playlists(self):
-        results = []
+    def pull_songs(self):
+        return [song for page in self.iter_songs() for song in page]
+
+    def iter_playlists(self, checkpoints=None):
+        """
+        Stream the saved playlists, each one is yielded as soon as all of its tracks are fetched
+
+        Args:
+            checkpoints (dict, optional): checkpoints of the last sync from Database.fetch_checkpoints, updated in place.
+                Playlists with the same snapshot_id as last time are skipped, a playlist without one
+                is always pulled. Defaults to a full sync.
+
+        Yields:
+            list: a page with one playlist dictionary
+        """
         spotify_user_id = self.sp.current_user()["id"]
         raw_data = self.sp.user_playlists(user=spotify_user_id, limit=50)
 
         while raw_data:
             for playlist in raw_data["items"]:
                 if playlist["owner"]["id"] == spotify_user_id or self.ALL_SAVED_PLAYLISTS:
+                    if checkpoints is not None:
+                        checkpoint = checkpoints.setdefault(f"playlist:{playlist['id']}", {})
+                        # Without a snapshot_id there is nothing telling the playlist didn't change
+                        snapshot_id = playlist.get("snapshot_id")
+                        if snapshot_id is not None and checkpoint.get("snapshot_id") == snapshot_id:
+                            continue
+                        checkpoint["snapshot_id"] = snapshot_id
+                        checkpoint["track_count"] = playlist.get("tracks", {}).get("total")
+
                     playlist_data = {
                         "service_id": SERVICE_ID,
                         "playlist_id": playlist["id"],
@@ -82,34 +149,41 @@ class Plugin:
                         else:
                             track_data = None
 
-                    results.append(playlist_data)
+                    yield [playlist_data]
 
             if raw_data["next"]:
                 raw_data = self.sp.next(raw_data)
             else:
                 raw_data = None
 
-        return results
+    @cache
+    def pull_playlists(self):
+        return [playlist for page in self.iter_playlists() for playlist in page]
+
+    def _search(self, query):
+        """
+        Search the best matching track, memoized on the query
+
+        Args:
+            query (str): artist name and title from normalise_query
+
+        Returns:
+            dict: raw search response
+        """
+        return self.sp.search(q=query, limit=1, type="track")
 
     def identify_song(self, song):
         result = None
         clean_title = re.sub(r"[\(\[].*?[\)\]]", "", song["input_song_title"])
         input_artist_name = song.get("input_artist_name")
         if input_artist_name:
-            raw_data = self.sp.search(
-                q=f'{song["input_artist_name"]} {clean_title}',
-                limit=1,
-                type="track",
+            raw_data = self._search(
+                normalise_query(f'{song["input_artist_name"]} {clean_title}')
             )
         else:
-            raw_data = self.sp.search(
-                q=clean_title,
-                limit=1,
-                type="track",
-            )
+            raw_data = self._search(normalise_query(clean_title))
 
         if not raw_data["tracks"]["items"]:
-            song["song_title"] = "None"
             print(f"{clean_title}, not found")
             return None
 
@@ -121,7 +195,6 @@ class Plugin:
                 pprint(
                     f'{song["input_artist_name"]} =/= {result["artist_name"].lower()} {clean_title}, not found'
                 )
-                song["song_title"] = "None"
                 return None
         db_song_id = song.get("db_song_id")
         if db_song_id:
@@ -3,6 +3,13 @@ Put all of the plugin's constants here
 """
 
 SERVICE_ID = "spotify"
+# identify_song calls per second and at once, the search api answers 429 above that
+RATE_LIMIT = 5
+RATE_BURST = 10
+IDENTIFY_WORKERS = 4
+# seconds a search result is reused, "not found" results are retried sooner
+SEARCH_TTL = 30 * 24 * 3600
+SEARCH_NEGATIVE_TTL = 24 * 3600
 
 DEFAULT_SETTINGS = {
     "enabled": True,
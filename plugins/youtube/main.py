@@ -1,10 +1,14 @@
-from modules.cache import cache
+import hashlib
+from modules.utils.cache import cache
 from rich.pretty import pprint
 from ytmusicapi import YTMusic, OAuthCredentials
 from plugins.youtube.settings import SERVICE_ID, REQUEST_SIZE_LIMIT
 
 
 class Plugin:
+    SERVICE_ID = SERVICE_ID
+    REQUEST_SIZE_LIMIT = REQUEST_SIZE_LIMIT
+
     def __init__(self, ):
         self.yt = YTMusic("browser.json")
     
@@ -21,16 +25,54 @@ class Plugin:
         }
         return parsed_data
     
+    def iter_songs(self, checkpoints=None, page_size=100):
+        """
+        Stream the liked songs, ytmusicapi returns them all at once so they are only parsed one page at a time
+
+        Args:
+            checkpoints (dict, optional): checkpoints of the last sync from Database.fetch_checkpoints, updated in place.
+                Stops at the newest song of the last sync, unless the track count shows that
+                liked songs were removed since then. Defaults to a full sync.
+
+        Yields:
+            list: parsed songs of a page
+        """
+        tracks = self.yt.get_liked_songs(self.REQUEST_SIZE_LIMIT)["tracks"]
+        if checkpoints is not None:
+            checkpoint = checkpoints.setdefault("liked_songs", {})
+            known_song_id = checkpoint.get("last_item_id")
+            known_count = checkpoint.get("track_count")
+            checkpoint["track_count"] = len(tracks)
+            if tracks:
+                checkpoint["last_item_id"] = tracks[0]["videoId"]
+            # liked songs are newest first, everything after the last known one is already saved
+            for i, song in enumerate(tracks):
+                if known_song_id and song["videoId"] == known_song_id:
+                    # The count only adds up if no liked song was removed since the last sync
+                    if known_count is None or len(tracks) == known_count + i:
+                        tracks = tracks[:i]
+                    else:
+                        print("liked songs were removed since the last sync, pulling all of them")
+                    break
+        for start in range(0, len(tracks), page_size):
+            yield [self.parse_song_data(song) for song in tracks[start : start + page_size]]
+
     @cache
     def pull_songs(self):
-        clean_songs = []
-        for song in self.yt.get_liked_songs(self.REQUEST_SIZE_LIMIT)["tracks"]:
-            clean_songs.append(self.parse_song_data(song))
-        return clean_songs
-    
-    @cache
-    def pull_playlists(self):
-        clean_playlists = []
+        return [song for page in self.iter_songs() for song in page]
+
+    def iter_playlists(self, checkpoints=None):
+        """
+        Stream the library playlists, each one is yielded as soon as it is fetched
+
+        Args:
+            checkpoints (dict, optional): checkpoints of the last sync from Database.fetch_checkpoints, updated in place.
+                YouTube has no snapshot id, a hash of the track ids is saved in its place and
+                playlists with the same tracks as last time are skipped. Defaults to a full sync.
+
+        Yields:
+            list: a page with one playlist dictionary
+        """
         for playlist in self.yt.get_library_playlists(self.REQUEST_SIZE_LIMIT):
             playlist_data = {
                 "service_id": self.SERVICE_ID,
@@ -41,11 +83,24 @@ class Plugin:
             raw_playlist_data = self.yt.get_playlist(
                 playlist_data["playlist_id"], self.REQUEST_SIZE_LIMIT
             )
+            if checkpoints is not None:
+                checkpoint = checkpoints.setdefault(f"playlist:{playlist['playlistId']}", {})
+                # The track count alone misses a track replaced by another one
+                tracks_hash = hashlib.sha256(
+                    "\n".join(str(song.get("videoId")) for song in raw_playlist_data["tracks"]).encode()
+                ).hexdigest()
+                if checkpoint.get("snapshot_id") == tracks_hash:
+                    continue
+                checkpoint["snapshot_id"] = tracks_hash
+                checkpoint["track_count"] = len(raw_playlist_data["tracks"])
             for song in raw_playlist_data["tracks"]:
                 playlist_data["songs"].append(self.parse_song_data(song))
-            clean_playlists.append(playlist_data)
-        return clean_playlists
-    
+            yield [playlist_data]
+
+    @cache
+    def pull_playlists(self):
+        return [playlist for page in self.iter_playlists() for playlist in page]
+
     def identify_songs(self, unidentified_songs):
         pass
 
@@ -4,6 +4,10 @@ Put all of the plugin's constants here
 
 SERVICE_ID = "youtube"
 REQUEST_SIZE_LIMIT = 10**5
+# identify_song calls per second and at once
+RATE_LIMIT = 2
+RATE_BURST = 5
+IDENTIFY_WORKERS = 2
 
 DEFAULT_SETTINGS = {
     "enabled": True,
@@ -0,0 +1,238 @@
+import os
+import sqlite3
+
+import pytest
+
+from modules.utils.cache_store import CacheStore, key_builder, make_key
+
+
+def counted(results):
+    calls = []
+
+    def func(*args, **kwargs):
+        calls.append((args, kwargs))
+        return results
+
+    return func, calls
+
+
+def test_cached_result(tmp_path):
+    store = CacheStore(str(tmp_path / "cache" / "api_cache.db"))
+    func, calls = counted({"tracks": [1, 2, 3]})
+    cached = store.wrap(func, "tests_func")
+
+    assert cached("playlist", limit=50) == {"tracks": [1, 2, 3]}
+    assert cached("playlist", limit=50) == {"tracks": [1, 2, 3]}
+    assert cached("playlist", limit=10) == {"tracks": [1, 2, 3]}
+    assert len(calls) == 2
+
+
+def test_persistent(tmp_path):
+    path = str(tmp_path / "api_cache.db")
+    store = CacheStore(path)
+    func, calls = counted([1])
+    store.wrap(func, "tests_func")("a")
+    store.close()
+
+    store = CacheStore(path)
+    assert store.wrap(func, "tests_func")("a") == [1]
+    assert len(calls) == 1
+    # Same arguments in another namespace are another entry
+    store.wrap(func, "tests_other")("a")
+    assert len(calls) == 2
+
+
+def test_disabled_does_no_io(tmp_path):
+    path = str(tmp_path / "cache" / "api_cache.db")
+    store = CacheStore(path, enabled=False)
+    func, calls = counted([1])
+    cached = store.wrap(func, "tests_func")
+    cached("a")
+    cached("a")
+    assert len(calls) == 2
+    assert not os.path.exists(os.path.dirname(path))
+
+
+def test_key_is_stable():
+    assert make_key(("a",), {"x": 1, "y": 2}) == make_key(("a",), {"y": 2, "x": 1})
+    assert len(make_key(("a" * 10000,), {})) == 64
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl(tmp_path):
+    clock = FakeClock()
+    store = CacheStore(str(tmp_path / "api_cache.db"), default_ttl=100, clock=clock)
+    func, calls = counted([1])
+    short = store.wrap(func, "tests_short", ttl=10)
+    default = store.wrap(func, "tests_default")
+
+    short("a")
+    default("a")
+    clock.now += 50
+    short("a")
+    default("a")
+    assert len(calls) == 3
+    clock.now += 100
+    default("a")
+    assert len(calls) == 4
+    assert store.stats["tests_short"]["expired"] == 1
+    assert store.stats["tests_default"] == {"hits": 1, "misses": 2, "expired": 1, "evictions": 0}
+
+
+def test_lru_eviction(tmp_path):
+    clock = FakeClock()
+    store = CacheStore(str(tmp_path / "api_cache.db"), max_entries=2, clock=clock)
+    func, calls = counted([1])
+    cached = store.wrap(func, "tests_func")
+
+    for argument in ["a", "b"]:
+        cached(argument)
+        clock.now += 1
+    # "a" becomes the most recently used so "b" is evicted
+    cached("a")
+    clock.now += 1
+    cached("c")
+    assert len(calls) == 3
+    cached("a")
+    assert len(calls) == 3
+    cached("b")
+    assert len(calls) == 4
+    assert store.stats["tests_func"]["evictions"] == 2
+
+
+def test_hits_do_not_write(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "api_cache.db")
+    store = CacheStore(path, clock=clock)
+    cached = store.wrap(counted([1])[0], "tests_func")
+    cached("a")
+    changes = store._con.total_changes
+    clock.now += 10
+    cached("a")
+    assert store._con.total_changes == changes
+    # The access time is saved on close
+    store.close()
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT accessed_at FROM cache").fetchone()[0] == clock.now
+    con.close()
+
+
+def test_expired_entries_are_deleted(tmp_path):
+    clock = FakeClock()
+    store = CacheStore(str(tmp_path / "api_cache.db"), max_entries=3, clock=clock)
+    func, calls = counted([1])
+    short = store.wrap(func, "tests_short", ttl=10)
+    long = store.wrap(func, "tests_long")
+    short("a")
+    short("b")
+    long("a")
+    clock.now += 20
+    # Over the limit, the expired entries go before the least recently used one
+    long("b")
+    assert store._entries == 2
+    assert store.stats["tests_long"]["evictions"] == 0
+    long("a")
+    assert len(calls) == 4
+
+
+def test_max_bytes(tmp_path):
+    path = str(tmp_path / "api_cache.db")
+    store = CacheStore(path, max_bytes=250)
+    func, calls = counted("x" * 100)
+    cached = store.wrap(func, "tests_func")
+    for argument in range(5):
+        cached(argument)
+    store.close()
+
+    # The sizes are read back when the file is opened again
+    store = CacheStore(path, max_bytes=250)
+    assert store.wrap(func, "tests_func")(4) == "x" * 100
+    assert store._bytes <= 250 and store._entries == 2
+    assert "tests_func: 1 hits, 0 misses (100% hit rate)" in store.format_stats()
+
+
+def test_old_layout_is_replaced(tmp_path):
+    path = str(tmp_path / "api_cache.db")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE cache (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))")
+    con.execute("INSERT INTO cache VALUES ('tests_func', 'key', '1')")
+    con.commit()
+    con.close()
+
+    store = CacheStore(path)
+    assert store.get("tests_func", "key") == (False, None)
+    store.set("tests_func", "key", 2)
+    assert store.get("tests_func", "key") == (True, 2)
+
+
+class Client:
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, limit=1, kind="track"):
+        self.calls += 1
+        return [query, limit, kind]
+
+
+def test_key_skips_self():
+    build_key = key_builder(Client.search)
+    # Every run has another Plugin instance, the key must not depend on it
+    assert build_key((Client(), "a"), {}) == build_key((Client(), "a"), {})
+    assert build_key((Client(), "a"), {}) != build_key((Client(), "b"), {})
+
+
+def test_key_canonical_arguments():
+    build_key = key_builder(Client.search)
+    client = Client()
+    key = build_key((client, "a"), {})
+    assert build_key((client, "a", 1), {}) == key
+    assert build_key((client,), {"kind": "track", "query": "a"}) == key
+    assert build_key((client, "a", 2), {}) != key
+
+
+def test_custom_key(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.db"))
+    client = Client()
+    search = store.wrap(
+        Client.search, "tests_search", key=lambda self, query, **kwargs: query.lower()
+    )
+    assert search(client, "Artist Title") == ["Artist Title", 1, "track"]
+    assert search(client, "artist title", limit=5) == ["Artist Title", 1, "track"]
+    assert client.calls == 1
+
+
+def test_unserializable_arguments():
+    class Song:
+        def dictionary(self):
+            return {"song_title": "title"}
+
+    assert make_key((Song(),), {}) == make_key(({"song_title": "title"},), {})
+    # Two objects with the same repr must not share a key
+    with pytest.raises(TypeError):
+        make_key((object(),), {})
+
+
+def test_unserializable_arguments_are_not_cached(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.db"))
+    func, calls = counted([1])
+    cached = store.wrap(func, "tests_func")
+    first, second = object(), object()
+    cached(first)
+    cached(second)
+    cached(first)
+    assert len(calls) == 3
+    assert "tests_func" not in store.stats
+
+
+if __name__ == "__main__":
+    test_key_is_stable()
+    test_key_skips_self()
+    test_key_canonical_arguments()
+    test_unserializable_arguments()
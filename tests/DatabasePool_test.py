@@ -0,0 +1,100 @@
+import gc
+import sqlite3
+import threading
+import pytest
+from modules.app.database_pool import DatabasePool
+
+
+def songs(service_id, count):
+    return [
+        {
+            "service_id": service_id,
+            "artist_id": f"aid{service_id}{i}",
+            "artist_name": f"na{i}",
+            "song_id": f"sid{service_id}{i}",
+            "song_title": f"ti{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def test_parallel_writes_and_reads(tmp_path):
+    pool = DatabasePool(["spotify", "youtube"], str(tmp_path / "library.db"))
+    counts = []
+
+    def pull(service_id):
+        for i in range(5):
+            pool.submit("insert_songs", songs(service_id, 20 * (i + 1)))
+        reader = pool.reader()
+        reader.cur.execute("SELECT COUNT(*) FROM songs_source_info")
+        counts.append(reader.cur.fetchone()[0])
+
+    threads = [threading.Thread(target=pull, args=(s,)) for s in ["spotify", "youtube"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Waits for everything queued before it
+    assert pool.write("fetch_unidentified_songs", "youtube") == []
+    reader = pool.reader()
+    reader.cur.execute("SELECT COUNT(*) FROM songs_source_info")
+    assert reader.cur.fetchone()[0] == 200
+    # Every page is committed at once, a reader never sees part of one
+    assert len(counts) == 2 and all(count % 20 == 0 for count in counts)
+    pool.close()
+
+
+def test_readers_are_per_thread(tmp_path):
+    with DatabasePool(["spotify"], str(tmp_path / "library.db")) as pool:
+        other = []
+        thread = threading.Thread(target=lambda: other.append(pool.reader()))
+        thread.start()
+        thread.join()
+        assert pool.reader() is pool.reader()
+        assert other[0] is not pool.reader()
+
+
+def test_reader_closed_with_its_thread(tmp_path):
+    with DatabasePool(["spotify"], str(tmp_path / "library.db")) as pool:
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(pool.reader().con))
+        thread.start()
+        thread.join()
+        gc.collect()
+        with pytest.raises(sqlite3.ProgrammingError):
+            connections[0].execute("SELECT 1")
+        con = pool.reader().con
+    with pytest.raises(sqlite3.ProgrammingError):
+        con.execute("SELECT 1")
+
+
+def test_path_with_uri_characters(tmp_path):
+    folder = tmp_path / "music?#100%"
+    folder.mkdir()
+    with DatabasePool(["spotify"], str(folder / "library.db")) as pool:
+        pool.write("insert_songs", songs("spotify", 3))
+        pool.reader().cur.execute("SELECT COUNT(*) FROM songs")
+        assert pool.reader().cur.fetchone()[0] == 3
+
+
+def test_memory_database_is_refused():
+    with pytest.raises(ValueError):
+        DatabasePool(["spotify"], ":memory:")
+
+
+def test_consume_streams_pages(tmp_path):
+    with DatabasePool(["spotify"], str(tmp_path / "library.db")) as pool:
+        seen = []
+
+        def pages():
+            all_songs = songs("spotify", 40)
+            for start in range(0, 40, 10):
+                yield all_songs[start : start + 10]
+                reader = pool.reader()
+                reader.cur.execute("SELECT COUNT(*) FROM songs")
+                seen.append(reader.cur.fetchone()[0])
+
+        assert pool.consume("insert_songs", pages(), max_pending=1) == 40
+        # With one pending page, the page before the last one is always saved while the pull goes on
+        assert all(count >= 10 * i for i, count in enumerate(seen))
@@ -0,0 +1,446 @@
+import os
+import random
+import sqlite3
+import pytest
+import modules.app.database as database
+from modules.app.database import Database, HOT_QUERIES, MIGRATIONS, SELECT_UNIDENTIFIED_SONGS, fts_query
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+"""
+Quick and dirty song template
+{
+    "service_id": "--",
+    "artist_id": "aid--__",
+    "artist_name": "na__",
+    "song_id": "sid--__",
+    "song_title": "ti__",
+}
+"""
+
+
+def song(service_id, artist, title, artist_id=None, song_id=None):
+    return {
+        "service_id": service_id,
+        "artist_id": artist_id or f"aid{service_id}{artist}",
+        "artist_name": f"na{artist}",
+        "song_id": song_id or f"sid{service_id}{artist}{title}",
+        "song_title": f"ti{title}",
+    }
+
+
+first_batch = [
+    song("spotify", "a", "1"),
+    song("youtube", "a", "1"),
+    song("spotify", "b", "2"),
+    # homonym of b on spotify
+    song("spotify", "b", "3", artist_id="aidspotifyb2"),
+    # same song twice
+    song("spotify", "a", "1"),
+    # same artist and title, another spotify id
+    song("spotify", "a", "1", song_id="sidspotifya1bis"),
+    None,
+    song("youtube", "c", "4"),
+]
+
+second_batch = [
+    song("youtube", "b", "2"),
+    song("spotify", "b", "2", artist_id="aidspotifyb3"),
+    song("spotify", "a", "5"),
+    song("spotify", "a", "1", song_id="sidspotifya1bis"),
+    {**song("youtube", "b", "3"), "db_song_id": 3},
+    song("youtube", "c", "4"),
+]
+
+
+def dump(db):
+    tables = {}
+    for table in ["artists", "artists_source_info", "songs", "songs_source_info"]:
+        db.cur.execute(f"SELECT * FROM {table} ORDER BY rowid")
+        tables[table] = db.cur.fetchall()
+    return tables
+
+
+def test_bulk_insert_matches_per_row():
+    per_row_db = Database(["spotify", "youtube"])
+    bulk_db = Database(["spotify", "youtube"])
+
+    for batch in [first_batch, second_batch]:
+        per_row_db.insert_songs(batch, bulk=False)
+        bulk_db.insert_songs(batch, bulk=True)
+        assert dump(bulk_db) == dump(per_row_db)
+
+
+def test_bulk_insert_returns_song_ids():
+    db = Database(["spotify", "youtube"])
+    song_ids = db.insert_songs_bulk(first_batch)
+    assert song_ids[0] == song_ids[1] == song_ids[4]
+    assert song_ids[6] is None
+    assert song_ids[7] == db.insert_song(song("youtube", "c", "4"))
+
+    # The ids are the ones sqlite gave, even after the last rows were deleted
+    db.cur.execute("DELETE FROM songs_source_info WHERE song_id = (SELECT MAX(id) FROM songs)")
+    db.cur.execute("DELETE FROM songs WHERE id = (SELECT MAX(id) FROM songs)")
+    new_songs = [song("spotify", "z", str(i)) for i in range(3)]
+    for song_id, data in zip(db.insert_songs_bulk(new_songs), new_songs):
+        db.cur.execute(
+            "SELECT song_id FROM songs_source_info WHERE service_id = 'spotify' AND service_song_id = ?",
+            (data["song_id"],),
+        )
+        assert db.cur.fetchone()[0] == song_id
+        db.cur.execute("SELECT title FROM songs WHERE id = ?", (song_id,))
+        assert db.cur.fetchone()[0] == data["song_title"]
+
+
+def query_plan(db, query):
+    db.cur.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count("?"))
+    return [row[3] for row in db.cur.fetchall()]
+
+
+def test_hot_queries_use_indexes():
+    db = Database(["spotify", "youtube"])
+    for name, query in HOT_QUERIES.items():
+        plan = query_plan(db, query)
+        assert plan, name
+        for step in plan:
+            assert not step.startswith("SCAN"), f"{name}: {step}"
+            assert "INDEX" in step, f"{name}: {step}"
+
+
+def test_migrate_sets_user_version(tmp_path):
+    path = str(tmp_path / "library.db")
+    Database(["spotify"], path).con.close()
+    # Opening it again must not re-run anything
+    db = Database(["spotify"], path)
+    db.cur.execute("PRAGMA user_version")
+    assert db.cur.fetchone()[0] == len(MIGRATIONS)
+
+
+def load_fixture(tmp_path, name):
+    """Create a library.db from one of the sql dumps of tests/fixtures"""
+    path = str(tmp_path / "library.db")
+    con = sqlite3.connect(path)
+    with open(os.path.join(FIXTURES, name)) as f:
+        con.executescript(f.read())
+    con.close()
+    return path
+
+
+def test_migrate_from_v0(tmp_path):
+    path = load_fixture(tmp_path, "library_v0.sql")
+    db = Database(["spotify", "youtube"], path)
+
+    db.cur.execute("PRAGMA user_version")
+    assert db.cur.fetchone()[0] == len(MIGRATIONS)
+    db.cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    assert "songs_source_info_service_song_id" in {row[0] for row in db.cur.fetchall()}
+    # The data is still there and usable
+    assert db.insert_song(song("youtube", "b", "2")) == 2
+    db.cur.execute("SELECT COUNT(*) FROM playlist_songs")
+    assert db.cur.fetchone()[0] == 2
+    # Playlists keep the order their songs were inserted in, with room between the positions
+    assert db.fetch_playlist_songs(1) == [2, 1]
+    db.cur.execute("SELECT position FROM playlist_songs WHERE playlist_id = 1 ORDER BY position")
+    assert [row[0] for row in db.cur.fetchall()] == [0, database.POSITION_GAP]
+    # Running the step again changes nothing
+    database.rebuild_playlist_songs(db.cur)
+    db.cur.execute("SELECT position FROM playlist_songs WHERE playlist_id = 1 ORDER BY position")
+    assert [row[0] for row in db.cur.fetchall()] == [0, database.POSITION_GAP]
+
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    path = load_fixture(tmp_path, "library_v0.sql")
+    monkeypatch.setattr(
+        database, "MIGRATIONS", MIGRATIONS + [["CREATE TABLE broken (id)", "NOT SQL"]]
+    )
+    with pytest.raises(sqlite3.OperationalError):
+        Database(["spotify", "youtube"], path)
+
+    con = sqlite3.connect(path)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 0
+    tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master")}
+    assert "broken" not in tables
+    assert "songs_source_info_service_song_id" not in tables
+
+
+def test_newer_database_is_refused(tmp_path):
+    path = str(tmp_path / "library.db")
+    con = sqlite3.connect(path)
+    con.execute(f"PRAGMA user_version = {len(MIGRATIONS) + 1}")
+    con.close()
+    with pytest.raises(ValueError):
+        Database(["spotify"], path)
+
+
+def test_performance_profile(tmp_path):
+    db = Database(
+        ["spotify"],
+        str(tmp_path / "library.db"),
+        profile="performance",
+        pragmas={"cache_size": -1024},
+    )
+    db.cur.execute("PRAGMA journal_mode")
+    assert db.cur.fetchone()[0] == "wal"
+    db.cur.execute("PRAGMA synchronous")
+    assert db.cur.fetchone()[0] == 1
+    db.cur.execute("PRAGMA cache_size")
+    assert db.cur.fetchone()[0] == -1024
+    with pytest.raises(ValueError):
+        db.apply_pragmas({"journal_mode": "WAL; DROP TABLE songs"})
+
+
+def test_checkpoints():
+    db = Database(["spotify", "youtube"])
+    assert db.fetch_checkpoints("spotify") == {}
+    db.save_checkpoints(
+        "spotify",
+        {
+            "liked_songs": {"added_at": "2024-03-18T10:00:00Z", "track_count": 120},
+            "playlist:pidspotifyp": {"snapshot_id": "snap1", "track_count": 3},
+        },
+    )
+    db.save_checkpoints("spotify", {"playlist:pidspotifyp": {"snapshot_id": "snap2"}})
+    checkpoints = db.fetch_checkpoints("spotify")
+    assert checkpoints["liked_songs"]["added_at"] == "2024-03-18T10:00:00Z"
+    assert checkpoints["playlist:pidspotifyp"] == {
+        "added_at": None,
+        "snapshot_id": "snap2",
+        "track_count": None,
+        "last_item_id": None,
+    }
+    assert db.fetch_checkpoints("youtube") == {}
+
+
+def test_search():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs(first_batch)
+    db.insert_songs(second_batch, bulk=False)
+    db.insert_song(
+        {**song("youtube", "d", "6"), "artist_name": "Beyoncé", "song_title": "Halo (Live) - Remastered"}
+    )
+    db.insert_playlist({"service_id": "spotify", "playlist_id": "pid1", "playlist_name": "Road trip", "songs": []})
+
+    assert db.search("ti1") == [1]
+    # Songs matching more words come first
+    results = db.fetch_songs(db.search("nab ti3"))
+    assert results[0] == (3, "ti3", "nab")
+    assert {artist_name for _, _, artist_name in results[1:]} == {"nab"}
+    # Words are matched without accents or case, and quotes can't break the query
+    assert db.search('beyonce "HALO"')[0] == db.search("halo")[0]
+    assert db.search('"(') == []
+    assert db.search_playlists("trip") == [1]
+
+    # Kept in sync by the triggers
+    db.cur.execute("UPDATE artists SET name = 'renamed' WHERE name = 'nab'")
+    assert db.search("nab") == []
+    assert 3 in db.search("renamed")
+    db.cur.execute("DELETE FROM songs WHERE id = 3")
+    assert 3 not in db.search("renamed")
+
+
+def test_fts_query():
+    assert fts_query("Artist - Title (Live) artist") == '"artist" OR "title" OR "live"'
+    assert fts_query("- ()") == ""
+
+
+def test_search_after_migration(tmp_path):
+    path = load_fixture(tmp_path, "library_v0.sql")
+    db = Database(["spotify", "youtube"], path)
+    db.cur.execute("SELECT id FROM songs")
+    song_ids = {row[0] for row in db.cur.fetchall()}
+    assert set(db.search("naa nab", limit=100)) == song_ids
+
+
+def test_find_duplicates():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs(
+        [
+            {**song("spotify", "a", "1"), "artist_name": "Beyoncé", "song_title": "Halo"},
+            {**song("youtube", "a", "1"), "artist_name": "Beyonce", "song_title": "HALO (Official Video)"},
+            # Another video of it, can't be merged with the first one
+            {**song("youtube", "a", "2"), "artist_name": "Beyonce", "song_title": "Halo [Lyrics]"},
+            # Homonyms: two different songs on spotify
+            {**song("spotify", "b", "3"), "song_title": "Intro"},
+            {**song("spotify", "b", "3", artist_id="aidspotifyb2", song_id="sidother"), "song_title": "Intro"},
+            song("spotify", "c", "4"),
+        ]
+    )
+    assert db.refresh_match_keys(chunk_size=2) == 6
+    assert db.refresh_match_keys() == 0
+
+    clusters = list(db.iter_duplicates(chunk_size=1))
+    assert [(cluster["title_key"], cluster["song_ids"]) for cluster in clusters] == [("halo", [1, 2])]
+    assert 0 < clusters[0]["score"] <= 1
+
+    # A renamed song gets new keys on the next refresh
+    db.cur.execute("UPDATE songs SET title = 'Halo' WHERE id = 6")
+    db.cur.execute("UPDATE artists SET name = 'Beyoncé' WHERE id = 5")
+    assert db.refresh_match_keys() == 1
+    assert [cluster["song_ids"] for cluster in db.iter_duplicates()] == [[1, 2], [3, 6]]
+
+
+def test_iter_unidentified_songs():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs([song("spotify", "a", str(i)) for i in range(1, 8)])
+    db.insert_songs([{**song("youtube", "a", "2"), "db_song_id": 2}])
+    expected = db.fetch_unidentified_songs("youtube")
+    assert [song["db_song_id"] for song in expected] == [1, 3, 4, 5, 6, 7]
+    assert expected[0] == {
+        "service_id": "youtube",
+        "artist_id": "aidyoutubea",
+        "artist_name": "naa",
+        "input_artist_name": "naa",
+        "song_id": None,
+        "song_title": None,
+        "input_song_title": "ti1",
+        "db_song_id": 1,
+    }
+
+    batches = db.iter_unidentified_songs("youtube", batch_size=3)
+    assert next(batches) == expected[:3]
+    # Identified while the first batch is being worked on
+    db.insert_songs([{**song("youtube", "a", "5"), "db_song_id": 5}])
+    assert [[song["db_song_id"] for song in batch] for batch in batches] == [[6, 7]]
+
+    db.cur.execute(
+        "EXPLAIN QUERY PLAN " + SELECT_UNIDENTIFIED_SONGS, ("youtube", 0, "youtube", 3)
+    )
+    plan = [row[3] for row in db.cur.fetchall()]
+    # Each batch starts from the primary key and checks refs with the unique index
+    assert "SEARCH songs USING INTEGER PRIMARY KEY (rowid>?)" in plan
+    assert any("songs_source_info USING" in step and "service_id=? AND song_id=?" in step for step in plan)
+    assert not any(step.startswith("SCAN") for step in plan)
+
+
+def test_identify_jobs():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs([song("spotify", "a", str(i)) for i in range(1, 6)])
+    db.insert_songs([{**song("youtube", "a", "1"), "db_song_id": 1}])
+    assert db.enqueue_identify_jobs("youtube", batch_size=3) == 4
+    assert db.enqueue_identify_jobs("youtube") == 0
+
+    claimed = db.claim_identify_jobs("youtube", limit=3, now=100)
+    assert [job["db_song_id"] for job in claimed] == [2, 3, 4]
+    # Another worker only gets what is left
+    assert [job["db_song_id"] for job in db.claim_identify_jobs("youtube", now=100)] == [5]
+    assert db.count_identify_jobs("youtube") == {"running": 4}
+
+    db.complete_identify_jobs(
+        "youtube",
+        [
+            (claimed[0], song("youtube", "a", "2"), None),
+            (claimed[1], None, None),
+            (claimed[2], None, TimeoutError("read timeout")),
+        ],
+        now=100,
+        backoff=10,
+        not_found_delay=1000,
+    )
+    assert db.count_identify_jobs("youtube") == {"done": 1, "not_found": 1, "failed": 1, "running": 1}
+    assert [song["db_song_id"] for song in db.fetch_unidentified_songs("youtube")] == [3, 4, 5]
+    db.cur.execute("SELECT last_error FROM identify_jobs WHERE song_id = 4")
+    assert db.cur.fetchone()[0] == "TimeoutError('read timeout')"
+
+    # The failed job backs off 10s then 20s, the running one is reclaimed once its lease expired
+    assert db.claim_identify_jobs("youtube", now=105, lease=600) == []
+    assert [job["db_song_id"] for job in db.claim_identify_jobs("youtube", now=110, lease=600)] == [4]
+    db.complete_identify_jobs("youtube", [(claimed[2], None, TimeoutError())], now=110, backoff=10)
+    assert db.claim_identify_jobs("youtube", now=129, lease=600) == []
+    assert [job["db_song_id"] for job in db.claim_identify_jobs("youtube", now=130, lease=600)] == [4]
+    assert [job["db_song_id"] for job in db.claim_identify_jobs("youtube", now=700, lease=600)] == [5]
+
+    # A song identified some other way is done without being claimed
+    db.insert_songs([{**song("youtube", "a", "3"), "db_song_id": 3}])
+    assert [job["db_song_id"] for job in db.claim_identify_jobs("youtube", now=2000)] == [4, 5]
+    assert db.count_identify_jobs("youtube")["done"] == 2
+
+
+def test_identify_jobs_backoff_is_capped():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs([song("spotify", "a", str(i)) for i in range(1, 4)])
+    db.enqueue_identify_jobs("youtube")
+    claimed = db.claim_identify_jobs("youtube", now=100)
+    # Past 63 attempts a plain 1 << (attempts - 1) is negative or 0 in sqlite
+    for song_id, attempts in ((1, 64), (2, 65), (3, 1000)):
+        db.cur.execute("UPDATE identify_jobs SET attempts = ? WHERE song_id = ?", (attempts, song_id))
+    db.complete_identify_jobs(
+        "youtube", [(job, None, TimeoutError()) for job in claimed], now=100, backoff=60, max_backoff=3600
+    )
+    db.cur.execute("SELECT next_attempt_at FROM identify_jobs ORDER BY song_id")
+    assert [row[0] for row in db.cur.fetchall()] == [3700, 3700, 3700]
+    assert db.claim_identify_jobs("youtube", now=3699) == []
+
+
+def playlist(name, songs):
+    return {"service_id": "spotify", "playlist_id": f"pid{name}", "playlist_name": name, "songs": songs}
+
+
+def test_insert_playlists():
+    db = Database(["spotify", "youtube"])
+    tracks = [song("spotify", "a", str(i)) for i in range(5)]
+    db.insert_playlists(
+        [
+            playlist("p1", [tracks[2], tracks[0], None, tracks[2]]),
+            playlist("p2", tracks),
+            playlist("empty", []),
+        ]
+    )
+    song_ids = {track["song_id"]: song_id for song_id, track in zip(db.insert_songs_bulk(tracks), tracks)}
+    ids = [song_ids[track["song_id"]] for track in tracks]
+    # Order and duplicates are kept
+    assert db.fetch_playlist_songs(1) == [ids[2], ids[0], ids[2]]
+    assert db.fetch_playlist_songs(2) == ids
+    assert db.fetch_playlist_songs(3) == []
+
+    # Pulled again with changes, only the difference is written
+    def counts(inserted=0, updated=0, moved=0, deleted=0):
+        return {"inserted": inserted, "updated": updated, "moved": moved, "deleted": deleted}
+
+    db.insert_playlists([playlist("p2", tracks[:2] + tracks[3:])])
+    assert db.fetch_playlist_songs(2) == ids[:2] + ids[3:]
+    assert db.replace_playlist_songs(2, ids[:2] + ids[3:]) == counts()
+    # One write per changed track, wherever it is in the playlist
+    long_ids = db.insert_songs_bulk([song("spotify", "b", str(i)) for i in range(200)])
+    assert db.replace_playlist_songs(2, long_ids) == counts(updated=4, inserted=196)
+    del long_ids[10]
+    assert db.replace_playlist_songs(2, long_ids) == counts(deleted=1)
+    long_ids.insert(0, long_ids.pop(150))
+    assert db.replace_playlist_songs(2, long_ids) == counts(moved=1)
+    long_ids[20] = ids[4]
+    assert db.replace_playlist_songs(2, long_ids) == counts(updated=1)
+    long_ids.insert(100, ids[0])
+    assert db.replace_playlist_songs(2, long_ids) == counts(inserted=1)
+    assert db.fetch_playlist_songs(2) == long_ids
+
+    # Inserting again and again at the same place uses up the gap, the playlist is renumbered
+    for i in range(12):
+        long_ids.insert(51, ids[i % 5])
+        db.replace_playlist_songs(2, long_ids)
+        assert db.fetch_playlist_songs(2) == long_ids
+    rng = random.Random(0)
+    for _ in range(50):
+        edited = list(db.fetch_playlist_songs(2))
+        for _ in range(rng.randrange(1, 5)):
+            action = rng.randrange(3)
+            if action == 0 and edited:
+                del edited[rng.randrange(len(edited))]
+            elif action == 1:
+                edited.insert(rng.randrange(len(edited) + 1), rng.choice(ids))
+            elif edited:
+                edited.insert(rng.randrange(len(edited)), edited.pop(rng.randrange(len(edited))))
+        db.replace_playlist_songs(2, edited)
+        assert db.fetch_playlist_songs(2) == edited
+
+
+if __name__ == "__main__":
+    test_bulk_insert_matches_per_row()
+    test_bulk_insert_returns_song_ids()
+    test_hot_queries_use_indexes()
+    test_checkpoints()
+    test_search()
+    test_fts_query()
+    test_find_duplicates()
+    test_iter_unidentified_songs()
+    test_identify_jobs()
+    test_identify_jobs_backoff_is_capped()
+    test_insert_playlists()
@@ -0,0 +1,158 @@
+import time
+from modules.app.database import Database
+from modules.app.database_pool import DatabasePool
+from modules.app.identify import (
+    TokenBucket,
+    call_with_retry,
+    identify_locally,
+    identify_songs,
+    process_identify_jobs,
+    retry_after_seconds,
+)
+from tests.fake_service import FakeHTTPError, FakeSearchService
+
+
+def unidentified(title, db_song_id):
+    return {"input_song_title": title, "input_artist_name": "na", "db_song_id": db_song_id}
+
+
+def found(title):
+    return {
+        "service_id": "fake",
+        "artist_id": "aidfake",
+        "artist_name": "na",
+        "song_id": f"sidfake{title}",
+        "song_title": title,
+    }
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+    start = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    # 5 tokens right away, then 10 more at 50 per second
+    assert time.monotonic() - start >= 0.18
+
+
+def test_retry_on_rate_limit_only():
+    service = FakeSearchService({"ti1": found("ti1")}, failures={"ti1": [429, 503]})
+    waits = []
+    result = call_with_retry(
+        service.identify_song, unidentified("ti1", 1), backoff=1, sleep=waits.append
+    )
+    assert result["song_id"] == "sidfake" + "ti1"
+    assert waits == [1, 2]
+
+    service = FakeSearchService({"ti2": found("ti2")}, failures={"ti2": [404]})
+    try:
+        call_with_retry(service.identify_song, unidentified("ti2", 2), sleep=waits.append)
+        assert False
+    except FakeHTTPError as error:
+        assert error.http_status == 404
+    assert len(service.calls) == 1
+
+
+def test_retry_after():
+    now = lambda: 1445412480.0
+    assert retry_after_seconds("120", now) == 120
+    # now is Wed, 21 Oct 2015 07:28:00 GMT
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:30:00 GMT", now) == 120
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:00:00 GMT", now) == 0
+    assert retry_after_seconds("soon", now) is None
+    assert retry_after_seconds(None, now) is None
+
+    # An unreadable header falls back to the backoff instead of escaping the retry loop
+    def rate_limited(song):
+        if not waits:
+            raise FakeHTTPError(429, {"Retry-After": "soon"})
+        return song
+
+    waits = []
+    assert call_with_retry(rate_limited, "song", backoff=3, sleep=waits.append) == "song"
+    assert waits == [3]
+
+
+def test_pipeline_saves_in_batches():
+    titles = [f"ti{i}" for i in range(20)]
+    catalogue = {title: found(title) for title in titles[:15]}
+    service = FakeSearchService(catalogue, failures={"ti0": [429], "ti1": [404]})
+    batches = []
+    stats = identify_songs(
+        service.identify_song,
+        [unidentified(title, i) for i, title in enumerate(titles)],
+        batches.append,
+        workers=4,
+        rate=200,
+        burst=4,
+        backoff=0.01,
+        batch_size=5,
+    )
+    assert stats == {"identified": 14, "not_found": 5, "failed": 1}
+    assert [len(batch) for batch in batches] == [5, 5, 4]
+    assert sorted(song["db_song_id"] for batch in batches for song in batch) == [0] + list(range(2, 15))
+
+
+def test_identify_locally():
+    db = Database(["spotify", "youtube"])
+    db.insert_songs(
+        [
+            {"service_id": "youtube", "artist_id": "aidyoutubea", "artist_name": "Artist",
+             "song_id": "sidyoutube1", "song_title": "Title (Official Video)"},
+            {"service_id": "spotify", "artist_id": "aidspotifya", "artist_name": "artist",
+             "song_id": "sidspotify1", "song_title": "title"},
+            {"service_id": "youtube", "artist_id": "aidyoutubea", "artist_name": "Artist",
+             "song_id": "sidyoutube2", "song_title": "Other title"},
+        ]
+    )
+    songs = db.fetch_unidentified_songs("spotify")
+    identified, remaining = identify_locally(db, "spotify", songs)
+
+    assert [song["input_song_title"] for song in remaining] == ["Other title"]
+    assert identified == [
+        {
+            "service_id": "spotify",
+            "artist_id": "aidspotifya",
+            "artist_name": "artist",
+            "song_id": "sidspotify1",
+            "song_title": "title",
+            "db_song_id": 1,
+        }
+    ]
+    db.insert_songs(identified)
+    assert len(db.fetch_unidentified_songs("spotify")) == 1
+
+
+def test_process_identify_jobs(tmp_path):
+    path = str(tmp_path / "library.db")
+    pool = DatabasePool(["spotify", "fake"], path, profile="default")
+    pool.write(
+        "insert_songs",
+        [
+            {"service_id": "spotify", "artist_id": "aidspotifya", "artist_name": "na",
+             "song_id": f"sidspotify{i}", "song_title": f"ti{i}"}
+            for i in range(10)
+        ],
+    )
+    catalogue = {f"ti{i}": found(f"ti{i}") for i in range(6)}
+    service = FakeSearchService(catalogue, failures={"ti0": [404]})
+    totals = process_identify_jobs(
+        pool, "fake", service.identify_song, claim_size=4, workers=2, batch_size=3
+    )
+    assert totals == {"local": 0, "identified": 5, "not_found": 4, "failed": 1}
+    assert pool.reader().count_identify_jobs("fake") == {"done": 5, "not_found": 4, "failed": 1}
+    assert len(service.calls) == 10
+
+    # Nothing is due on the next run, not found and failed songs wait before being searched again
+    totals = process_identify_jobs(pool, "fake", service.identify_song)
+    assert totals == {"local": 0, "identified": 0, "not_found": 0, "failed": 0}
+    assert len(service.calls) == 10
+    pool.close()
+
+
+if __name__ == "__main__":
+    test_token_bucket_limits_rate()
+    test_retry_on_rate_limit_only()
+    test_retry_after()
+    test_pipeline_saves_in_batches()
+    test_identify_locally()
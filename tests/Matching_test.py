@@ -0,0 +1,84 @@
+from modules.utils.matching import (
+    artist_key,
+    best_match,
+    match_songs,
+    normalise,
+    similarity,
+)
+
+
+def candidate(song_id, title, artist_name, service_song_id=None):
+    return (song_id, title, artist_name, f"aid{artist_name}", artist_name, service_song_id or f"sid{song_id}", title)
+
+
+def unidentified(title, artist_name, db_song_id):
+    return {"input_song_title": title, "input_artist_name": artist_name, "db_song_id": db_song_id}
+
+
+def test_normalise():
+    assert normalise("Halo (Live) [Remastered]") == "halo live remastered"
+    assert normalise("Halo (Live)") == normalise("Halo - Live")
+    assert normalise("HALO (Official Video)") == "halo"
+    assert normalise("Crazy In Love feat. JAY-Z") == "crazy in love"
+    assert normalise("Déjà Vu (ft. Someone) - Radio Edit") == "deja vu radio edit"
+    assert artist_key("The Beatles") == artist_key("beatles")
+    assert artist_key("Beyoncé") == artist_key("BEYONCE")
+
+
+def test_similarity():
+    assert similarity("love on top", "top on love") == 1
+    assert similarity("halo", "halo") == 1
+    assert similarity("single ladies", "single lady") > 0.7
+    assert similarity("halo", "irreplaceable") < 0.2
+
+
+def test_best_match():
+    candidates = [
+        candidate(1, "Halo", "Beyoncé"),
+        candidate(2, "Halo - Live", "Beyoncé"),
+        candidate(3, "Irreplaceable", "Beyoncé"),
+    ]
+    assert best_match("HALO (Official Video)", "Beyonce", candidates)[:2] == ("matched", candidates[0])
+    assert best_match("Halo (Live)", "Beyonce", candidates)[:2] == ("matched", candidates[1])
+    # The version is never dropped to find a match
+    assert best_match("Halo (Live) [Remastered]", "Beyonce", candidates)[0] == "ambiguous"
+    assert best_match("Halo (Remix)", "Beyonce", candidates)[0] == "ambiguous"
+    # Close but not exact, left for the service
+    assert best_match("Irreplacable", "Beyonce", candidates)[:2] == ("ambiguous", candidates[2])
+    assert best_match("Sweet Dreams", "Beyonce", candidates)[0] == "unmatched"
+    # Two different songs on the service have the title
+    twins = [candidate(1, "Halo", "Beyoncé"), candidate(4, "Halo", "Beyoncé", "sidother")]
+    assert best_match("Halo", "Beyonce", twins)[0] == "ambiguous"
+    # Same song on the service, duplicated in the library
+    same = [candidate(1, "Halo", "Beyoncé", "sid1"), candidate(4, "Halo", "Beyoncé", "sid1")]
+    assert best_match("Halo", "Beyonce", same)[0] == "matched"
+
+
+def test_match_songs_blocks_by_artist():
+    candidates = [candidate(1, "Halo", "Beyoncé"), candidate(2, "Halo", "Someone else")]
+    compared = []
+
+    def fallback(song):
+        compared.append(song["db_song_id"])
+        return candidates
+
+    results = match_songs(
+        [
+            unidentified("Halo", "Beyonce", 10),
+            unidentified("Halo", "Unknown artist", 11),
+            unidentified("Let it be", "The Beatles", 12),
+        ],
+        candidates,
+        fallback=fallback,
+    )
+    assert [(song["db_song_id"], match[0]) for song, match, _ in results["matched"]] == [(10, 1)]
+    assert [song["db_song_id"] for song, _, _ in results["ambiguous"] + results["unmatched"]] == [11, 12]
+    # Only the songs without a block go through the fallback
+    assert compared == [11, 12]
+
+
+if __name__ == "__main__":
+    test_normalise()
+    test_similarity()
+    test_best_match()
+    test_match_songs_blocks_by_artist()
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from modules.utils.cache_store import CacheStore
+from modules.utils.memo import LRUCache, memoize
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_search(results):
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        return {"tracks": {"items": results.get(query, [])}}
+
+    return search, calls
+
+
+def test_lru_cache():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a", 0) == (True, 1)
+    lru.set("c", 3)
+    assert lru.get("b", 0) == (False, None)
+    assert lru.get("a", 0) == (True, 1)
+    lru.set("d", 4, expires_at=10)
+    assert lru.get("d", 5) == (True, 4)
+    assert lru.get("d", 10) == (False, None)
+    assert len(lru) == 1
+
+
+def test_memory_tier():
+    search, calls = fake_search({"artist title": ["track"]})
+    memo_search = memoize(search, "tests_search")
+    for _ in range(3):
+        assert memo_search("artist title") == {"tracks": {"items": ["track"]}}
+    assert calls == ["artist title"]
+    assert len(memo_search.memory) == 1
+
+
+def test_disk_tier(tmp_path):
+    path = str(tmp_path / "search_cache.db")
+    search, calls = fake_search({"artist title": ["track"]})
+    memoize(search, "tests_search", store=CacheStore(path))("artist title")
+
+    # A new run starts with an empty memory tier
+    memo_search = memoize(search, "tests_search", store=CacheStore(path))
+    assert memo_search("artist title") == {"tracks": {"items": ["track"]}}
+    assert calls == ["artist title"]
+
+
+def test_negative_ttl(tmp_path):
+    clock = FakeClock()
+    store = CacheStore(str(tmp_path / "search_cache.db"), clock=clock)
+    search, calls = fake_search({"found": ["track"]})
+    memo_search = memoize(
+        search,
+        "tests_search",
+        store=store,
+        ttl=100,
+        negative_ttl=10,
+        is_negative=lambda raw_data: not raw_data["tracks"]["items"],
+        clock=clock,
+    )
+
+    memo_search("found")
+    memo_search("missing")
+    clock.now += 50
+    memo_search("found")
+    memo_search("missing")
+    assert calls == ["found", "missing", "missing"]
+
+    # The disk tier expires negative results sooner too
+    memo_search = memoize(search, "tests_search", store=store, clock=clock)
+    clock.now += 20
+    memo_search("found")
+    memo_search("missing")
+    assert calls == ["found", "missing", "missing", "missing"]
+
+
+def test_disk_entry_keeps_its_expiry(tmp_path):
+    clock = FakeClock()
+    store = CacheStore(str(tmp_path / "search_cache.db"), clock=clock)
+    search, calls = fake_search({"found": ["track"]})
+    memoize(search, "tests_search", store=store, ttl=100, clock=clock)("found")
+
+    # Read back from the disk tier 90s later, 10s are left and not another 100
+    clock.now += 90
+    memo_search = memoize(search, "tests_search", store=store, ttl=100, clock=clock)
+    memo_search("found")
+    clock.now += 20
+    memo_search("found")
+    assert calls == ["found", "found"]
+
+
+def test_concurrent_calls_are_coalesced():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def search(query):
+        calls.append(query)
+        started.set()
+        release.wait(5)
+        return {"tracks": {"items": [query]}}
+
+    memo_search = memoize(search, "tests_search")
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(memo_search("artist title"))) for _ in range(4)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ["artist title"]
+    assert results == [{"tracks": {"items": ["artist title"]}}] * 4
+
+
+if __name__ == "__main__":
+    test_lru_cache()
+    test_memory_tier()
+    test_concurrent_calls_are_coalesced()
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import time
+from modules.app.orchestrator import run_plugins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakePlugin:
+    def __init__(self, service_id, delay=0.0, error=None):
+        self.SERVICE_ID = service_id
+        self.delay = delay
+        self.error = error
+
+    def pull_songs(self):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [self.SERVICE_ID]
+
+
+def test_plugins_run_concurrently():
+    plugins = [FakePlugin(f"service{i}", delay=0.2) for i in range(4)]
+    results = []
+    start = time.monotonic()
+    errors = run_plugins(
+        plugins,
+        lambda plugin: plugin.pull_songs(),
+        on_result=lambda plugin, songs: results.extend(songs),
+    )
+    assert time.monotonic() - start < 0.6
+    assert errors == {}
+    assert sorted(results) == ["service0", "service1", "service2", "service3"]
+
+
+def test_errors_are_isolated():
+    plugins = [
+        FakePlugin("spotify", error=ValueError("bad token")),
+        FakePlugin("youtube", delay=0.05),
+    ]
+    results = []
+    errors = run_plugins(
+        plugins,
+        lambda plugin: plugin.pull_songs(),
+        on_result=lambda plugin, songs: results.extend(songs),
+    )
+    assert results == ["youtube"]
+    assert isinstance(errors[plugins[0]], ValueError)
+
+
+def test_same_service_twice():
+    # Two accounts of the same service are reported apart
+    plugins = [FakePlugin("spotify", error=ValueError("bad token")), FakePlugin("spotify", error=KeyError("x"))]
+    errors = run_plugins(plugins, lambda plugin: plugin.pull_songs())
+    assert isinstance(errors[plugins[0]], ValueError)
+    assert isinstance(errors[plugins[1]], KeyError)
+
+
+def test_max_workers():
+    plugins = [FakePlugin(f"service{i}", delay=0.1) for i in range(4)]
+    results = []
+    start = time.monotonic()
+    run_plugins(
+        plugins,
+        lambda plugin: plugin.pull_songs(),
+        on_result=lambda plugin, songs: results.extend(songs),
+        max_workers=2,
+    )
+    assert time.monotonic() - start >= 0.2
+    assert sorted(results) == ["service0", "service1", "service2", "service3"]
+
+
+def test_timed_out_plugin_does_not_block_exit():
+    code = (
+        "import time\n"
+        "from modules.app.orchestrator import run_plugins\n"
+        "run_plugins([object()], lambda plugin: time.sleep(30), timeout=0.1)\n"
+    )
+    start = time.monotonic()
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT, timeout=20)
+    assert time.monotonic() - start < 10
+
+
+def test_timeout():
+    plugins = [FakePlugin("slow", delay=1), FakePlugin("fast")]
+    results = []
+    start = time.monotonic()
+    errors = run_plugins(
+        plugins,
+        lambda plugin: plugin.pull_songs(),
+        on_result=lambda plugin, songs: results.extend(songs),
+        timeout=0.2,
+    )
+    assert time.monotonic() - start < 0.6
+    assert results == ["fast"]
+    assert isinstance(errors[plugins[0]], TimeoutError)
+
+
+if __name__ == "__main__":
+    test_plugins_run_concurrently()
+    test_errors_are_isolated()
+    test_same_service_twice()
+    test_max_workers()
+    test_timeout()
+    test_timed_out_plugin_does_not_block_exit()
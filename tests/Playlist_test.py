@@ -1,7 +1,7 @@
-from modules.Playlist import Playlist
-from modules.PlaylistRef import PlaylistRef
-from modules.Song import Song
-from modules.SongRef import SongRef
+from modules.data.Playlist import Playlist
+from modules.data.PlaylistRef import PlaylistRef
+from modules.data.Song import Song
+from modules.data.SongRef import SongRef
 from rich.pretty import pprint
 import pytest
 
@@ -187,8 +187,133 @@ def test_add_metadata_from():
     assert "spotify" in playlist1[0].song_refs.keys()
 
 
+def test_contains_and_discard():
+    k1 = Song(
+        service_id="youtube",
+        song_refs={
+            "youtube": SongRef(
+                artist_id="aidyoutubek",
+                artist_name="nak",
+                song_id="sidk",
+                song_title="tik",
+                date_added="2024-03-18",
+                song_metadata={},
+            ),
+        },
+    )
+    k2 = Song(
+        service_id="spotify",
+        song_refs={
+            "spotify": SongRef(
+                artist_id="aidspotifyk",
+                artist_name="nak",
+                song_id="sidk",
+                song_title="tik",
+                date_added="2024-03-18",
+                song_metadata={},
+            ),
+            "youtube": SongRef(
+                artist_id="aidyoutubek",
+                artist_name="nak",
+                song_id="sidk",
+                song_title="tik",
+                date_added="2024-03-18",
+                song_metadata={},
+            ),
+        },
+    )
+
+    myplaylist = Playlist(service_id="youtube", playlist_refs={}, songs=[k1])
+    assert k2 in myplaylist
+
+    # The spotify ref of k2 is only known after merging
+    myplaylist.add(k2)
+    assert len(myplaylist) == 1
+    assert ("spotify", "aidspotifyk", "sidk") in myplaylist[0].ref_keys()
+
+    myplaylist.discard(k2)
+    assert len(myplaylist) == 0
+    assert k1 not in myplaylist
+
+
+
+def test_merge_many():
+    def ref(service_id, name):
+        return SongRef(
+            artist_id=f"aid{service_id}{name}",
+            artist_name=f"na{name}",
+            song_id=f"sid{name}",
+            song_title=f"ti{name}",
+            date_added="2024-03-18",
+            song_metadata={},
+        )
+
+    m1 = Song(service_id="spotify", song_refs={"spotify": ref("spotify", "m")})
+    n1 = Song(service_id="spotify", song_refs={"spotify": ref("spotify", "n")})
+    m2 = Song(service_id="youtube", song_refs={"youtube": ref("youtube", "m")})
+    # Bridges the spotify and youtube copies of m
+    m3 = Song(
+        service_id="local",
+        song_refs={"local": ref("local", "m"), "youtube": ref("youtube", "m")},
+    )
+    m4 = Song(
+        service_id="local",
+        song_refs={"local": ref("local", "m"), "spotify": ref("spotify", "m")},
+    )
+
+    spotify = Playlist(service_id="spotify", playlist_refs={}, songs=[m1, n1])
+    youtube = Playlist(service_id="youtube", playlist_refs={}, songs=[m2])
+    local = Playlist(service_id="local", playlist_refs={}, songs=[m3, m4])
+
+    result = Playlist.merge_many([spotify, youtube, local])
+    assert len(result) == 2
+    assert result.service_id == "spotify"
+    assert set(result[0].song_refs.keys()) == {"spotify", "youtube", "local"}
+    assert result[1].song_refs.keys() == {"spotify"}
+    # The original songs are left untouched
+    assert m1.song_refs.keys() == {"spotify"}
+
+
+
+def test_set_operators():
+    def song(service_id, name):
+        return Song(
+            service_id=service_id,
+            song_refs={
+                service_id: SongRef(
+                    artist_id=f"aid{service_id}{name}",
+                    artist_name=f"na{name}",
+                    song_id=f"sid{name}",
+                    song_title=f"ti{name}",
+                    date_added="2024-03-18",
+                    song_metadata={},
+                ),
+            },
+        )
+
+    o1 = song("spotify", "o")
+    o2 = song("youtube", "o")
+    o2.song_refs["spotify"] = o1.song_refs["spotify"]
+    p1 = song("spotify", "p")
+    q2 = song("youtube", "q")
+
+    playlist1 = Playlist(service_id="spotify", playlist_refs={}, songs=[o1, p1])
+    playlist2 = Playlist(service_id="youtube", playlist_refs={}, songs=[o2, q2])
+
+    intersection = playlist1 & playlist2
+    assert len(intersection) == 1
+    assert set(intersection[0].song_refs.keys()) == {"spotify", "youtube"}
+    assert len(playlist1 | playlist2) == 3
+    assert [s.ref_keys() for s in playlist1 - playlist2] == [p1.ref_keys()]
+    assert [s.ref_keys() for s in playlist1 ^ playlist2] == [p1.ref_keys(), q2.ref_keys()]
+    # The operands are left untouched
+    assert o1.song_refs.keys() == {"spotify"}
+    assert len(playlist1) == 2
 
 
 if __name__ == "__main__":
     test_merge_bridge()
     test_add_metadata_from()
+    test_contains_and_discard()
+    test_merge_many()
+    test_set_operators()
@@ -0,0 +1,50 @@
+import pytest
+
+from modules.utils.cache_store import CacheStore
+from modules.utils.serializers import COMPRESSIONS, FORMATS, Serializer, msgpack
+
+RESPONSE = {
+    "items": [{"id": f"id{i}", "title": "Title (Live)", "artists": ["é", None]} for i in range(50)],
+    "next": None,
+    "total": 50,
+}
+
+
+def test_round_trip():
+    for format in FORMATS:
+        if format == "msgpack" and msgpack is None:
+            continue
+        for compression in COMPRESSIONS:
+            serializer = Serializer(format, compression)
+            assert serializer.loads(serializer.dumps(RESPONSE)) == RESPONSE
+
+
+def test_json_stays_readable():
+    assert Serializer().dumps([1, "a"]) == '[1, "a"]'
+    assert isinstance(Serializer("json", "zlib").dumps([1]), bytes)
+
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError):
+        Serializer("yaml")
+    with pytest.raises(ValueError):
+        Serializer("json", "zstd")
+
+
+def test_format_change_is_a_miss(tmp_path):
+    path = str(tmp_path / "api_cache.db")
+    store = CacheStore(path, serializer=Serializer("pickle", "zlib"))
+    store.set("tests_func", "key", RESPONSE)
+    assert store.get("tests_func", "key") == (True, RESPONSE)
+    store.close()
+
+    store = CacheStore(path)
+    assert store.get("tests_func", "key") == (False, None)
+    store.set("tests_func", "key", RESPONSE)
+    assert store.get("tests_func", "key") == (True, RESPONSE)
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_json_stays_readable()
+    test_unknown_serializer()
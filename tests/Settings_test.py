@@ -1,6 +1,22 @@
-from modules.settings import settings
+import toml
+from modules.app.settings import settings, load_settings
+from modules.app.plugins_init import plugins_constants
 from rich.pretty import pprint
 
 
+def test_partial_sections(tmp_path):
+    path = str(tmp_path / "settings.toml")
+    with open(path, "w") as f:
+        toml.dump({"database": {"path": "music.db", "pragmas": {"cache_size": -2000}}, "debug": {"api_cache": True}}, f)
+
+    loaded = load_settings(plugins_constants, path=path)
+    assert loaded["database"] == {"path": "music.db", "profile": "performance", "pragmas": {"cache_size": -2000}}
+    assert loaded["debug"]["api_cache"] is True
+    assert loaded["debug"]["cache_folder"] == "cache"
+    # The missing keys are written back to the file
+    with open(path) as f:
+        assert toml.load(f)["database"]["profile"] == "performance"
+
+
 if __name__ == "__main__":
     pprint(settings)
@@ -0,0 +1,67 @@
+from modules.data.Song import Song
+from modules.data.SongRef import SongRef
+from modules.data.SongTable import SongTable
+
+
+r1 = Song(
+    service_id="spotify",
+    song_refs={
+        "spotify": SongRef(
+            artist_id="aidspotifyr",
+            artist_name="nar",
+            song_id="sidr",
+            song_title="tir",
+            date_added="2024-03-18",
+            song_metadata={},
+        ),
+        "youtube": SongRef(
+            artist_id="aidyoutuber",
+            artist_name="nar",
+            song_id="sidr",
+            song_title="tir",
+            date_added="2023-03-18",
+            song_metadata={},
+        ),
+    },
+)
+s1 = Song(
+    service_id="spotify",
+    song_refs={
+        "spotify": SongRef(
+            artist_id="aidspotifys",
+            artist_name="nas",
+            song_id="sids",
+            song_title="tis",
+            date_added="2024-03-18",
+            song_metadata={},
+        ),
+    },
+)
+
+
+def test_missing_service():
+    table = SongTable.from_songs([r1, s1])
+    assert len(table) == 3
+    assert table.missing_service("youtube") == [1]
+    assert table.missing_service("spotify") == []
+    assert table.missing_service("local") == [0, 1]
+
+
+def test_oldest_date_added():
+    table = SongTable.from_songs([r1, s1])
+    assert table.oldest_date_added() == ["2023-03-18", "2024-03-18"]
+
+
+def test_round_trip():
+    table = SongTable.from_songs([r1, s1])
+    songs = table.to_songs()
+    assert songs[0] == r1
+    assert songs[0].service_id == "youtube"
+    assert table.to_songs([1])[0].ref_keys() == s1.ref_keys()
+    assert len(table.to_playlist(service_id="db")) == 2
+
+
+if __name__ == "__main__":
+    test_missing_service()
+    test_oldest_date_added()
+    test_round_trip()
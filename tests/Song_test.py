@@ -1,5 +1,5 @@
-from modules.Song import Song
-from modules.SongRef import SongRef
+from modules.data.Song import Song
+from modules.data.SongRef import SongRef
 
 """
 quick and dirty Song template
@@ -81,7 +81,16 @@ def test_oldest_id_change():
     result = one1 + one2
     assert result.service_id == "spotify"
 
+def test_metadata_not_shared():
+    ref1 = SongRef(song_id="sid3")
+    ref2 = SongRef(song_id="sid3")
+    ref1.song_metadata["album"] = "al3"
+    assert ref2.song_metadata == {}
+    assert ref1.merge(ref2).song_metadata == {"album": "al3"}
+
+
 if __name__ == "__main__":
     test_equality()
     test_inequality()
-    test_oldest_id_change()
\ No newline at end of file
+    test_oldest_id_change()
+    test_metadata_not_shared()
\ No newline at end of file
@@ -0,0 +1,83 @@
+import pytest
+from tests.fake_service import FakeSpotify
+
+pytest.importorskip("spotipy")
+pytest.importorskip("dotenv")
+from plugins.spotify.main import Plugin
+
+
+def track(i):
+    return {"id": f"t{i}", "name": f"title{i}", "artists": [{"id": "a", "name": "artist"}]}
+
+
+def liked(ids):
+    return [{"added_at": f"2024-01-{i:02d}T00:00:00Z", "track": track(i)} for i in ids]
+
+
+def plugin(client):
+    # Logged in plugin without the oauth flow
+    spotify = Plugin.__new__(Plugin)
+    spotify.ALL_SAVED_PLAYLISTS = True
+    spotify.sp = client
+    return spotify
+
+
+def pull_songs(spotify, checkpoints):
+    return [song["song_id"] for page in spotify.iter_songs(checkpoints) for song in page]
+
+
+def pull_playlists(spotify, checkpoints):
+    return [playlist for page in spotify.iter_playlists(checkpoints) for playlist in page]
+
+
+def test_liked_songs_delta():
+    client = FakeSpotify(liked(range(28, 0, -1)))
+    spotify = plugin(client)
+    checkpoints = {}
+    assert len(pull_songs(spotify, checkpoints)) == 28
+    assert checkpoints["liked_songs"]["last_item_id"] == "t28"
+    assert checkpoints["liked_songs"]["track_count"] == 28
+
+    # Nothing changed, paging stops at the newest known song
+    client.pages = 0
+    assert pull_songs(spotify, checkpoints) == []
+    assert client.pages == 1
+
+    client.liked = liked([30, 29]) + client.liked
+    assert pull_songs(spotify, checkpoints) == ["t30", "t29"]
+    assert checkpoints["liked_songs"]["last_item_id"] == "t30"
+
+    # A removed like doesn't show in the new songs, the count tells
+    del client.liked[5]
+    assert len(pull_songs(spotify, checkpoints)) == 29
+    assert pull_songs(spotify, checkpoints) == []
+
+    # Without checkpoints everything is pulled
+    assert len(pull_songs(spotify, None)) == 29
+
+
+def test_playlists_delta():
+    client = FakeSpotify(
+        [],
+        playlists=[
+            {"id": "p1", "name": "one", "snapshot_id": "s1", "tracks": [track(1), track(2), track(3)]},
+            {"id": "p2", "name": "two", "snapshot_id": None, "tracks": [track(4)]},
+        ],
+    )
+    spotify = plugin(client)
+    checkpoints = {}
+    playlists = pull_playlists(spotify, checkpoints)
+    assert [playlist["playlist_id"] for playlist in playlists] == ["p1", "p2"]
+    assert [song["song_id"] for song in playlists[0]["songs"]] == ["t1", "t2", "t3"]
+    assert checkpoints["playlist:p1"] == {"snapshot_id": "s1", "track_count": 3}
+
+    # Same snapshot_id skipped, a playlist without one always pulled
+    assert [playlist["playlist_id"] for playlist in pull_playlists(spotify, checkpoints)] == ["p2"]
+
+    client.playlists[0]["snapshot_id"] = "s2"
+    assert [playlist["playlist_id"] for playlist in pull_playlists(spotify, checkpoints)] == ["p1", "p2"]
+
+
+if __name__ == "__main__":
+    test_liked_songs_delta()
+    test_playlists_delta()
@@ -0,0 +1,64 @@
+import pytest
+from tests.fake_service import FakeYTMusic
+
+pytest.importorskip("ytmusicapi")
+from plugins.youtube.main import Plugin
+
+
+def track(i):
+    return {"videoId": f"v{i}", "title": f"title{i}", "artists": [{"id": "a", "name": "artist"}]}
+
+
+def plugin(client):
+    # Plugin without the browser.json login
+    youtube = Plugin.__new__(Plugin)
+    youtube.yt = client
+    return youtube
+
+
+def pull_songs(youtube, checkpoints):
+    return [song["song_id"] for page in youtube.iter_songs(checkpoints, page_size=10) for song in page]
+
+
+def pull_playlists(youtube, checkpoints):
+    return [playlist for page in youtube.iter_playlists(checkpoints) for playlist in page]
+
+
+def test_liked_songs_delta():
+    client = FakeYTMusic([track(i) for i in range(28, 0, -1)])
+    youtube = plugin(client)
+    checkpoints = {}
+    assert len(pull_songs(youtube, checkpoints)) == 28
+    assert checkpoints["liked_songs"] == {"track_count": 28, "last_item_id": "v28"}
+
+    # Nothing changed
+    assert pull_songs(youtube, checkpoints) == []
+
+    client.liked = [track(30), track(29)] + client.liked
+    assert pull_songs(youtube, checkpoints) == ["v30", "v29"]
+
+    # A removed like doesn't show in the new songs, the count tells
+    del client.liked[5]
+    assert len(pull_songs(youtube, checkpoints)) == 29
+    assert pull_songs(youtube, checkpoints) == []
+
+
+def test_playlists_delta():
+    client = FakeYTMusic([], playlists={"p1": ("one", [track(1), track(2)]), "p2": ("two", [track(3)])})
+    youtube = plugin(client)
+    checkpoints = {}
+    playlists = pull_playlists(youtube, checkpoints)
+    assert [playlist["playlist_id"] for playlist in playlists] == ["p1", "p2"]
+    assert [song["song_id"] for song in playlists[0]["songs"]] == ["v1", "v2"]
+
+    # Unchanged playlists are skipped
+    assert pull_playlists(youtube, checkpoints) == []
+
+    # A track replaced by another keeps the count but not the hash
+    client.playlists["p1"] = ("one", [track(1), track(4)])
+    assert [playlist["playlist_id"] for playlist in pull_playlists(youtube, checkpoints)] == ["p1"]
+
+
+if __name__ == "__main__":
+    test_liked_songs_delta()
+    test_playlists_delta()
@@ -0,0 +1,118 @@
+"""
+Offline stand-in for a search api like spotify's, used to test the identification pipeline
+"""
+import threading
+import time
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, http_status, headers=None):
+        super().__init__(f"http status {http_status}")
+        self.http_status = http_status
+        self.headers = headers or {}
+
+
+class FakeSearchService:
+    """
+    Catalogue of {title: song} that answers searches and can fail like a real service
+
+    Args:
+        catalogue (dict): {song_title: song dictionary returned when found}
+        failures (dict, optional): {song_title: [http_status, ...]} errors raised before answering
+    """
+
+    SERVICE_ID = "fake"
+
+    def __init__(self, catalogue, failures=None):
+        self.catalogue = catalogue
+        self.failures = {title: list(statuses) for title, statuses in (failures or {}).items()}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def identify_song(self, song):
+        title = song["input_song_title"]
+        with self.lock:
+            self.calls.append((time.monotonic(), title))
+            statuses = self.failures.get(title)
+            if statuses:
+                raise FakeHTTPError(statuses.pop(0))
+        found = self.catalogue.get(title)
+        if found is None:
+            return None
+        return {**found, "db_song_id": song.get("db_song_id")}
+
+
+class FakeSpotify:
+    """
+    Offline stand-in for a spotipy.Spotify client, pages through liked songs and playlists
+
+    Args:
+        liked (list): saved tracks newest first, like {"added_at": str, "track": track}
+        playlists (list, optional): playlists with their "tracks" items. Defaults to none.
+        page_size (int, optional): items per page. Defaults to 2.
+    """
+
+    def __init__(self, liked, playlists=None, page_size=2):
+        self.liked = liked
+        self.playlists = playlists or []
+        self.page_size = page_size
+        self.pages = 0
+
+    def _page(self, items, offset=0):
+        self.pages += 1
+        end = offset + self.page_size
+        return {
+            "items": items[offset:end],
+            "total": len(items),
+            "next": (items, end) if end < len(items) else None,
+        }
+
+    def next(self, raw_data):
+        return self._page(*raw_data["next"])
+
+    def current_user_saved_tracks(self, limit=50):
+        return self._page(self.liked)
+
+    def current_user(self):
+        return {"id": "me"}
+
+    def user_playlists(self, user, limit=50):
+        return self._page(
+            [
+                {
+                    "id": playlist["id"],
+                    "name": playlist["name"],
+                    "owner": {"id": user},
+                    "snapshot_id": playlist.get("snapshot_id"),
+                    "tracks": {"total": len(playlist["tracks"])},
+                }
+                for playlist in self.playlists
+            ]
+        )
+
+    def playlist_tracks(self, playlist_id, limit=50):
+        playlist = next(playlist for playlist in self.playlists if playlist["id"] == playlist_id)
+        return self._page([{"track": track} for track in playlist["tracks"]])
+
+
+class FakeYTMusic:
+    """
+    Offline stand-in for a ytmusicapi.YTMusic client
+
+    Args:
+        liked (list): liked tracks newest first
+        playlists (dict, optional): {playlist_id: (title, tracks)}. Defaults to none.
+    """
+
+    def __init__(self, liked, playlists=None):
+        self.liked = liked
+        self.playlists = playlists or {}
+
+    def get_liked_songs(self, limit=100):
+        return {"tracks": self.liked[:limit]}
+
+    def get_library_playlists(self, limit=25):
+        return [{"playlistId": playlist_id, "title": title} for playlist_id, (title, _) in self.playlists.items()]
+
+    def get_playlist(self, playlist_id, limit=100):
+        return {"tracks": self.playlists[playlist_id][1][:limit]}
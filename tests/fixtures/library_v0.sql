@@ -0,0 +1,79 @@
+-- library.db as created before PRAGMA user_version migrations (version 0)
+BEGIN TRANSACTION;
+CREATE TABLE artists (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                source_id TEXT,
+                FOREIGN KEY (source_id) REFERENCES services(id)
+                
+            );
+INSERT INTO "artists" VALUES(1,'naa','spotify');
+INSERT INTO "artists" VALUES(2,'nab','spotify');
+CREATE TABLE artists_source_info(
+                service_id TEXT NOT NULL,
+                artist_id INTEGER,
+                service_artist_id TEXT NOT NULL,
+                service_artist_name TEXT,
+                UNIQUE (service_id, service_artist_id, service_artist_name),
+                PRIMARY KEY(service_id, artist_id),
+                FOREIGN KEY (artist_id) REFERENCES artists(id),
+                FOREIGN KEY (service_id) REFERENCES services(id)
+                );
+INSERT INTO "artists_source_info" VALUES('spotify',1,'aidspotifya','naa');
+INSERT INTO "artists_source_info" VALUES('youtube',1,'aidyoutubea','naa');
+INSERT INTO "artists_source_info" VALUES('spotify',2,'aidspotifyb','nab');
+CREATE TABLE playlist_songs (
+                playlist_id INTEGER,
+                song_id INTEGER,
+                PRIMARY KEY (playlist_id, song_id),
+                FOREIGN KEY (playlist_id) REFERENCES playlists (id),
+                FOREIGN KEY (song_id) REFERENCES songs (id)
+            );
+INSERT INTO "playlist_songs" VALUES(1,2);
+INSERT INTO "playlist_songs" VALUES(1,1);
+CREATE TABLE playlists (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                source_id TEXT,
+                FOREIGN KEY (source_id) REFERENCES services(id)
+            );
+INSERT INTO "playlists" VALUES(1,'pnap',NULL);
+CREATE TABLE playlists_source_info(
+                service_id TEXT NOT NULL,
+                playlist_id INTEGER,
+                service_playlist_id TEXT NOT NULL,
+                service_playlist_name TEXT,
+                PRIMARY KEY(service_id, playlist_id),
+                FOREIGN KEY (playlist_id) REFERENCES playlists (id),
+                FOREIGN KEY (service_id) REFERENCES services(id)
+            );
+INSERT INTO "playlists_source_info" VALUES('spotify',1,'pidspotifyp','pnap');
+CREATE TABLE services (
+                id TEXT PRIMARY KEY
+            );
+INSERT INTO "services" VALUES('spotify');
+INSERT INTO "services" VALUES('youtube');
+CREATE TABLE songs (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                artist_id INTEGER,
+                source_id TEXT,
+                FOREIGN KEY (source_id) REFERENCES services(id)
+                UNIQUE (artist_id, title),
+                FOREIGN KEY (artist_id) REFERENCES artists(id)
+            );
+INSERT INTO "songs" VALUES(1,'ti1',1,'spotify');
+INSERT INTO "songs" VALUES(2,'ti2',2,'spotify');
+CREATE TABLE songs_source_info(
+                service_id TEXT NOT NULL,
+                song_id INTEGER,
+                service_song_id TEXT NOT NULL,
+                service_song_title TEXT,
+                PRIMARY KEY(service_id, song_id),
+                FOREIGN KEY (song_id) REFERENCES songs (id),
+                FOREIGN KEY (service_id) REFERENCES services(id)
+            );
+INSERT INTO "songs_source_info" VALUES('spotify',1,'sidspotifya1','ti1');
+INSERT INTO "songs_source_info" VALUES('youtube',1,'sidyoutubea1','ti1');
+INSERT INTO "songs_source_info" VALUES('spotify',2,'sidspotifyb2','ti2');
+COMMIT;